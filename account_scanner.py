@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Shared Account-Number Scanner
+
+Every account-number pattern used by the extractors in function_app lives
+here as one compiled rule table, grouped by the extractor that consumes it:
+
+- regex:     extract_account_number_regex (masked, last digits, numeric, text)
+- labeled:   extract_labeled_account_number (labeled masked, labeled numeric, "ending in")
+- enhanced:  extract_account_from_ocr_enhanced (per-line masked, "ending", "account")
+- frequency: extract_all_account_numbers_with_frequency (masked, numeric, reference)
+
+The rules are compiled once at import. scan_account_candidates runs every
+rule over the lower-cased text once and returns each match as a candidate with
+its kind, priority and offset. Each rule keeps its findall semantics
+(non-overlapping matches, leftmost first), so an extractor that walks its
+candidates in (priority, offset) order sees exactly what its old
+pattern-by-pattern loop saw.
+
+Scans are cached per text, so every extractor that runs on the same statement
+text (and every repeated call) shares one scan.
+
+A single combined alternation was measured at about 4x the cost of the
+separate scans: the rules overlap, so it needs a lookahead per rule at every
+position and loses the regex engine's literal-prefix search.
+"""
+
+import bisect
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+SCAN_CACHE_SIZE = 8
+
+AccountCandidate = namedtuple("AccountCandidate", "value kind family rule priority offset line")
+
+# (family, kind, pattern) in priority order within each family. The candidate value is the
+# "value" group; \s is written [^\S\n] in the enhanced rules, which the extractor applies per line.
+RULES = [
+    # extract_account_number_regex - PRIORITY 1: masked
+    ("regex", "masked", r'account\s*#?\s*:?\s*(?P<value>[X*#]+\d{4,})(?:\s|$)'),
+    ("regex", "masked", r'account\s*number\s*:?\s*(?P<value>[X*#]+\d{4,})(?:\s|$)'),
+    ("regex", "masked", r'acct\s*#?\s*:?\s*(?P<value>[X*#]+\d{4,})(?:\s|$)'),
+    ("regex", "masked", r'a/c\s*#?\s*:?\s*(?P<value>[X*#]+\d{4,})(?:\s|$)'),
+    ("regex", "masked", r'account\s+(?P<value>[X*#]+\d{4,})(?:\s|$)'),
+    ("regex", "masked", r'(?:^|\s)(?P<value>[X*#]{4,}\d{4,})(?:\s|$)'),
+    ("regex", "masked", r'ending\s*in\s+(?P<value>[X*#]*\d{4,})(?:\s|$)'),
+    # PRIORITY 2: last digits ("last 8876", "ending in 8876", ...)
+    ("regex", "last_digits", r'last\s+(?P<value>\d{4,})(?:\s|$)'),
+    ("regex", "last_digits", r'ending\s+in\s+(?P<value>\d{4,})(?:\s|$)'),
+    ("regex", "last_digits", r'ends\s+with\s+(?P<value>\d{4,})(?:\s|$)'),
+    ("regex", "last_digits", r'last\s+four\s+digits?\s+(?P<value>\d{4,})(?:\s|$)'),
+    ("regex", "last_digits", r'final\s+(?P<value>\d{4,})(?:\s|$)'),
+    ("regex", "last_digits", r'ending\s+(?P<value>\d{4,})(?:\s|$)'),
+    ("regex", "last_digits", r'(?P<value>\d{4,})\s+digits?(?:\s|$)'),
+    ("regex", "last_digits", r'digits?\s+(?P<value>\d{4,})(?:\s|$)'),
+    # PRIORITY 3: numeric
+    ("regex", "numeric", r'account\s*#?\s*:?\s*(?P<value>\d{6,})(?:\s|$)'),
+    ("regex", "numeric", r'account\s*number\s*:?\s*(?P<value>\d{6,})(?:\s|$)'),
+    ("regex", "numeric", r'acct\s*#?\s*:?\s*(?P<value>\d{6,})(?:\s|$)'),
+    ("regex", "numeric", r'a/c\s*#?\s*:?\s*(?P<value>\d{6,})(?:\s|$)'),
+    ("regex", "numeric", r'account\s*#\s+(?P<value>\d{6,})(?:\s|$)'),
+    ("regex", "numeric", r'(?:^|\s)(?P<value>\d{6,12})(?:\s|$)'),
+    # PRIORITY 4: general text
+    ("regex", "text", r'account\s*#?\s*:?\s*(?P<value>[A-Za-z0-9\-\*X#]+)(?:\s|$)'),
+    ("regex", "text", r'account\s*number\s*:?\s*(?P<value>[A-Za-z0-9\-\*X#]+)(?:\s|$)'),
+    ("regex", "text", r'acct\s*#?\s*:?\s*(?P<value>[A-Za-z0-9\-\*X#]+)(?:\s|$)'),
+    ("regex", "text", r'a/c\s*#?\s*:?\s*(?P<value>[A-Za-z0-9\-\*X#]+)(?:\s|$)'),
+    ("regex", "text", r'account\s+(?P<value>[A-Za-z0-9\-\*X#]+)(?:\s|$)'),
+    ("regex", "text", r'(?:^|\s)(?P<value>[A-Za-z0-9\-\*X#]+)\s+account(?:\s|$)'),
+    ("regex", "text", r'for\s*account\s+(?P<value>[A-Za-z0-9\-\*X#]+)(?:\s|$)'),
+    ("regex", "text", r'account\s*#\s+(?P<value>[A-Za-z0-9\-\*X#]+)(?:\s|$)'),
+    ("regex", "text", r'a/c\s*#\s+(?P<value>[A-Za-z0-9\-\*X#]+)(?:\s|$)'),
+    ("regex", "text", r'acct\s*#\s+(?P<value>[A-Za-z0-9\-\*X#]+)(?:\s|$)'),
+    ("regex", "text", r'(?:^|\s)(?P<value>[A-Za-z0-9\-\*X#]{8,})(?:\s|$)'),
+
+    # extract_labeled_account_number - masked labels first
+    ("labeled", "masked", r'account\s*number\s*:?\s*(?P<value>[X*]+\d{4,})'),
+    ("labeled", "masked", r'account\s*#\s*:?\s*(?P<value>[X*]+\d{4,})'),
+    ("labeled", "masked", r'acct\s*#?\s*:?\s*(?P<value>[X*]+\d{4,})'),
+    ("labeled", "masked", r'a/c\s*#?\s*:?\s*(?P<value>[X*]+\d{4,})'),
+    ("labeled", "masked", r'account\s*no\s*\.?\s*:?\s*(?P<value>[X*]+\d{4,})'),
+    # numeric / hyphenated labels on the same line
+    ("labeled", "numeric", r'account\s*number\s*:?\s*(?P<value>[\d-]{4,})'),
+    ("labeled", "numeric", r'account\s*#\s*:?\s*(?P<value>[\d-]{4,})'),
+    ("labeled", "numeric", r'acct\s*#?\s*:?\s*(?P<value>[\d-]{4,})'),
+    ("labeled", "numeric", r'a/c\s*#?\s*:?\s*(?P<value>[\d-]{4,})'),
+    ("labeled", "numeric", r'account\s*no\s*\.?\s*:?\s*(?P<value>[\d-]{4,})'),
+    ("labeled", "numeric", r'account\s*id\s*:?\s*(?P<value>[\d-]{4,})'),
+    # partial accounts (last 4 digits)
+    ("labeled", "partial", r'ending\s+in\s+(?P<value>\d{4})'),
+    ("labeled", "partial", r'ending\s+(?P<value>\d{4})'),
+    ("labeled", "partial", r'ending\s+with\s*:?\s*(?P<value>\d{4})'),
+    ("labeled", "partial", r'ending\s+with\s*:?\s*\*+\s*(?P<value>\d{4})'),
+    ("labeled", "partial", r'account\s+ending\s+in\s+(?P<value>\d{4})'),
+    ("labeled", "partial", r'account\s+ending\s+(?P<value>\d{4})'),
+    ("labeled", "partial", r'account\s+ending\s+with\s*:?\s*(?P<value>\d{4})'),
+    ("labeled", "partial", r'account\s+ending\s+with\s*:?\s*\*+\s*(?P<value>\d{4})'),
+    ("labeled", "partial", r'acct\s+ending\s+in\s+(?P<value>\d{4})'),
+    ("labeled", "partial", r'acct\s+ending\s+(?P<value>\d{4})'),
+    ("labeled", "partial", r'a/c\s+ending\s+in\s+(?P<value>\d{4})'),
+    ("labeled", "partial", r'a/c\s+ending\s+(?P<value>\d{4})'),
+    ("labeled", "partial", r'last\s+4\s+digits?\s*:?\s*(?P<value>\d{4})'),
+    ("labeled", "partial", r'(?:\*{4,}|\#{4,}|x{4,})\s*(?P<value>\d{4})'),
+
+    # extract_account_from_ocr_enhanced - first match per line
+    ("enhanced", "masked", r'[X*]{3,}(?P<value>\d{2,})'),
+    ("enhanced", "ending", r'\bending[^\S\n]+(?:with[^\S\n]*:?[^\S\n]*\*+)?(?P<value>\d{2,})'),
+    ("enhanced", "account", r'\baccount[^\S\n]*(?:[:\-#]|[^\S\n])*(?P<value>[0-9X*\-]+)'),
+
+    # extract_all_account_numbers_with_frequency
+    ("frequency", "masked", r'\b(?P<value>[X*]+\d{4,})\b'),
+    ("frequency", "masked", r'\b(?P<value>\d{4,}[X*]+)\b'),
+    ("frequency", "masked", r'\b(?P<value>\d+[X*]+\d+)\b'),
+    ("frequency", "numeric", r'\b(?P<value>\d{6,12})\b'),
+    ("frequency", "reference", r'\b(?P<value>[A-Z]+#\d{4,})\b'),
+    ("frequency", "reference", r'\b(?P<value>[A-Z]{2,}\d{4,})\b'),
+]
+
+
+def _family_priorities():
+    priorities, counts = [], {}
+    for family, _, _ in RULES:
+        priorities.append(counts.get(family, 0))
+        counts[family] = counts.get(family, 0) + 1
+    return priorities
+
+
+RULE_PRIORITIES = _family_priorities()
+
+COMPILED_RULES = [re.compile(pattern, re.IGNORECASE) for _, _, pattern in RULES]
+
+
+class AccountScan:
+    """Every account-number candidate found in one text, grouped by consuming extractor"""
+
+    def __init__(self, candidates):
+        self.candidates = candidates
+        self._by_family = {}
+        for candidate in candidates:
+            self._by_family.setdefault(candidate.family, []).append(candidate)
+        for family_candidates in self._by_family.values():
+            family_candidates.sort(key=lambda candidate: (candidate.priority, candidate.offset))
+
+    def family(self, family, kinds=None):
+        """A family's candidates in the extractor's order: rule priority first, then text position"""
+        candidates = self._by_family.get(family, [])
+        if kinds is None:
+            return list(candidates)
+        return [candidate for candidate in candidates if candidate.kind in kinds]
+
+    def first_per_line(self, family):
+        """{line index: {kind: first candidate of that kind on the line}} for per-line extractors"""
+        lines = {}
+        for candidate in sorted(self._by_family.get(family, []), key=lambda candidate: candidate.offset):
+            lines.setdefault(candidate.line, {}).setdefault(candidate.kind, candidate)
+        return lines
+
+
+@lru_cache(maxsize=SCAN_CACHE_SIZE)
+def scan_account_candidates(text):
+    """
+    Every rule's finditer over the lower-cased text (lower-cased once), collected into
+    an AccountScan. Values are upper-cased (masking characters normalized to X/*/#),
+    offsets refer to the scanned text.
+    """
+    scanned = (text or "").lower()
+    line_starts = [0] + [match.end() for match in re.finditer("\n", scanned)]
+    candidates = []
+    for index, ((family, kind, _), pattern) in enumerate(zip(RULES, COMPILED_RULES)):
+        priority = RULE_PRIORITIES[index]
+        for match in pattern.finditer(scanned):
+            position = match.start()
+            candidates.append(AccountCandidate(
+                match.group("value").upper(), kind, family, index, priority, position,
+                bisect.bisect_right(line_starts, position) - 1
+            ))
+    return AccountScan(candidates)
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Adaptive (AIMD) Rate Controller for Azure OpenAI Calls
+
+Tunes the throttler's calls-per-minute from what the deployment actually
+accepts instead of a hardcoded plan tier:
+
+- Additive increase: every ADAPTIVE_SUCCESS_WINDOW successful calls raise the
+  rate by ADAPTIVE_INCREASE_STEP calls/minute
+- Multiplicative decrease: a 429, or a call much slower than the running
+  latency average for the same task, multiplies the rate by
+  ADAPTIVE_DECREASE_FACTOR
+- The rate never leaves [ADAPTIVE_MIN_CALLS_PER_MINUTE, ADAPTIVE_MAX_CALLS_PER_MINUTE]
+
+Latency is averaged per task: a 2,000-token BAI2 generation streamed to the end
+takes many times longer than a 50-token account answer, so only a rise against
+earlier calls of the same prompt is a sign of an overloaded deployment. Slow
+calls still feed the average, so a lasting change in a task's latency stops
+counting as a spike after a few calls.
+
+The spacing between calls scales with the rate, so a higher allowed rate is not
+capped by the plan's fixed MIN_DELAY_BETWEEN_CALLS. Decreases have a short
+cooldown so one burst of concurrent 429s counts as a single signal.
+"""
+
+import threading
+import time
+
+LATENCY_WARMUP_SAMPLES = 5
+LATENCY_EWMA_WEIGHT = 0.2
+DECREASE_COOLDOWN_SECONDS = 10
+
+
+class AIMDController:
+    """Thread-safe additive-increase / multiplicative-decrease rate controller"""
+
+    def __init__(self, initial_calls_per_minute, min_calls_per_minute, max_calls_per_minute,
+                 increase_step=2, decrease_factor=0.5, latency_spike_factor=3.0, success_window=10):
+        self.min_calls_per_minute = min_calls_per_minute
+        self.max_calls_per_minute = max(max_calls_per_minute, min_calls_per_minute)
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.latency_spike_factor = latency_spike_factor
+        self.success_window = max(1, success_window)
+        self._initial_rate = self._clamp(initial_calls_per_minute)
+        self._rate = self._initial_rate
+        self._lock = threading.Lock()
+        self._successes_since_change = 0
+        self._latency = {}  # task -> [EWMA seconds, samples]
+        self._last_decrease = 0
+        self.stats = {"increases": 0, "decreases_429": 0, "decreases_latency": 0, "successes": 0}
+        self.last_change = None
+
+    @classmethod
+    def from_config(cls, config):
+        """Controller bounded by the ThrottlingConfig ADAPTIVE_* settings"""
+        return cls(
+            initial_calls_per_minute=config.CALLS_PER_MINUTE,
+            min_calls_per_minute=getattr(config, "ADAPTIVE_MIN_CALLS_PER_MINUTE", 10),
+            max_calls_per_minute=getattr(config, "ADAPTIVE_MAX_CALLS_PER_MINUTE", 300),
+            increase_step=getattr(config, "ADAPTIVE_INCREASE_STEP", 2),
+            decrease_factor=getattr(config, "ADAPTIVE_DECREASE_FACTOR", 0.5),
+            latency_spike_factor=getattr(config, "ADAPTIVE_LATENCY_SPIKE_FACTOR", 3.0),
+            success_window=getattr(config, "ADAPTIVE_SUCCESS_WINDOW", 10)
+        )
+
+    def _clamp(self, rate):
+        return max(self.min_calls_per_minute, min(self.max_calls_per_minute, rate))
+
+    @property
+    def calls_per_minute(self):
+        return int(self._rate)
+
+    def min_delay_for(self, base_min_delay):
+        """The configured call spacing, scaled inversely with how far the rate has moved"""
+        return base_min_delay * self._initial_rate / self._rate
+
+    def _decrease(self, reason, now):
+        if now - self._last_decrease < DECREASE_COOLDOWN_SECONDS:
+            return False
+        previous = self._rate
+        self._rate = self._clamp(self._rate * self.decrease_factor)
+        self._last_decrease = now
+        self._successes_since_change = 0
+        self.last_change = {"at": now, "from": round(previous, 1), "to": round(self._rate, 1), "reason": reason}
+        return True
+
+    def record_success(self, latency_seconds, task="default"):
+        """A call of task succeeded; returns the change made ("increase", "decrease_latency") or None"""
+        now = time.time()
+        with self._lock:
+            self.stats["successes"] += 1
+            latency = self._latency.get(task)
+            if latency is None:
+                latency = self._latency[task] = [latency_seconds, 0]
+            average, samples = latency
+            spike = samples >= LATENCY_WARMUP_SAMPLES and latency_seconds > average * self.latency_spike_factor
+            latency[0] += LATENCY_EWMA_WEIGHT * (latency_seconds - average)
+            latency[1] += 1
+            if spike:
+                if self._decrease(f"{task} latency {latency_seconds:.1f}s vs {average:.1f}s average", now):
+                    self.stats["decreases_latency"] += 1
+                    return "decrease_latency"
+                return None
+
+            self._successes_since_change += 1
+            if self._successes_since_change >= self.success_window and self._rate < self.max_calls_per_minute:
+                previous = self._rate
+                self._rate = self._clamp(self._rate + self.increase_step)
+                self._successes_since_change = 0
+                self.stats["increases"] += 1
+                self.last_change = {"at": now, "from": round(previous, 1), "to": round(self._rate, 1), "reason": "success window"}
+                return "increase"
+        return None
+
+    def record_rate_limited(self):
+        """The server answered 429; returns True when the rate was lowered"""
+        with self._lock:
+            if self._decrease("HTTP 429", time.time()):
+                self.stats["decreases_429"] += 1
+                return True
+        return False
+
+    def get_state(self):
+        """JSON-serializable controller state for the /throttling endpoint"""
+        with self._lock:
+            return {
+                "calls_per_minute": self.calls_per_minute,
+                "initial_calls_per_minute": int(self._initial_rate),
+                "bounds": [self.min_calls_per_minute, self.max_calls_per_minute],
+                "increase_step": self.increase_step,
+                "decrease_factor": self.decrease_factor,
+                "latency_average_seconds": {task: round(average, 3) for task, (average, _) in sorted(self._latency.items())},
+                "last_change": self.last_change,
+                **self.stats
+            }
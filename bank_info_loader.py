@@ -223,6 +223,21 @@ def find_accounts_ending_with(last_digits, yaml_data):
     
     return matching_accounts
 
+def find_unique_wac_account(detected_account, bank_data):
+    """The one WAC operational account a detected account can refer to, or None when none or several match"""
+    detected_digits = extract_account_digits(detected_account)
+    if len(detected_digits) < 4 or not bank_data:
+        return None
+    
+    matches = {}
+    for bank_info in bank_data.get('wac_banks', []):
+        wac_account = str(bank_info['account_number']).strip()
+        # Exact (ignoring leading zeros) or the visible digits of a masked account
+        if wac_account.lstrip('0') == detected_digits.lstrip('0') or wac_account.endswith(detected_digits):
+            matches[wac_account] = bank_info
+    
+    return next(iter(matches.values())) if len(matches) == 1 else None
+
 def validate_account_match(detected_account, wac_account):
     """Validate if detected account matches WAC account number"""
     if not detected_account or not wac_account:
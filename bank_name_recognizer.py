@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+Dictionary-Driven Bank Name Recognizer
+
+Finds the issuing institution in a statement header by matching it against the
+bank names we already know, before function_app falls back to its word-boundary
+heuristics:
+
+- WAC Bank Information (the operational banks, via the loader function_app passes in)
+- US_Bank_List_Real.csv (or any CSV with a "Bank Name" column)
+- normalize_bank_name variants of every name ("Bank & Trust" and "Bank and Trust"
+  forms, legal suffixes dropped), so OCR'd headers match the forms fuzzy matching uses
+
+Names are compiled into a token trie (upper-case words, "&" read as "AND"). The
+header is tokenized once with string methods, a header line is walked only when
+one of its tokens begins a known name (a set of the trie's first words), and
+walks start only from those tokens, so the scan is linear in the header length
+times the longest name (a handful of tokens). The scan stops at the first line naming a
+bank; that line's longest match wins and the canonical dictionary name is
+returned, WAC spelling first.
+
+Names and variants made only of generic words ("FIRST NATIONAL BANK",
+"COMMUNITY") are not indexed - they would match or truncate almost any header,
+and the heuristics handle them better.
+
+The dictionary is built on first use and rebuilt once the WAC names are older
+than BANK_NAME_DICTIONARY_TTL_SECONDS.
+
+Settings (environment):
+    BANK_NAME_LIST_PATH                comma-separated bank-name CSVs (default: US_Bank_List_Real.csv
+                                       next to this module)
+    BANK_NAME_DICTIONARY_TTL_SECONDS   how long the WAC names are reused before reloading (default 3600)
+"""
+
+import csv
+import os
+import re
+import threading
+import time
+
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_LISTS = ("US_Bank_List_Real.csv",)
+DEFAULT_TTL_SECONDS = 3600
+HEADER_LINES = 15
+NAME_COLUMNS = ("bank name", "institution", "institution name", "name")
+
+TOKEN = re.compile(r"[A-Z0-9]+|&")
+# The same tokens without a regex scan: every other byte of the ASCII-encoded header becomes a space
+TOKEN_CHARACTERS = b"ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789&\n"
+TOKEN_SEPARATORS = bytes(byte if byte in TOKEN_CHARACTERS else ord(" ") for byte in range(256))
+GENERIC_TOKENS = {
+    "THE", "OF", "AND", "BANK", "BANKS", "BANKING", "TRUST", "COMPANY", "CO", "NATIONAL", "STATE",
+    "FEDERAL", "SAVINGS", "CREDIT", "UNION", "CU", "FCU", "COMMUNITY", "FIRST", "SECOND", "THIRD",
+    "CITIZENS", "PEOPLES", "FARMERS", "MERCHANTS", "SECURITY", "HOME", "AMERICAN", "UNITED",
+    "NA", "N", "A", "INC", "CORP", "FINANCIAL", "ASSOCIATION", "LOAN"
+}
+
+
+def name_tokens(text):
+    """Upper-case word tokens with "&" read as "AND" ("Bank & Trust, N.A." -> BANK AND TRUST N A)"""
+    return tuple("AND" if token == "&" else token for token in TOKEN.findall(str(text or "").upper()))
+
+
+def _is_distinctive(tokens):
+    return any(token not in GENERIC_TOKENS for token in tokens)
+
+
+class BankNameRecognizer:
+    """Longest known bank name in a statement header, from a token trie of known names"""
+
+    def __init__(self, list_paths, load_wac_names=None, normalize=None, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.list_paths = list(list_paths)
+        self.load_wac_names = load_wac_names
+        self.normalize = normalize
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._trie = None
+        self._roots = None
+        self._built_at = 0
+        self.stats = {"names": 0, "wac_names": 0, "builds": 0, "scans": 0, "hits": 0}
+
+    @classmethod
+    def from_environment(cls, load_wac_names=None, normalize=None):
+        configured = os.environ.get("BANK_NAME_LIST_PATH")
+        if configured:
+            paths = [p.strip() for p in configured.split(",") if p.strip()]
+        else:
+            paths = [os.path.join(MODULE_DIR, name) for name in DEFAULT_LISTS]
+        try:
+            ttl_seconds = float(os.environ.get("BANK_NAME_DICTIONARY_TTL_SECONDS", DEFAULT_TTL_SECONDS))
+        except ValueError:
+            ttl_seconds = DEFAULT_TTL_SECONDS
+        return cls(paths, load_wac_names=load_wac_names, normalize=normalize, ttl_seconds=ttl_seconds)
+
+    def _list_names(self):
+        names = []
+        for path in self.list_paths:
+            if not os.path.exists(path):
+                continue
+            with open(path, "r", encoding="utf-8-sig", newline="") as f:
+                reader = csv.DictReader(f)
+                columns = {column.strip().lower(): column for column in reader.fieldnames or []}
+                name_column = next((columns[c] for c in NAME_COLUMNS if c in columns), None)
+                if name_column:
+                    names.extend(row.get(name_column) for row in reader)
+        return names
+
+    def _insert(self, trie, tokens, display_name):
+        node = trie
+        for token in tokens:
+            node = node.setdefault(token, {})
+        node[None] = display_name
+
+    def _build(self):
+        wac_names = []
+        if self.load_wac_names:
+            try:
+                wac_names = [name for name in self.load_wac_names() or [] if name]
+            except Exception:
+                # The public bank list still gives the recognizer most institutions
+                wac_names = []
+        trie = {}
+        names = 0
+        # WAC names go last so their spelling wins for names both sources know
+        for name in self._list_names() + wac_names:
+            name = str(name or "").strip()
+            tokens = name_tokens(name)
+            if not tokens or not _is_distinctive(tokens):
+                continue
+            self._insert(trie, tokens, name)
+            names += 1
+            if self.normalize:
+                variant = name_tokens(self.normalize(name))
+                if variant and variant != tokens and _is_distinctive(variant):
+                    self._insert(trie, variant, name)
+        self.stats.update(names=names, wac_names=len(wac_names), builds=self.stats["builds"] + 1)
+        return trie
+
+    def _current_trie(self):
+        """(trie, set of the tokens that begin a known name)"""
+        with self._lock:
+            if self._trie is None or time.time() - self._built_at > self.ttl_seconds:
+                self._trie = self._build()
+                # "&" is how an "AND" token appears before it is read as "AND"
+                self._roots = frozenset(self._trie) | ({"&"} if "AND" in self._trie else set())
+                self._built_at = time.time()
+            return self._trie, self._roots
+
+    def recognize(self, text, header_lines=HEADER_LINES):
+        """The canonical name of the longest known bank named on the first header line that names one, or None"""
+        trie, roots = self._current_trie()
+        header = "\n".join(str(text or "").split("\n", header_lines)[:header_lines]).upper()
+        if "&" in header:
+            header = header.replace("&", " & ")
+        # The header is tokenized in one pass of string methods (TOKEN.findall per line, without
+        # its regex scan), and only lines with a token that begins a known name are walked
+        header = header.encode("ascii", "replace").translate(TOKEN_SEPARATORS).decode("ascii")
+        best = None
+        for line in header.split("\n"):
+            tokens = line.split()
+            if roots.isdisjoint(tokens):
+                continue
+            best_length = 0
+            for start, token in enumerate(tokens):
+                # Walks start only at tokens that begin a known name
+                node = trie.get("AND" if token == "&" else token)
+                if node is None:
+                    continue
+                end = start + 1
+                while True:
+                    if None in node and end - start > best_length:
+                        best, best_length = node[None], end - start
+                    if end == len(tokens):
+                        break
+                    node = node.get("AND" if tokens[end] == "&" else tokens[end])
+                    if node is None:
+                        break
+                    end += 1
+            if best:
+                break
+        with self._lock:
+            self.stats["scans"] += 1
+            if best:
+                self.stats["hits"] += 1
+        return best
+
+    def get_status(self):
+        """JSON-serializable dictionary statistics"""
+        with self._lock:
+            return {"built": self._trie is not None, "ttl_seconds": self.ttl_seconds, **self.stats}
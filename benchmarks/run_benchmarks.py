@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+CPU Microbenchmarks for the Text-Extraction and BAI2 Hot Paths
+
+Times the pure-Python stages of the pipeline against the stored OCR texts in
+benchmarks/corpus/ and compares the results with benchmarks/baseline.json.
+Exits with status 1 when any benchmark is slower than its baseline by more
+than the threshold, so it can gate changes to the regex patterns.
+
+Timings are stored as ratios to a fixed calibration loop (string and regex
+work like the benchmarks) timed right before each benchmark repeat, so the baseline carries over between hosts and a busy or
+frequency-scaled machine slows both sides alike.
+
+The baseline is the reference the changes are measured against, so record it
+from the code before a series of changes (for example a `git worktree` of the
+commit the series starts from), never from the changed tree: re-recording after
+each change absorbs every regression it was meant to catch. It is always
+recorded whole, which is why --update-baseline does not combine with --only.
+
+Usage:
+    python benchmarks/run_benchmarks.py                    # compare with baseline
+    python benchmarks/run_benchmarks.py --update-baseline  # save current timings as the baseline (reference code only)
+    python benchmarks/run_benchmarks.py --threshold 40     # allowed slowdown in percent (default 25)
+    python benchmarks/run_benchmarks.py --only bank_name   # run benchmarks whose name contains the text
+    python benchmarks/run_benchmarks.py --repeat 50        # timing repeats (the median ratio is kept, default 35)
+"""
+
+import contextlib
+import csv
+import gc
+import io
+import json
+import os
+import platform
+import re
+import statistics
+import sys
+import time
+from datetime import datetime
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+CORPUS_DIR = os.path.join(BENCHMARK_DIR, "corpus")
+BASELINE_PATH = os.path.join(BENCHMARK_DIR, "baseline.json")
+DEFAULT_THRESHOLD_PERCENT = 25.0
+DEFAULT_REPEAT = 35
+TARGET_SECONDS_PER_REPEAT = 0.05
+BASELINE_UNIT = "ratio to the calibration loop (median of paired repeats)"
+
+CALIBRATION_LINES = [
+    f"{month:02d}/{day:02d} ACH DEBIT VENDOR {day * 37:05d} ACCOUNT {month * 1000003 + day:010d} {day * 123.45:,.2f}"
+    for month in range(1, 13) for day in range(1, 29)
+]
+CALIBRATION_PATTERN = re.compile(r'(\d{1,2}/\d{1,2})\s+(.*?)\s+([\d,]+\.\d{2})$')
+
+sys.path.insert(0, REPO_DIR)
+
+
+def load_corpus():
+    """Read the OCR texts (*.txt) and BAI2 samples (*.bai) from the corpus folder"""
+    texts, bai2_files = {}, {}
+    for name in sorted(os.listdir(CORPUS_DIR)):
+        with open(os.path.join(CORPUS_DIR, name), "r", encoding="utf-8") as f:
+            content = f.read()
+        if name.endswith(".txt"):
+            texts[name] = content
+        elif name.endswith(".bai"):
+            bai2_files[name] = content
+    return texts, bai2_files
+
+
+def load_bank_names(limit=300):
+    """Bank names from US_Bank_List_Real.csv for the similarity benchmark"""
+    path = os.path.join(REPO_DIR, "US_Bank_List_Real.csv")
+    with open(path, "r", encoding="utf-8") as f:
+        return [row["Bank Name"] for _, row in zip(range(limit), csv.DictReader(f))]
+
+
+def build_benchmarks(texts, bai2_files):
+    """Return {name: zero-argument callable} for every hot path"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        import function_app
+        import bai2_fixer
+        from bank_info_loader import calculate_similarity
+
+    header_lines = []
+    for text in texts.values():
+        header_lines.extend(line for line in text.splitlines()[:40] if line.strip())
+    statement_data = [
+        ({"ocr_text_lines": text.splitlines()}, f"{os.path.splitext(name)[0]}.pdf")
+        for name, text in texts.items()
+    ]
+    detected_names = ["FIRST NATIONAL BANK OF TENNESSEE", "FCB BANKS", "CITIZENS BANK"]
+    bank_names = load_bank_names()
+
+    def over_texts(func):
+        return lambda: [func(text) for text in texts.values()]
+
+    def bai2_round_trip():
+        for raw in bai2_files.values():
+            file01, groups, _ = bai2_fixer.parse_bai2(raw)
+            bai2_fixer.rebuild_bai2(file01, groups)
+
+    return {
+        "extract_bank_name_from_text": over_texts(function_app.extract_bank_name_from_text),
+        "extract_complete_bank_name_from_line": lambda: [
+            function_app.extract_complete_bank_name_from_line(line) for line in header_lines
+        ],
+        "extract_labeled_account_number": over_texts(function_app.extract_labeled_account_number),
+        "extract_account_from_ocr_enhanced": over_texts(function_app.extract_account_from_ocr_enhanced),
+        "extract_all_account_numbers_with_frequency": over_texts(function_app.extract_all_account_numbers_with_frequency),
+        "parse_transactions_from_ocr": over_texts(function_app.parse_transactions_from_ocr),
+        "get_statement_date": lambda: [
+            function_app.get_statement_date(data, filename) for data, filename in statement_data
+        ],
+        "calculate_similarity": lambda: [
+            calculate_similarity(detected, candidate)
+            for detected in detected_names for candidate in bank_names
+        ],
+        "bai2_parse_and_rebuild": bai2_round_trip,
+    }
+
+
+def calibration_loop():
+    """Fixed pure-Python workload (splits, upper-casing, regex matches, dict updates)"""
+    counts = {}
+    for line in CALIBRATION_LINES:
+        match = CALIBRATION_PATTERN.match(line)
+        for word in match.group(2).upper().split():
+            counts[word] = counts.get(word, 0) + 1
+    return counts
+
+
+def _loop_count(func):
+    """Calls per repeat for ~TARGET_SECONDS_PER_REPEAT of work"""
+    start = time.perf_counter()
+    func()
+    single = max(time.perf_counter() - start, 1e-6)
+    return max(1, int(TARGET_SECONDS_PER_REPEAT / single))
+
+
+def _seconds_per_call(func, number):
+    start = time.perf_counter()
+    for _ in range(number):
+        func()
+    elapsed = (time.perf_counter() - start) / number
+    gc.collect()
+    return elapsed
+
+
+def time_benchmarks(benchmarks, repeat):
+    """
+    {name: (median seconds per call, calibration ratio)} for every benchmark. Each
+    repeat times the calibration loop right before the benchmark, and the ratio is
+    the median over the repeats of benchmark time / calibration time of the same
+    repeat: drift over the run (frequency scaling, a noisy neighbour) moves both
+    sides of a pair alike, and the median is not moved by the few repeats in which
+    only one side was disturbed. A best-of-repeats ratio hung on the single
+    luckiest time of each side and moved by up to 13% between runs of unchanged code.
+    """
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        # print_and_log output goes to devnull: a growing StringIO made the timings of
+        # the print-heavy benchmarks depend on its buffer size
+        with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(devnull):
+            calibration_number = _loop_count(calibration_loop)
+            numbers = {name: _loop_count(func) for name, func in benchmarks.items()}
+            seconds = {name: [] for name in benchmarks}
+            calibrations = {name: [] for name in benchmarks}
+            for _ in range(repeat):
+                for name, func in benchmarks.items():
+                    calibrations[name].append(_seconds_per_call(calibration_loop, calibration_number))
+                    seconds[name].append(_seconds_per_call(func, numbers[name]))
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return {
+        name: (
+            statistics.median(seconds[name]),
+            statistics.median(s / c for s, c in zip(seconds[name], calibrations[name]))
+        )
+        for name in benchmarks
+    }
+
+
+def parse_args(argv):
+    options = {
+        "update_baseline": False,
+        "threshold": DEFAULT_THRESHOLD_PERCENT,
+        "repeat": DEFAULT_REPEAT,
+        "only": None
+    }
+    args = list(argv)
+    while args:
+        arg = args.pop(0)
+        if arg in ("--help", "-h"):
+            print(__doc__)
+            sys.exit(0)
+        elif arg == "--update-baseline":
+            options["update_baseline"] = True
+        elif arg == "--threshold" and args:
+            options["threshold"] = float(args.pop(0))
+        elif arg == "--repeat" and args:
+            options["repeat"] = max(1, int(args.pop(0)))
+        elif arg == "--only" and args:
+            options["only"] = args.pop(0)
+        else:
+            print(f"❌ Unknown or incomplete option: {arg}")
+            print(__doc__)
+            sys.exit(2)
+    return options
+
+
+def main(argv=None):
+    options = parse_args(sys.argv[1:] if argv is None else argv)
+    if options["update_baseline"] and options["only"]:
+        print("❌ --update-baseline records every benchmark: run it without --only, on the code before your changes")
+        return 2
+    texts, bai2_files = load_corpus()
+    benchmarks = build_benchmarks(texts, bai2_files)
+    if options["only"]:
+        benchmarks = {name: func for name, func in benchmarks.items() if options["only"] in name}
+
+    baseline = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, "r", encoding="utf-8") as f:
+            stored = json.load(f)
+        # Absolute timings from an older baseline are not comparable with ratios
+        if stored.get("unit") == BASELINE_UNIT:
+            baseline = stored.get("benchmarks", {})
+
+    print(f"⏱️ Running {len(benchmarks)} benchmarks over {len(texts)} OCR texts and {len(bai2_files)} BAI2 files")
+
+    timings = time_benchmarks(benchmarks, options["repeat"])
+    print(f"{'Benchmark':<45} {'Current':>12} {'Ratio':>9} {'Baseline':>9} {'Change':>9}")
+    print("-" * 88)
+
+    results = {}
+    regressions = []
+    for name, (seconds, ratio) in timings.items():
+        results[name] = ratio
+        base = baseline.get(name)
+        if base:
+            change = (ratio - base) / base * 100
+            status = ""
+            if change > options["threshold"]:
+                regressions.append((name, change))
+                status = " ❌"
+            print(f"{name:<45} {seconds * 1000:>10.3f}ms {ratio:>9.3f} {base:>9.3f} {change:>+8.1f}%{status}")
+        else:
+            print(f"{name:<45} {seconds * 1000:>10.3f}ms {ratio:>9.3f} {'-':>9} {'new':>9}")
+
+    if options["update_baseline"]:
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump({
+                "updated": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "unit": BASELINE_UNIT,
+                "benchmarks": dict(sorted(results.items()))
+            }, f, indent=2)
+            f.write("\n")
+        print(f"✅ Baseline updated: {BASELINE_PATH}")
+        return 0
+
+    if regressions:
+        print("")
+        print(f"❌ {len(regressions)} benchmark(s) regressed more than {options['threshold']:.0f}%:")
+        for name, change in regressions:
+            print(f"   {name}: {change:+.1f}%")
+        return 1
+
+    print("")
+    print(f"✅ No regressions above {options['threshold']:.0f}%")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
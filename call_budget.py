@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Per-Document External-Call Budget
+
+Caps what a single statement may spend on Document Intelligence and Azure
+OpenAI so one unlucky document cannot hold the shared throttler through a
+chain of fallbacks:
+
+- calls: external requests (Document Intelligence analysis + OpenAI prompts,
+  each retry counted as another request)
+- tokens: estimated OpenAI tokens (prompt + answer characters / 4)
+- wall time: seconds since the document started processing
+
+The budget rides on the document's ProcessingTrace, so it follows the document
+into worker threads through use_trace. Once any limit is hit the budget stays
+exhausted and every further charge raises BudgetExceededError immediately;
+function_app turns that into an ERROR_BUDGET_EXCEEDED error file.
+
+The budget also remembers the answers already produced for the document, so a
+later fallback asking the same prompt gets the earlier answer without a call.
+
+Settings (environment):
+    DOCUMENT_MAX_EXTERNAL_CALLS   external calls per document (default 12)
+    DOCUMENT_MAX_OPENAI_TOKENS    estimated OpenAI tokens per document (default 200000)
+    DOCUMENT_MAX_SECONDS          wall time per document (default 540, under the 10 minute function timeout)
+"""
+
+import os
+import threading
+import time
+
+DEFAULT_MAX_CALLS = 12
+DEFAULT_MAX_TOKENS = 200000
+DEFAULT_MAX_SECONDS = 540
+CHARS_PER_TOKEN = 4
+
+
+class BudgetExceededError(Exception):
+    """A document used up its external-call budget"""
+
+
+def estimate_tokens(text):
+    """Rough token count for budget purposes (characters / 4)"""
+    return len(text or "") // CHARS_PER_TOKEN + 1
+
+
+def _env_number(name, default):
+    try:
+        return max(0, float(os.environ.get(name, default)))
+    except ValueError:
+        return default
+
+
+class DocumentBudget:
+    """Call, token and wall-time allowance for one document"""
+
+    def __init__(self, max_calls=DEFAULT_MAX_CALLS, max_tokens=DEFAULT_MAX_TOKENS, max_seconds=DEFAULT_MAX_SECONDS):
+        self.max_calls = max_calls
+        self.max_tokens = max_tokens
+        self.max_seconds = max_seconds
+        self.started_at = time.time()
+        self.calls = {}
+        self.tokens = 0
+        self.repeats_skipped = 0
+        self.exhausted = None
+        self._answers = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_environment(cls):
+        return cls(
+            max_calls=int(_env_number("DOCUMENT_MAX_EXTERNAL_CALLS", DEFAULT_MAX_CALLS)),
+            max_tokens=int(_env_number("DOCUMENT_MAX_OPENAI_TOKENS", DEFAULT_MAX_TOKENS)),
+            max_seconds=_env_number("DOCUMENT_MAX_SECONDS", DEFAULT_MAX_SECONDS)
+        )
+
+    @property
+    def total_calls(self):
+        return sum(self.calls.values())
+
+    @property
+    def elapsed_seconds(self):
+        return time.time() - self.started_at
+
+    def _exhaust(self, reason):
+        if self.exhausted is None:
+            self.exhausted = reason
+        raise BudgetExceededError(f"Document budget exceeded: {self.exhausted}")
+
+    def raise_if_exhausted(self):
+        if self.exhausted is not None:
+            raise BudgetExceededError(f"Document budget exceeded: {self.exhausted}")
+
+    def check_time(self, upcoming_wait=0):
+        """Raise when the document is out of time, or would be after waiting upcoming_wait seconds"""
+        with self._lock:
+            self.raise_if_exhausted()
+            if self.elapsed_seconds + upcoming_wait > self.max_seconds:
+                self._exhaust(f"{self.max_seconds:.0f}s wall-time limit "
+                              f"({self.elapsed_seconds:.0f}s used, {upcoming_wait:.0f}s wait pending)")
+
+    def charge(self, kind, tokens=0):
+        """Account for one external call about to be made; raises BudgetExceededError when over"""
+        self.check_time()
+        with self._lock:
+            if self.total_calls + 1 > self.max_calls:
+                self._exhaust(f"{self.max_calls} external-call limit ({self.describe_calls()})")
+            if self.tokens + tokens > self.max_tokens:
+                self._exhaust(f"{self.max_tokens:,} token limit ({self.tokens:,} used, {tokens:,} requested)")
+            self.calls[kind] = self.calls.get(kind, 0) + 1
+            self.tokens += tokens
+
+    def add_tokens(self, tokens):
+        """Account for answer tokens once a call has returned (does not raise)"""
+        with self._lock:
+            self.tokens += tokens
+
+    def recall(self, key):
+        """The answer already produced for this prompt in this document, or None"""
+        with self._lock:
+            answer = self._answers.get(key)
+            if answer is not None:
+                self.repeats_skipped += 1
+            return answer
+
+    def remember(self, key, answer):
+        with self._lock:
+            self._answers[key] = answer
+
+    def describe_calls(self):
+        return ", ".join(f"{kind} x{count}" for kind, count in sorted(self.calls.items())) or "none"
+
+    def to_dict(self):
+        """JSON-serializable usage summary"""
+        return {
+            "calls": dict(self.calls),
+            "max_calls": self.max_calls,
+            "estimated_tokens": self.tokens,
+            "max_tokens": self.max_tokens,
+            "elapsed_seconds": round(self.elapsed_seconds, 1),
+            "max_seconds": self.max_seconds,
+            "repeats_skipped": self.repeats_skipped,
+            "exhausted": self.exhausted
+        }
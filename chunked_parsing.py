@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""
+Chunked (Map-Reduce) Transaction Parsing
+
+Large statements are split into page- or section-aligned chunks that are
+parsed by separate OpenAI requests and merged afterwards, instead of being
+keyword-filtered and truncated into one oversized request.
+
+- split_statement_into_chunks: page/section-aligned chunks under a size budget;
+  every chunk carries the statement header so dates can be resolved
+- build_chunk_prompt: transactions-only prompt for one chunk
+- merge_chunk_results: combine chunk answers, de-duplicating by
+  (date, amount, description), and validate them against the statement totals
+
+function_app.send_to_openai_for_parsing makes the requests concurrently through
+openai_throttler, so the chunks stay inside the shared rate budget.
+
+Settings (environment):
+    PARSING_CHUNK_MAX_CHARS   size of one chunk (default 8000)
+    PARSING_CHUNK_WORKERS     concurrent chunk requests (default 3)
+"""
+
+import os
+import re
+from decimal import Decimal, InvalidOperation
+
+from prompt_context import page_start_indexes
+
+DEFAULT_CHUNK_MAX_CHARS = 8000
+DEFAULT_CHUNK_WORKERS = 3
+HEADER_CONTEXT_LINES = 8
+BALANCE_TOLERANCE = Decimal("0.01")
+
+SECTION_HEADING = re.compile(
+    r'^\s*(?:DEPOSITS?|CREDITS?|ADDITIONS|WITHDRAWALS?|DEBITS?|SUBTRACTIONS|CHECKS(?:\s+PAID)?|'
+    r'ELECTRONIC\s+\w+|OTHER\s+\w+|DAILY\s+(?:LEDGER\s+)?BALANCES?|SERVICE\s+CHARGES?|FEES)\b[^0-9$]*$',
+    re.IGNORECASE
+)
+
+
+def _env_int(name, default, minimum):
+    try:
+        return max(minimum, int(os.environ.get(name, default)))
+    except ValueError:
+        return default
+
+
+def chunk_max_chars():
+    return _env_int("PARSING_CHUNK_MAX_CHARS", DEFAULT_CHUNK_MAX_CHARS, 2000)
+
+
+def chunk_workers():
+    return _env_int("PARSING_CHUNK_WORKERS", DEFAULT_CHUNK_WORKERS, 1)
+
+
+def split_statement_into_chunks(text, max_chars=None):
+    """
+    Return a list of {"index", "header", "body", "first_line", "last_line"} chunks.
+    Chunks end at page starts or section headings where possible; a single page
+    or section larger than the budget is cut at a line boundary.
+    """
+    max_chars = max_chars or chunk_max_chars()
+    lines = text.split('\n')
+    header = '\n'.join(line for line in lines[:HEADER_CONTEXT_LINES] if line.strip())
+
+    boundaries = set(page_start_indexes(lines))
+    boundaries.update(i for i, line in enumerate(lines) if SECTION_HEADING.match(line))
+
+    chunks = []
+    start = 0
+    size = 0
+    last_boundary = None
+    for i, line in enumerate(lines):
+        if i > start and i in boundaries:
+            last_boundary = i
+        size += len(line) + 1
+        if size > max_chars and i > start:
+            # Prefer cutting at the last page/section boundary inside this chunk
+            cut = last_boundary if last_boundary and last_boundary > start else i
+            chunks.append((start, cut))
+            start = cut
+            size = sum(len(l) + 1 for l in lines[start:i + 1])
+            # A boundary already seen past the cut is still the place for the next one
+            if last_boundary is not None and last_boundary <= start:
+                last_boundary = None
+    if start < len(lines):
+        chunks.append((start, len(lines)))
+
+    return [
+        {
+            "index": n,
+            "header": header,
+            "body": '\n'.join(lines[first:last]),
+            "first_line": first + 1,
+            "last_line": last
+        }
+        for n, (first, last) in enumerate(chunks)
+        if any(line.strip() for line in lines[first:last])
+    ]
+
+
+def build_chunk_prompt(chunk, chunk_count):
+    """Prompt asking for the transactions in one chunk only"""
+    return f"""You are an expert bank statement parser. This is part {chunk['index'] + 1} of {chunk_count} of one statement
+(lines {chunk['first_line']}-{chunk['last_line']}). The other parts are parsed separately.
+
+RULES:
+- Extract ONLY the transactions that appear in the STATEMENT PART below - the header is context for dates
+- Every transaction exactly once; do not include running balances, totals or summary lines as transactions
+- Ignore scanned check images and deposit slips
+- amount is positive for deposits/credits and negative for withdrawals/debits/fees
+- Dates use YYYY-MM-DD; infer the year from the statement header
+- opening_balance / closing_balance only if this part shows the statement's beginning / ending balance, else null
+- statement_totals only if this part shows the statement's printed deposit/withdrawal totals, else null
+
+STATEMENT HEADER (context only):
+{chunk['header']}
+
+STATEMENT PART:
+{chunk['body']}
+
+Return ONLY valid JSON (NO markdown, NO explanations):
+{{
+    "account_number": "account number if shown in this part, else null",
+    "statement_period": {{"start_date": "YYYY-MM-DD or null", "end_date": "YYYY-MM-DD or null"}},
+    "opening_balance": {{"amount": number OR null, "date": "YYYY-MM-DD or null"}},
+    "closing_balance": {{"amount": number OR null, "date": "YYYY-MM-DD or null"}},
+    "statement_totals": {{"total_deposits": number OR null, "total_withdrawals": number OR null}},
+    "transactions": [
+        {{
+            "date": "YYYY-MM-DD",
+            "amount": number,
+            "description": "complete transaction description",
+            "type": "deposit|withdrawal|fee|interest|transfer|check|ach|other",
+            "balance_after": number OR null,
+            "reference_number": "reference or check number, else null"
+        }}
+    ]
+}}"""
+
+
+def _to_decimal(value):
+    if value is None or value == "":
+        return None
+    try:
+        return Decimal(str(value).replace(",", "").replace("$", ""))
+    except InvalidOperation:
+        return None
+
+
+def transaction_key(txn):
+    """De-duplication key: (date, amount in cents, normalized description)"""
+    amount = _to_decimal(txn.get("amount"))
+    cents = int((amount * 100).to_integral_value()) if amount is not None else None
+    description = " ".join(str(txn.get("description") or "").upper().split())
+    return (txn.get("date"), cents, description)
+
+
+def _first(values):
+    return next((v for v in values if v not in (None, "")), None)
+
+
+def merge_chunk_results(chunk_results):
+    """
+    Combine chunk answers (in chunk order; None for failed chunks) into one result
+    shaped like a single send_to_openai_for_parsing response.
+
+    A key seen in several chunks comes from the shared header or a boundary repeat,
+    so each (date, amount, description) is kept as many times as the chunk that
+    listed it most often - repeated identical transactions inside one chunk survive.
+    """
+    results = [r for r in chunk_results if isinstance(r, dict)]
+    per_key_counts = {}
+    first_seen = {}
+    order = []
+    for result in results:
+        counts = {}
+        for txn in result.get("transactions") or []:
+            if not isinstance(txn, dict) or _to_decimal(txn.get("amount")) is None:
+                continue
+            key = transaction_key(txn)
+            counts[key] = counts.get(key, 0) + 1
+            if key not in first_seen:
+                first_seen[key] = txn
+                order.append(key)
+        for key, count in counts.items():
+            per_key_counts[key] = max(per_key_counts.get(key, 0), count)
+
+    transactions = []
+    total_listed = sum(len(r.get("transactions") or []) for r in results)
+    for key in order:
+        transactions.extend(dict(first_seen[key]) for _ in range(per_key_counts[key]))
+    duplicates_removed = max(0, total_listed - len(transactions))
+
+    opening = _first((r.get("opening_balance") or {}).get("amount") for r in results)
+    closing = _first((r.get("closing_balance") or {}).get("amount") for r in reversed(results))
+    periods = [r.get("statement_period") or {} for r in results]
+    deposits = [t for t in transactions if _to_decimal(t["amount"]) > 0]
+    withdrawals = [t for t in transactions if _to_decimal(t["amount"]) < 0]
+    total_deposits = sum((_to_decimal(t["amount"]) for t in deposits), Decimal("0"))
+    total_withdrawals = sum((_to_decimal(t["amount"]) for t in withdrawals), Decimal("0"))
+
+    merged = {
+        "account_number": _first(r.get("account_number") for r in results),
+        "statement_period": {
+            "start_date": _first(p.get("start_date") for p in periods),
+            "end_date": _first(p.get("end_date") for p in reversed(periods))
+        },
+        "opening_balance": {"amount": opening, "date": None},
+        "closing_balance": {"amount": closing, "date": None},
+        "transactions": transactions,
+        "summary": {
+            "total_deposits": float(total_deposits),
+            "total_withdrawals": float(total_withdrawals),
+            "transaction_count": len(transactions),
+            "deposit_count": len(deposits),
+            "withdrawal_count": len(withdrawals)
+        }
+    }
+
+    printed = [r.get("statement_totals") or {} for r in results]
+    merged["chunk_validation"] = validate_merged(
+        merged,
+        _to_decimal(_first(p.get("total_deposits") for p in printed)),
+        _to_decimal(_first(p.get("total_withdrawals") for p in printed)),
+        chunks=len(chunk_results),
+        failed_chunks=len(chunk_results) - len(results),
+        duplicates_removed=duplicates_removed
+    )
+    return merged
+
+
+def validate_merged(merged, printed_deposits, printed_withdrawals, **details):
+    """
+    Check the merged transactions against the balances and the statement's printed totals.
+    A merge with failed chunks is missing their transactions, so it is never valid.
+    """
+    summary = merged["summary"]
+    checks = {}
+    opening = _to_decimal(merged["opening_balance"]["amount"])
+    closing = _to_decimal(merged["closing_balance"]["amount"])
+    deposits = Decimal(str(summary["total_deposits"]))
+    withdrawals = Decimal(str(summary["total_withdrawals"]))
+    if opening is not None and closing is not None:
+        difference = opening + deposits + withdrawals - closing
+        checks["balance_difference"] = float(difference)
+        checks["balances_reconcile"] = abs(difference) <= BALANCE_TOLERANCE
+    if printed_deposits is not None:
+        checks["deposits_match_statement"] = abs(deposits - abs(printed_deposits)) <= BALANCE_TOLERANCE
+    if printed_withdrawals is not None:
+        checks["withdrawals_match_statement"] = abs(abs(withdrawals) - abs(printed_withdrawals)) <= BALANCE_TOLERANCE
+    details.update(checks)
+    details["valid"] = all(v for k, v in checks.items() if isinstance(v, bool)) if checks else None
+    if details.get("failed_chunks"):
+        details["valid"] = False
+    return details
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+Consolidated Statement Extraction
+
+One JSON-schema-constrained Azure OpenAI call that returns everything the
+pipeline otherwise asks the model for separately: account number, bank name,
+statement period, opening/closing balances and the transaction list.
+
+function_app makes the call (through openai_throttler and the LLM cache) when
+CONSOLIDATED_EXTRACTION is enabled and stores the normalized result in
+parsed_data["consolidated_extraction"]. Account lookup, statement dating and
+BAI2 generation then read from that one result, and the BAI2 file is written
+deterministically by build_bai2_from_consolidated instead of by a second call.
+"""
+
+import json
+import re
+import unicodedata
+from datetime import datetime
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+from transaction_store import KINDS, TransactionStore
+
+BAI2_CREDIT_CODE = "301"
+BAI2_DEBIT_CODE = "451"
+BAI2_FEE_CODE = "475"
+
+TRANSACTION_KINDS = {"credit": BAI2_CREDIT_CODE, "debit": BAI2_DEBIT_CODE, "fee": BAI2_FEE_CODE}
+
+# Strict structured outputs require every property to be listed as required and
+# additionalProperties false - optional values are expressed as nullable types.
+STATEMENT_SCHEMA = {
+    "type": "object",
+    "additionalProperties": False,
+    "required": [
+        "account_number", "bank_name", "statement_start_date", "statement_end_date",
+        "opening_balance", "closing_balance", "transactions"
+    ],
+    "properties": {
+        "account_number": {
+            "type": ["string", "null"],
+            "description": "The statement's own account number exactly as printed, keeping masking characters such as ****1234"
+        },
+        "bank_name": {"type": ["string", "null"], "description": "Name of the bank that issued the statement"},
+        "statement_start_date": {"type": ["string", "null"], "description": "First day of the statement period, YYYY-MM-DD"},
+        "statement_end_date": {"type": ["string", "null"], "description": "Last day of the statement period, YYYY-MM-DD"},
+        "opening_balance": {"type": ["number", "null"], "description": "Beginning balance in dollars"},
+        "closing_balance": {"type": ["number", "null"], "description": "Ending balance in dollars"},
+        "transactions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "additionalProperties": False,
+                "required": ["date", "description", "amount", "kind"],
+                "properties": {
+                    "date": {"type": ["string", "null"], "description": "Posting date, YYYY-MM-DD"},
+                    "description": {"type": "string"},
+                    "amount": {"type": "number", "description": "Positive amount in dollars"},
+                    "kind": {"type": "string", "enum": sorted(TRANSACTION_KINDS)}
+                }
+            }
+        }
+    }
+}
+
+RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "bank_statement", "strict": True, "schema": STATEMENT_SCHEMA}
+}
+
+SYSTEM_PROMPT = (
+    "You are a precise bank statement analyzer. Extract the requested fields from the "
+    "statement text. Never invent values - use null when a field is not on the statement."
+)
+
+
+def build_consolidated_prompt(ocr_text):
+    """User prompt for the consolidated extraction call"""
+    return f"""Extract the statement details from this bank statement OCR text.
+
+RULES:
+- account_number is the statement holder's account, not a routing number, phone number or check number
+- Include every individual transaction once; skip headers, running balances and summary totals
+- kind is "credit" for deposits/additions, "fee" for bank service charges, otherwise "debit"
+- amount is always positive; kind carries the direction
+- Dates use YYYY-MM-DD; infer the year from the statement period when a line only shows MM/DD
+
+STATEMENT TEXT:
+{ocr_text}"""
+
+
+def amount_to_cents(value):
+    """Dollar amount (number or string) to integer cents, or None"""
+    if value is None:
+        return None
+    try:
+        return int((Decimal(str(value).replace(",", "").replace("$", "")) * 100).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+    except (InvalidOperation, ValueError):
+        return None
+
+
+def _iso_date(value):
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value.strip(), "%Y-%m-%d").strftime("%Y-%m-%d")
+    except ValueError:
+        return None
+
+
+def parse_consolidated_response(content):
+    """
+    Validate and normalize the model's JSON into the shape consumers use.
+    Raises ValueError when the response is not usable.
+    """
+    try:
+        raw = json.loads(content)
+    except (TypeError, json.JSONDecodeError) as e:
+        raise ValueError(f"Consolidated extraction returned invalid JSON: {e}")
+    if not isinstance(raw, dict) or not isinstance(raw.get("transactions"), list):
+        raise ValueError("Consolidated extraction response is missing the transactions list")
+
+    transactions = []
+    for item in raw["transactions"]:
+        if not isinstance(item, dict):
+            continue
+        cents = amount_to_cents(item.get("amount"))
+        kind = item.get("kind")
+        if cents is None or kind not in TRANSACTION_KINDS:
+            continue
+        transactions.append({
+            "date": _iso_date(item.get("date")),
+            "description": str(item.get("description") or "").strip(),
+            "amount_cents": abs(cents),
+            "kind": kind
+        })
+
+    account_number = (raw.get("account_number") or "").strip() or None
+    bank_name = (raw.get("bank_name") or "").strip() or None
+    result = {
+        "account_number": account_number,
+        "bank_name": bank_name,
+        "statement_start_date": _iso_date(raw.get("statement_start_date")),
+        "statement_end_date": _iso_date(raw.get("statement_end_date")),
+        "opening_balance_cents": amount_to_cents(raw.get("opening_balance")),
+        "closing_balance_cents": amount_to_cents(raw.get("closing_balance")),
+        "transactions": transactions
+    }
+    result["reconciliation"] = reconcile_consolidated(result)
+    return result
+
+
+def reconcile_consolidated(extraction):
+    """Check opening + credits - debits - fees against the closing balance"""
+    credits, debits = TransactionStore.of(extraction["transactions"]).totals()
+    opening = extraction.get("opening_balance_cents")
+    closing = extraction.get("closing_balance_cents")
+    summary = {"total_credits_cents": credits, "total_debits_cents": debits, "balanced": None, "difference_cents": None}
+    if opening is not None and closing is not None:
+        difference = opening + credits - debits - closing
+        summary["difference_cents"] = difference
+        summary["balanced"] = difference == 0
+    return summary
+
+
+def sanitize_bai2_description(text, limit=80):
+    """Commas delimit BAI2 fields and "/" ends a record, so neither may appear in text"""
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+    text = re.sub(r"[\x00-\x1f]", " ", text).replace(",", " ").replace("/", "-")
+    text = " ".join(text.split())
+    if len(text) > limit:
+        text = text[:limit].rsplit(" ", 1)[0] or text[:limit]
+    return text
+
+
+def build_bai2_from_consolidated(extraction, account_number, originator_id, file_date, file_time):
+    """
+    BAI2 file in the same record layout the generation prompt asks the model for.
+    Raises ValueError when the closing balance is unknown - the 49/98/99 records carry it,
+    and a made-up 0 would pass every later check.
+    """
+    closing = extraction.get("closing_balance_cents")
+    if closing is None:
+        raise ValueError("closing balance unknown - cannot write the 49/98/99 records")
+    store = TransactionStore.of(extraction["transactions"])
+    records = [
+        f"01,{originator_id},WORKDAY,{file_date},{file_time},1,,,2/",
+        f"02,WORKDAY,{originator_id},1,{file_date},,USD,2/",
+        f"03,{account_number},USD,010,,,Z/",
+    ]
+    # Each distinct description is sanitized once, however many transactions share it
+    descriptions = [sanitize_bai2_description(text) for text in store.descriptions]
+    for sequence, (cents, code, index) in enumerate(zip(store.cents, store.kinds, store.description_ids), start=1):
+        records.append(f"16,{TRANSACTION_KINDS[KINDS[code]]},{cents},Z,{sequence:05d},,{descriptions[index]}/")
+    count = len(store)
+    records.append(f"49,{closing},{count}/")
+    records.append(f"98,{closing},1,{count + 3}/")
+    records.append(f"99,{closing},1,{count + 3}/")
+    return "\n".join(records)
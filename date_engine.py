@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+Statement Date Engine
+
+Date normalization for statement headers and transaction lines, producing the
+YYMMDD values BAI2 uses:
+
+- parse_date / date_format_of: a memoized strptime over an ordered tuple of
+  formats (the statement end-date formats Document Intelligence returns)
+- find_statement_period: the "STATEMENT PERIOD 07/01/25 THROUGH 07/31/25"
+  patterns, then "Last statement: May 31, 2025 This statement: June 30, 2025"
+  (the 841 layout) and "Statement Ending 07/31/2025", compiled once and matched case-insensitively on the
+  original text - each searched only when the lower-cased text holds its keyword; period_from_dates builds one from Document Intelligence's
+  StatementStartDate/StatementEndDate
+- bai2_transaction_dates: a whole transaction list in one batch. Month/day-only
+  dates ("07-15" in the OCR layout) get their year from the statement period,
+  so a December-January statement dates December lines in the earlier year.
+
+Every distinct date string is parsed once per process (lru_cache), and a batch
+resolves each distinct value once however many transactions share it.
+"""
+
+import re
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+PARSE_CACHE_SIZE = 4096
+
+# Statement end date formats seen from Document Intelligence, most common first
+STATEMENT_END_DATE_FORMATS = ("%m/%d/%Y", "%m/%d/%y", "%Y-%m-%d", "%m-%d-%Y")
+
+# "STATEMENT PERIOD 07/01/25 THROUGH 07/31/25", "TOTAL DAYS IN STATEMENT PERIOD ...", "FROM ... TO ...",
+# each with a word it cannot match without
+PERIOD_PATTERNS = [(keyword, re.compile(pattern, re.IGNORECASE)) for keyword, pattern in (
+    ("through", r'statement\s+period\s+(\d{1,2}/\d{1,2}/\d{2,4})\s+through\s+(\d{1,2}/\d{1,2}/\d{2,4})'),
+    ("through", r'period\s+(\d{1,2}/\d{1,2}/\d{2,4})\s+through\s+(\d{1,2}/\d{1,2}/\d{2,4})'),
+    ("from", r'from\s+(\d{1,2}/\d{1,2}/\d{2,4})\s+to\s+(\d{1,2}/\d{1,2}/\d{2,4})'),
+    ("through", r'(\d{1,2}/\d{1,2}/\d{2,4})\s+through\s+(\d{1,2}/\d{1,2}/\d{2,4})')
+)]
+
+# "Last statement: May 31, 2025 This statement: June 30, 2025" - the period starts the day after the last statement
+NAMED_DATE = r'([A-Z][a-z]{2,8}\.?\s+\d{1,2},\s*\d{4})'
+NAMED_DATE_FORMATS = ("%B %d, %Y", "%b %d, %Y", "%b. %d, %Y")
+LAST_THIS_STATEMENT = re.compile(rf'last\s+statement:?\s+{NAMED_DATE}\s+this\s+statement:?\s+{NAMED_DATE}', re.IGNORECASE)
+THIS_STATEMENT = re.compile(rf'this\s+statement:?\s+{NAMED_DATE}', re.IGNORECASE)
+# "Statement Ending 07/31/2025" - end date only
+STATEMENT_ENDING = re.compile(r'statement\s+(?:ending|end\s+date|closing\s+date):?\s+(\d{1,2}/\d{1,2}/\d{2,4})', re.IGNORECASE)
+
+# Transaction dates: YYYY-MM-DD, or MM-DD / MM/DD with an optional 2- or 4-digit year
+ISO_DATE = re.compile(r'^(\d{4})-(\d{1,2})-(\d{1,2})$')
+MONTH_DAY_DATE = re.compile(r'^(\d{1,2})[/\-.](\d{1,2})(?:[/\-.](\d{2}|\d{4}))?$')
+
+# How far outside the statement period a transaction date may fall (late postings, prior-day items)
+PERIOD_SLACK = timedelta(days=31)
+
+StatementPeriod = namedtuple("StatementPeriod", "start end start_text end_text")
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_date(value, formats=STATEMENT_END_DATE_FORMATS):
+    """The date for the first format value parses with, or None"""
+    if not isinstance(value, str):
+        return None
+    value = value.strip()
+    for date_format in formats:
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            continue
+    return None
+
+
+def date_format_of(value, formats=STATEMENT_END_DATE_FORMATS):
+    """The first of formats that value parses with, or None"""
+    return next((date_format for date_format in formats if parse_date(value, (date_format,))), None)
+
+
+def to_bai2(value, formats=STATEMENT_END_DATE_FORMATS):
+    """YYMMDD for a date string (or date), or None"""
+    parsed = value if isinstance(value, date) else parse_date(value, tuple(formats))
+    return parsed.strftime("%y%m%d") if parsed else None
+
+
+def _slash_date(value):
+    # 2-digit years ("07/31/25") and 4-digit years ("07/31/2025")
+    return parse_date(value, ("%m/%d/%y",) if len(value.split('/')[-1]) == 2 else ("%m/%d/%Y",))
+
+
+def find_statement_period(text):
+    """The first statement period in the text with a readable end date, as a StatementPeriod, or None"""
+    text = text or ""
+    # A case-insensitive search costs several times a lower-casing of the whole text,
+    # so a pattern is only searched for when its keyword is in the text
+    lowered = text.lower()
+    for keyword, pattern in PERIOD_PATTERNS:
+        match = pattern.search(text) if keyword in lowered else None
+        if match:
+            start_text, end_text = match.groups()
+            end = _slash_date(end_text)
+            # An unreadable end date ("13/45/25") falls through to the next pattern
+            if end:
+                return StatementPeriod(_slash_date(start_text), end, start_text, end_text)
+    match = LAST_THIS_STATEMENT.search(text) if "last" in lowered else None
+    if match:
+        last_text, end_text = match.groups()
+        last, end = _named_date(last_text), _named_date(end_text)
+        if end:
+            start = last + timedelta(days=1) if last else None
+            return StatementPeriod(start, end, start.strftime("%m/%d/%Y") if start else None, end_text)
+    match = THIS_STATEMENT.search(text) if "this" in lowered else None
+    if match and _named_date(match.group(1)):
+        return StatementPeriod(None, _named_date(match.group(1)), None, match.group(1))
+    match = STATEMENT_ENDING.search(text) if "statement" in lowered else None
+    if match and _slash_date(match.group(1)):
+        return StatementPeriod(None, _slash_date(match.group(1)), None, match.group(1))
+    return None
+
+
+def _named_date(value):
+    # "June 30, 2025", "Jun 30, 2025", "Jun. 30,2025"
+    return parse_date(" ".join(value.replace(",", ", ").split()), NAMED_DATE_FORMATS)
+
+
+def period_from_dates(start_text, end_text, formats=STATEMENT_END_DATE_FORMATS + NAMED_DATE_FORMATS):
+    """A StatementPeriod from separate start/end date strings (Document Intelligence fields), or None without a readable end"""
+    end = parse_date(end_text, tuple(formats)) if end_text else None
+    if not end:
+        return None
+    start = parse_date(start_text, tuple(formats)) if start_text else None
+    return StatementPeriod(start, end, start_text, end_text)
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _date_parts(value):
+    """(year or None, month, day) for a transaction date string, or None"""
+    value = value.strip()
+    match = ISO_DATE.match(value)
+    if match:
+        year, month, day = (int(part) for part in match.groups())
+        return year, month, day
+    match = MONTH_DAY_DATE.match(value)
+    if not match:
+        return None
+    month, day, year = match.groups()
+    if year and len(year) == 2:
+        year = 2000 + int(year)
+    return (int(year) if year else None), int(month), int(day)
+
+
+def infer_year(month, day, period):
+    """The date for month/day that falls in (or nearest to) the statement period, or None"""
+    end = period.end
+    start = period.start or end
+    candidates = []
+    for year in (end.year, end.year - 1, end.year + 1):
+        try:
+            candidates.append(date(year, month, day))
+        except ValueError:
+            continue
+    if not candidates:
+        return None
+
+    def distance(candidate):
+        if start <= candidate <= end:
+            return timedelta(0)
+        return start - candidate if candidate < start else candidate - end
+
+    best = min(candidates, key=distance)
+    return best if distance(best) <= PERIOD_SLACK else None
+
+
+def bai2_transaction_dates(values, period=None):
+    """
+    YYMMDD (or None) for each transaction date string, in order. Month/day-only
+    dates need a statement period to get a year.
+    """
+    has_period = period is not None and period.end is not None
+    resolved = {}
+    results = []
+    for value in values:
+        if value not in resolved:
+            parts = _date_parts(value) if isinstance(value, str) else None
+            parsed = None
+            if parts:
+                year, month, day = parts
+                if year:
+                    try:
+                        parsed = date(year, month, day)
+                    except ValueError:
+                        parsed = None
+                elif has_period:
+                    parsed = infer_year(month, day, period)
+            resolved[value] = parsed.strftime("%y%m%d") if parsed else None
+        results.append(resolved[value])
+    return results
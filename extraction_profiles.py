@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+Per-Bank Extraction Profiles
+
+Banks we see every month print the account number and statement dates in the
+same place every time. After a statement converts successfully (its account
+verified against WAC), function_app records a profile for the bank:
+
+- account_extractor: the cascade step that found the account number
+  (labeled, enhanced, document_intelligence, di_field, openai)
+- account_label / account_line: the text in front of the account number (or
+  the line above it) and the line it was found on
+- account_mask: the masking prefix the extractor put on the number ("XXXXXX", "***")
+- date_format: the format the statement end date was parsed with
+
+On the next statement from that bank, get_account_number tries the profile
+first: a regex-only lookup of the profiled label near the profiled line, then
+the profiled extractor. The WAC lookup still verifies the account; a profiled
+account WAC rejects sends the statement back through the full cascade.
+
+Profiles are JSON blobs in the bank-reconciliation container under
+extraction-profiles/, one per normalized bank name, with an in-process copy
+(lookups for banks without a profile are remembered too).
+
+Settings (environment):
+    EXTRACTION_PROFILES_ENABLED       true/false (default true)
+    EXTRACTION_PROFILE_CACHE_SECONDS  how long profiles are reused before rereading the blob (default 900)
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime
+
+PROFILE_CONTAINER = "bank-reconciliation"
+PROFILE_PREFIX = "extraction-profiles/"
+DEFAULT_CACHE_SECONDS = 900
+PROFILE_LINE_WINDOW = 5
+MAX_LABEL_WORDS = 4
+
+ACCOUNT_TOKEN = re.compile(r'(?:[X*#]+\s?)?\d[\d\-]*', re.IGNORECASE)
+
+
+def profile_key(bank_name):
+    """Blob-safe key for a bank name ("Wells Fargo Bank, N.A." -> WELLS-FARGO-BANK-N-A)"""
+    return re.sub(r'[^A-Z0-9]+', '-', str(bank_name or "").upper()).strip('-')
+
+
+def _visible_digits(account):
+    return re.sub(r'[^0-9]', '', str(account or ""))
+
+
+def mask_prefix(account):
+    """Leading masking characters of an account number ("XXXXXX2101" -> "XXXXXX")"""
+    return re.match(r'[X*#]*', str(account or "").upper()).group(0)
+
+
+def locate_account(lines, account):
+    """
+    (line index, label, label_on_previous_line) for the first line showing the account's
+    visible digits, or None. The label is the last few words in front of the number, or
+    the nearest non-empty line above when the number starts its line.
+    """
+    digits = _visible_digits(account)
+    if len(digits) < 2:
+        return None
+    for index, line in enumerate(lines):
+        for match in ACCOUNT_TOKEN.finditer(line):
+            if not _visible_digits(match.group(0)).endswith(digits):
+                continue
+            before = line[:match.start()].strip(" \t:#-")
+            if before:
+                return index, " ".join(before.split()[-MAX_LABEL_WORDS:]), False
+            for previous in range(index - 1, -1, -1):
+                if lines[previous].strip():
+                    return index, " ".join(lines[previous].split()[-MAX_LABEL_WORDS:]), True
+            return None
+    return None
+
+
+def account_from_profile(lines, profile):
+    """Regex-only account lookup at the profiled label, searching near the profiled line first"""
+    label = (profile.get("account_label") or "").lower()
+    if not label:
+        return None
+    line_number = profile.get("account_line") or 0
+    nearby = range(max(0, line_number - PROFILE_LINE_WINDOW), min(len(lines), line_number + PROFILE_LINE_WINDOW + 1))
+    order = list(nearby) + [index for index in range(len(lines)) if index not in nearby]
+    for index in order:
+        line = lines[index]
+        position = line.lower().find(label)
+        if position < 0:
+            continue
+        if profile.get("label_on_previous_line"):
+            following = lines[index + 1] if index + 1 < len(lines) else ""
+            match = ACCOUNT_TOKEN.match(following.strip())
+        else:
+            match = ACCOUNT_TOKEN.search(line, position + len(label))
+        if match and len(_visible_digits(match.group(0))) >= 2:
+            account = match.group(0).replace(" ", "").upper()
+            # Format the number the way the profiled extractor did (e.g. XXXXXX0327 for "ending in 0327")
+            if not mask_prefix(account):
+                account = (profile.get("account_mask") or "") + account
+            return account
+    return None
+
+
+class ExtractionProfileStore:
+    """Per-bank extraction profiles in blob storage with a short-lived in-process copy"""
+
+    def __init__(self, blob_service_factory=None, enabled=True, cache_seconds=DEFAULT_CACHE_SECONDS):
+        self.enabled = enabled
+        self.cache_seconds = cache_seconds
+        self._blob_service_factory = blob_service_factory
+        self._blob_service = None
+        self._blob_disabled_reason = None
+        self._profiles = {}
+        self._lock = threading.Lock()
+        self.stats = {"lookups": 0, "profiles_found": 0, "recorded": 0, "fast_path_hits": 0,
+                      "fast_path_rejected": 0, "blob_errors": 0}
+
+    @classmethod
+    def from_environment(cls, blob_service_factory=None):
+        try:
+            cache_seconds = float(os.environ.get("EXTRACTION_PROFILE_CACHE_SECONDS", DEFAULT_CACHE_SECONDS))
+        except ValueError:
+            cache_seconds = DEFAULT_CACHE_SECONDS
+        enabled = os.environ.get("EXTRACTION_PROFILES_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on")
+        return cls(blob_service_factory=blob_service_factory, enabled=enabled, cache_seconds=cache_seconds)
+
+    def count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def _blob_client(self, key):
+        if not self._blob_service_factory or self._blob_disabled_reason:
+            return None
+        try:
+            # One BlobServiceClient for the life of the store
+            if self._blob_service is None:
+                with self._lock:
+                    if self._blob_service is None:
+                        self._blob_service = self._blob_service_factory()
+            return self._blob_service.get_blob_client(container=PROFILE_CONTAINER, blob=f"{PROFILE_PREFIX}{key}.json")
+        except Exception as e:
+            # No storage configured (e.g. local scripts) - keep profiles in memory only
+            self._blob_disabled_reason = str(e)
+            return None
+
+    def get(self, bank_name):
+        """The bank's profile dict, or None"""
+        key = profile_key(bank_name)
+        if not self.enabled or not key:
+            return None
+        self.count("lookups")
+        now = time.time()
+        with self._lock:
+            cached = self._profiles.get(key)
+            if cached is not None and cached[0] > now:
+                if cached[1]:
+                    self.stats["profiles_found"] += 1
+                return cached[1]
+
+        profile = None
+        blob = self._blob_client(key)
+        if blob is not None:
+            try:
+                profile = json.loads(blob.download_blob().readall())
+            except Exception as e:
+                if "BlobNotFound" not in str(e):
+                    self.count("blob_errors")
+        with self._lock:
+            self._profiles[key] = (now + self.cache_seconds, profile)
+            if profile:
+                self.stats["profiles_found"] += 1
+        return profile
+
+    def record(self, bank_name, fields):
+        """Store the latest successful extraction for a bank; consecutive repeats count up"""
+        key = profile_key(bank_name)
+        if not self.enabled or not key:
+            return None
+        previous = self.get(bank_name) or {}
+        profile = dict(fields)
+        profile["bank_name"] = bank_name
+        same_layout = all(previous.get(name) == profile.get(name) for name in ("account_extractor", "account_label"))
+        profile["successes"] = previous.get("successes", 0) + 1 if same_layout else 1
+        profile["updated_at"] = datetime.now().isoformat()
+        with self._lock:
+            self._profiles[key] = (time.time() + self.cache_seconds, profile)
+            self.stats["recorded"] += 1
+        blob = self._blob_client(key)
+        if blob is not None:
+            try:
+                blob.upload_blob(json.dumps(profile), overwrite=True)
+            except Exception:
+                self.count("blob_errors")
+        return profile
+
+    def get_status(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "cached_banks": len(self._profiles),
+                "blob_tier": bool(self._blob_service_factory) and not self._blob_disabled_reason,
+                **self.stats
+            }
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+LLM Response Cache for Bank Statement Processing
+
+Two-tier cache for Azure OpenAI responses so identical prompts cost a
+dictionary lookup instead of a throttled API round-trip:
+
+1. In-process LRU (per function instance)
+2. Blob tier in the bank-reconciliation container under llm-cache/, shared
+   across instances and restarts, with a TTL
+
+Keys are SHA-256 hashes of (deployment, prompt template version, normalized
+input). Bump a prompt's template version whenever its wording changes so old
+answers are never served for the new prompt.
+
+Settings (environment):
+    LLM_CACHE_ENABLED       true/false (default true)
+    LLM_CACHE_MAX_ENTRIES   in-process LRU size (default 512)
+    LLM_CACHE_TTL_HOURS     lifetime of an entry in either tier (default 168)
+    LLM_CACHE_BLOB_ENABLED  true/false (default true)
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+LLM_CACHE_CONTAINER = "bank-reconciliation"
+LLM_CACHE_PREFIX = "llm-cache/"
+
+
+def env_flag(name, default=False):
+    """Read a true/false setting from the environment"""
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def normalize_cache_input(value):
+    """Collapse whitespace differences that do not change the model's answer"""
+    if not isinstance(value, str):
+        value = json.dumps(value, sort_keys=True, default=str)
+    return re.sub(r'\s+', ' ', value).strip()
+
+
+def make_cache_key(deployment, template_version, cache_input):
+    """Cache key for (deployment, prompt template version, normalized input hash)"""
+    input_hash = hashlib.sha256(normalize_cache_input(cache_input).encode('utf-8')).hexdigest()
+    material = f"{deployment or ''}|{template_version}|{input_hash}"
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class LLMResponseCache:
+    """Thread-safe LRU of model responses with an optional blob-backed tier"""
+
+    def __init__(self, max_entries=512, ttl_seconds=7 * 24 * 3600, blob_service_factory=None, enabled=True):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self._blob_service_factory = blob_service_factory
+        self._blob_service = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._blob_disabled_reason = None
+        self.stats = {"memory_hits": 0, "blob_hits": 0, "misses": 0, "stores": 0, "blob_errors": 0}
+
+    @classmethod
+    def from_environment(cls, blob_service_factory=None):
+        """Build the cache from the LLM_CACHE_* settings"""
+        try:
+            max_entries = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "512"))
+            ttl_seconds = float(os.environ.get("LLM_CACHE_TTL_HOURS", "168")) * 3600
+        except ValueError:
+            max_entries, ttl_seconds = 512, 7 * 24 * 3600
+        return cls(
+            max_entries=max_entries,
+            ttl_seconds=ttl_seconds,
+            blob_service_factory=blob_service_factory if env_flag("LLM_CACHE_BLOB_ENABLED", True) else None,
+            enabled=env_flag("LLM_CACHE_ENABLED", True)
+        )
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def _blob_client(self, key):
+        if not self._blob_service_factory or self._blob_disabled_reason:
+            return None
+        try:
+            # One BlobServiceClient (and its connection pool) for the life of the cache
+            if self._blob_service is None:
+                with self._lock:
+                    if self._blob_service is None:
+                        self._blob_service = self._blob_service_factory()
+            return self._blob_service.get_blob_client(container=LLM_CACHE_CONTAINER, blob=f"{LLM_CACHE_PREFIX}{key}.json")
+        except Exception as e:
+            # No storage configured (e.g. local scripts) - run memory-only from here on
+            self._blob_disabled_reason = str(e)
+            return None
+
+    def get(self, key):
+        """Return the cached response text, or None"""
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry["expires_at"] > now:
+                    self._entries.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return entry["value"]
+                del self._entries[key]
+
+        blob = self._blob_client(key)
+        if blob is not None:
+            try:
+                record = json.loads(blob.download_blob().readall())
+                if record.get("expires_at", 0) > now:
+                    self._remember(key, record["value"], record["expires_at"])
+                    self._count("blob_hits")
+                    return record["value"]
+            except Exception as e:
+                if "BlobNotFound" not in str(e):
+                    self._count("blob_errors")
+        self._count("misses")
+        return None
+
+    def _remember(self, key, value, expires_at):
+        with self._lock:
+            self._entries[key] = {"value": value, "expires_at": expires_at}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def set(self, key, value, metadata=None):
+        """Store a response in both tiers (blob failures are not fatal)"""
+        if not self.enabled or value is None:
+            return
+        expires_at = time.time() + self.ttl_seconds
+        self._remember(key, value, expires_at)
+        self._count("stores")
+        blob = self._blob_client(key)
+        if blob is not None:
+            try:
+                record = {"value": value, "expires_at": expires_at, "created_at": time.time()}
+                record.update(metadata or {})
+                blob.upload_blob(json.dumps(record), overwrite=True)
+            except Exception:
+                self._count("blob_errors")
+
+    def clear(self):
+        """Empty the in-process tier"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_status(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_hours": round(self.ttl_seconds / 3600, 2),
+                "blob_tier": bool(self._blob_service_factory) and not self._blob_disabled_reason,
+                **self.stats
+            }
@@ -0,0 +1,534 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Event Grid Burst Load Generator
+Synthesizes BlobCreated events for a set of statement blobs and drives them
+into process_new_file to see how the function behaves when hundreds of
+statements land at once.
+
+In-process mode (default) runs the real handler on a worker pool with stubbed
+Document Intelligence / Azure OpenAI whose latency and rate limits can be
+tuned, and in-memory blob storage. Host mode posts the events to a local
+Functions host (func host start) instead; the host then talks to whatever
+storage and services it is configured for.
+
+Usage:
+    python load_generator.py --files 500 --shape burst
+    python load_generator.py --files 200 --shape steady --rate 5
+    python load_generator.py --files 300 --shape waves --burst-size 50 --interval 30
+    python load_generator.py --files 50 --host http://localhost:7071
+
+Options:
+    --files N               Number of statements (default: 500)
+    --shape NAME            burst | steady | waves (default: burst)
+    --rate R                Events per second for the steady shape (default: 10)
+    --burst-size N          Events per wave for the waves shape (default: 50)
+    --interval S            Seconds between waves (default: 30)
+    --concurrency N         Handler invocations running at once (default: 16)
+    --di-latency P          Document Intelligence latency profile (default: 2-6)
+    --openai-latency P      Azure OpenAI latency profile (default: lognormal:3:0.4)
+    --openai-capacity N     Calls per minute the OpenAI stub accepts before 429 (default: 120)
+    --openai-429-rate F     Extra probability of a random 429 per call (default: 0)
+    --no-initial-delay      Skip the handler's random start-up delay
+    --docs DIR              PDFs used as blob content (default: "New Test Docs")
+    --host URL              Post events to a local Functions host instead of in-process
+    --timeout S             Host mode: seconds to wait for outputs (default: 900)
+    --report FILE           JSON report path (default: load_report.json)
+    --verbose               Show the pipeline's own log output
+
+Latency profiles: "1.5" (fixed seconds), "0.5-3" (uniform range) or
+"lognormal:MEDIAN:SIGMA".
+"""
+
+import contextlib
+import io
+import json
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import httpx
+import openai
+import requests
+
+from replay_harness import (
+    CONTAINER_NAME, INCOMING_PREFIX, WAC_BLOB_PATH, WAC_LOCAL_PATH,
+    make_blob_created_event, percentile, read_output
+)
+
+STATEMENT_TEMPLATE = """{bank_name}
+{address}
+Account Number: {account_number}
+Statement Period 06/01/2025 - 06/30/2025
+Beginning balance $15,400.00
+Ending balance $14,000.00
+DEBITS
+06-02
+Preauthorized Wd CONC DEBIT
+1,000.00
+06-16
+Preauthorized Wd CONC DEBIT
+500.00
+CREDITS
+06-20
+Deposit
+100.00
+"""
+
+
+class LatencyProfile:
+    """Samples service latency from a fixed, uniform or lognormal profile"""
+
+    def __init__(self, spec):
+        self.spec = spec
+        if spec.startswith("lognormal:"):
+            _, median, sigma = spec.split(":")
+            self._sample = lambda: random.lognormvariate(math.log(float(median)), float(sigma))
+        elif "-" in spec:
+            low, high = (float(v) for v in spec.split("-", 1))
+            self._sample = lambda: random.uniform(low, high)
+        else:
+            value = float(spec)
+            self._sample = lambda: value
+
+    def sample(self):
+        return max(0.0, self._sample())
+
+
+class StubServices:
+    """Stubbed remote services with tunable latency and an OpenAI rate limit"""
+
+    def __init__(self, di_latency, openai_latency, openai_capacity, openai_429_rate, bank_rows):
+        self.di_latency = LatencyProfile(di_latency)
+        self.openai_latency = LatencyProfile(openai_latency)
+        self.openai_capacity = openai_capacity
+        self.openai_429_rate = openai_429_rate
+        self.bank_rows = bank_rows
+        self.lock = threading.Lock()
+        self.openai_window = deque()
+        self.counters = {"di_calls": 0, "openai_calls": 0, "openai_429s": 0,
+                         "di_in_flight_max": 0, "openai_in_flight_max": 0}
+        self._in_flight = {"di": 0, "openai": 0}
+
+    @contextlib.contextmanager
+    def _in_flight_call(self, service):
+        with self.lock:
+            self._in_flight[service] += 1
+            key = f"{service}_in_flight_max"
+            self.counters[key] = max(self.counters[key], self._in_flight[service])
+        try:
+            yield
+        finally:
+            with self.lock:
+                self._in_flight[service] -= 1
+
+    def _count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def _openai_rate_limited(self):
+        """Sliding one-minute window, like a tokens-per-minute quota"""
+        now = time.time()
+        with self.lock:
+            while self.openai_window and now - self.openai_window[0] >= 60:
+                self.openai_window.popleft()
+            if len(self.openai_window) >= self.openai_capacity or random.random() < self.openai_429_rate:
+                self.counters["openai_429s"] += 1
+                return True
+            self.openai_window.append(now)
+            return False
+
+    def document_for(self, blob_name):
+        """Synthetic bankStatement result for a blob, using a WAC bank so matching succeeds"""
+        row = self.bank_rows[sum(map(ord, blob_name)) % len(self.bank_rows)]
+        content = STATEMENT_TEMPLATE.format(**row)
+        return {
+            "apiVersion": "2024-11-30",
+            "modelId": "prebuilt-bankStatement.us",
+            "content": content,
+            "documents": [{
+                "docType": "bankStatement.us",
+                "fields": {
+                    "AccountNumber": {"type": "string", "content": row["account_number"], "confidence": 0.97},
+                    "BankName": {"type": "string", "content": row["bank_name"], "confidence": 0.95},
+                    "StatementStartDate": {"type": "date", "content": "June 1, 2025", "confidence": 0.93},
+                    "StatementEndDate": {"type": "date", "content": "June 30, 2025", "confidence": 0.93}
+                }
+            }]
+        }
+
+    def document_intelligence_client(self):
+        from azure.ai.documentintelligence.models import AnalyzeResult
+        from offline_services import CompletedPoller
+        stubs = self
+
+        class StubDocumentIntelligenceClient:
+            def __init__(self, endpoint=None, credential=None, **kwargs):
+                pass
+
+            def begin_analyze_document(self, model_id, body, **kwargs):
+                from processing_trace import get_current_trace
+                stubs._count("di_calls")
+                with stubs._in_flight_call("di"):
+                    time.sleep(stubs.di_latency.sample())
+                document = get_current_trace().document_name or "statement.pdf"
+                return CompletedPoller(AnalyzeResult(stubs.document_for(document)))
+
+        return StubDocumentIntelligenceClient
+
+    def openai_client(self):
+        from openai.types.chat import ChatCompletion
+        from streaming_completions import completion_chunks
+        stubs = self
+
+        class _Completions:
+            def create(self, **kwargs):
+                stubs._count("openai_calls")
+                if stubs._openai_rate_limited():
+                    response = httpx.Response(429, headers={"retry-after": "5"},
+                                              request=httpx.Request("POST", "https://stub.openai.azure.com/"))
+                    raise openai.RateLimitError("Error code: 429 - Rate limit exceeded (stub)", response=response, body=None)
+                with stubs._in_flight_call("openai"):
+                    time.sleep(stubs.openai_latency.sample())
+                prompt = " ".join(str(m.get("content", "")) for m in kwargs.get("messages", []))
+                content = stubs.completion_for(prompt, kwargs.get("max_tokens") or 0)
+                if kwargs.get("stream"):
+                    return completion_chunks(content, kwargs.get("model", "stub"))
+                return ChatCompletion.model_validate({
+                    "id": "stub", "object": "chat.completion", "created": int(time.time()),
+                    "model": kwargs.get("model", "stub"),
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": content}}]
+                })
+
+        class StubAzureOpenAI:
+            def __init__(self, **kwargs):
+                self.chat = type("Chat", (), {"completions": _Completions()})()
+
+        return StubAzureOpenAI
+
+    def completion_for(self, prompt, max_tokens):
+        """Account number for the short extraction prompts, a BAI2 file otherwise"""
+        account = re.search(r"Account Number:\s*(\d+)", prompt)
+        account = account.group(1) if account else "0000000000"
+        if max_tokens and max_tokens <= 100:
+            return account
+        routing = re.search(r"\b(\d{9})\b", prompt)
+        routing = routing.group(1) if routing else "000000000"
+        return "\n".join([
+            "01,WORKDAY,WORKDAY,250630,1200,1,,,2/",
+            f"02,WORKDAY,{routing},1,250630,,USD,2/",
+            f"03,{account},USD,010,1540000,,015,1400000,,Z/",
+            "16,475,100000,Z,00001,,Preauthorized Wd CONC DEBIT/",
+            "16,475,50000,Z,00002,,Preauthorized Wd CONC DEBIT/",
+            "16,195,10000,Z,00003,,Deposit/",
+            "49,1400000,5/",
+            "98,1400000,1,7/",
+            "99,1400000,1,9/"
+        ])
+
+
+def load_bank_rows():
+    """WAC bank rows used to build the synthetic statements"""
+    import pandas as pd
+    df = pd.read_excel(WAC_LOCAL_PATH, dtype={"Routing Number": str, "Account Number": str})
+    return [{
+        "bank_name": str(row["Bank Name"]).strip(),
+        "address": str(row["Address"]).strip(),
+        "account_number": str(row["Account Number"]).strip()
+    } for _, row in df.iterrows()]
+
+
+def schedule(files, shape, rate, burst_size, interval):
+    """Offsets (seconds from start) at which each event is sent"""
+    if shape == "burst":
+        return [0.0] * files
+    if shape == "steady":
+        return [i / rate for i in range(files)]
+    if shape == "waves":
+        return [(i // burst_size) * interval for i in range(files)]
+    raise ValueError(f"Unknown shape: {shape}")
+
+
+def jain_fairness(values):
+    """Jain's fairness index: 1.0 when every document waited the same"""
+    values = [v for v in values if v is not None]
+    if not values:
+        return None
+    total = sum(values)
+    squares = sum(v * v for v in values)
+    if squares == 0:
+        return 1.0
+    return (total * total) / (len(values) * squares)
+
+
+def summarize(values):
+    if not values:
+        return {}
+    return {
+        "mean": round(sum(values) / len(values), 4),
+        "p50": round(percentile(values, 50), 4),
+        "p95": round(percentile(values, 95), 4),
+        "max": round(max(values), 4)
+    }
+
+
+def blob_names(options):
+    pdfs = sorted(f for f in os.listdir(options["docs"]) if f.lower().endswith(".pdf"))
+    names = [f"load_{i:04d}_{pdfs[i % len(pdfs)]}" for i in range(options["files"])]
+    return pdfs, names
+
+
+def run_in_process(options):
+    """Drive the real handler on a worker pool with stubbed services"""
+    # Before the import: the model router, LLM cache and routing directory read these at import time
+    for key, value in {
+        "AzureWebJobsStorage": "UseDevelopmentStorage=true",
+        "DOCINTELLIGENCE_ENDPOINT": "https://stub.invalid/",
+        "DOCINTELLIGENCE_KEY": "stub",
+        "AZURE_OPENAI_ENDPOINT": "https://stub.invalid/",
+        "AZURE_OPENAI_KEY": "stub",
+        "AZURE_OPENAI_DEPLOYMENT": "gpt-4.1"
+    }.items():
+        os.environ.setdefault(key, value)
+    with contextlib.redirect_stdout(io.StringIO()):
+        import function_app
+    from offline_services import InMemoryBlobServiceClient, patched_services
+    from processing_trace import add_trace_listener, remove_trace_listener
+
+    if options["no_initial_delay"]:
+        function_app.ThrottlingConfig.INITIAL_PROCESSING_DELAY_MIN = 0
+        function_app.ThrottlingConfig.INITIAL_PROCESSING_DELAY_MAX = 0
+
+    stubs = StubServices(options["di_latency"], options["openai_latency"],
+                         options["openai_capacity"], options["openai_429_rate"], load_bank_rows())
+    pdfs, names = blob_names(options)
+    blob_service = InMemoryBlobServiceClient()
+    with open(WAC_LOCAL_PATH, "rb") as f:
+        blob_service.get_blob_client(CONTAINER_NAME, WAC_BLOB_PATH).upload_blob(f.read(), overwrite=True)
+    pdf_bytes = {}
+    for pdf in pdfs[:options["files"]]:
+        with open(os.path.join(options["docs"], pdf), "rb") as f:
+            pdf_bytes[pdf] = f.read()
+    for i, name in enumerate(names):
+        blob_service.get_blob_client(CONTAINER_NAME, f"{INCOMING_PREFIX}{name}").upload_blob(
+            pdf_bytes[pdfs[i % len(pdfs)]], overwrite=True)
+
+    traces = {}
+    dispatched = {}
+    outcomes = {}
+
+    def collect_trace(trace):
+        traces[trace.document_name] = trace
+
+    def handle(name, size):
+        try:
+            function_app.process_new_file(make_blob_created_event(name, size))
+            outcomes[name] = "completed"
+        except Exception as e:
+            outcomes[name] = f"exception: {type(e).__name__}"
+
+    offsets = schedule(options["files"], options["shape"], options["rate"],
+                       options["burst_size"], options["interval"])
+    print(f"🌩️ Sending {len(names)} events ({options['shape']}) to {options['concurrency']} workers...")
+    add_trace_listener(collect_trace)
+    quiet = not options["verbose"]
+    with patched_services(stubs.document_intelligence_client(), stubs.openai_client()):
+        with contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext():
+            start = time.time()
+            with ThreadPoolExecutor(max_workers=options["concurrency"]) as pool:
+                for i, (name, offset) in enumerate(zip(names, offsets)):
+                    delay = start + offset - time.time()
+                    if delay > 0:
+                        time.sleep(delay)
+                    dispatched[name] = time.time()
+                    pool.submit(handle, name, len(pdf_bytes[pdfs[i % len(pdfs)]]))
+            wall_seconds = time.time() - start
+    remove_trace_listener(collect_trace)
+
+    queue_delays, latencies, waits, wait_per_call = [], [], [], []
+    statuses = {"ok": 0, "error_bai2": 0, "deferred": 0, "exception": 0}
+    retries = 0
+    for name in names:
+        trace = traces.get(name)
+        if trace is None:
+            statuses["deferred"] += 1
+            continue
+        if outcomes.get(name, "").startswith("exception"):
+            statuses["exception"] += 1
+        else:
+            output_name, _ = read_output(blob_service, name)
+            statuses["error_bai2" if output_name and "/ERROR_" in output_name else "ok"] += 1
+        queue_delays.append(trace.started_at - dispatched[name])
+        latencies.append(trace.total_seconds)
+        calls = trace.counters.get("openai_calls", 0)
+        retries += trace.counters.get("openai_retries", 0)
+        if calls:
+            wait = trace.counters.get("openai_throttle_wait_seconds", 0.0)
+            waits.append(wait)
+            wait_per_call.append(wait / calls)
+
+    completed = len(latencies)
+    return {
+        "mode": "in-process",
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_files_per_minute": round(completed / wall_seconds * 60, 2) if wall_seconds else None,
+        "statuses": statuses,
+        "queue_delay_seconds": summarize(queue_delays),
+        "latency_seconds": summarize(latencies),
+        "openai_429s": stubs.counters["openai_429s"],
+        "openai_retries": retries,
+        "service_calls": stubs.counters,
+        "throttler": {
+            "wait_seconds": summarize(waits),
+            "wait_per_call_seconds": summarize(wait_per_call),
+            "jain_fairness_index": jain_fairness(wait_per_call),
+            "adaptive": function_app.openai_throttler.adaptive.get_state() if function_app.openai_throttler.adaptive else None
+        }
+    }
+
+
+def run_against_host(options):
+    """Upload blobs to the host's storage and post the events to its Event Grid webhook"""
+    from azure.storage.blob import BlobServiceClient
+
+    connection = os.environ.get("AzureWebJobsStorage", "UseDevelopmentStorage=true")
+    blob_service = BlobServiceClient.from_connection_string(connection)
+    try:
+        blob_service.create_container(CONTAINER_NAME)
+    except Exception:
+        pass  # Container already exists
+    pdfs, names = blob_names(options)
+    sizes = {}
+    for i, name in enumerate(names):
+        with open(os.path.join(options["docs"], pdfs[i % len(pdfs)]), "rb") as f:
+            data = f.read()
+        sizes[name] = len(data)
+        blob_service.get_blob_client(CONTAINER_NAME, f"{INCOMING_PREFIX}{name}").upload_blob(data, overwrite=True)
+
+    url = f"{options['host'].rstrip('/')}/runtime/webhooks/eventgrid?functionName=process_new_file"
+    headers = {"aeg-event-type": "Notification", "Content-Type": "application/json"}
+    offsets = schedule(options["files"], options["shape"], options["rate"],
+                       options["burst_size"], options["interval"])
+    http_statuses = {}
+    print(f"🌩️ Posting {len(names)} events ({options['shape']}) to {url}...")
+    start = time.time()
+    for name, offset in zip(names, offsets):
+        delay = start + offset - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        event = make_blob_created_event(name, sizes[name])
+        payload = [{
+            "id": event.id, "topic": event.topic, "subject": event.subject,
+            "eventType": event.event_type, "eventTime": event.event_time.isoformat() + "Z",
+            "dataVersion": event.data_version, "data": event.get_json()
+        }]
+        try:
+            status = requests.post(url, headers=headers, json=payload, timeout=30).status_code
+        except Exception as e:
+            status = type(e).__name__
+        http_statuses[str(status)] = http_statuses.get(str(status), 0) + 1
+    send_seconds = time.time() - start
+
+    # Wait for the host to write an output (BAI2 or ERROR BAI2) for every blob
+    finished = {}
+    while len(finished) < len(names) and time.time() - start < options["timeout"]:
+        for name in names:
+            if name not in finished and read_output(blob_service, name)[0]:
+                finished[name] = time.time() - start
+        time.sleep(2)
+    wall_seconds = max(finished.values()) if finished else time.time() - start
+    return {
+        "mode": "host",
+        "host": options["host"],
+        "send_seconds": round(send_seconds, 3),
+        "http_statuses": http_statuses,
+        "completed": len(finished),
+        "timed_out": len(names) - len(finished),
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_files_per_minute": round(len(finished) / wall_seconds * 60, 2) if wall_seconds else None,
+        "completion_seconds": summarize(list(finished.values()))
+    }
+
+
+def parse_args(argv):
+    options = {
+        "files": 500, "shape": "burst", "rate": 10.0, "burst_size": 50, "interval": 30.0,
+        "concurrency": 16, "di_latency": "2-6", "openai_latency": "lognormal:3:0.4",
+        "openai_capacity": 120, "openai_429_rate": 0.0, "no_initial_delay": False,
+        "docs": "New Test Docs", "host": None, "timeout": 900.0,
+        "report": "load_report.json", "verbose": False
+    }
+    converters = {
+        "--files": ("files", int), "--shape": ("shape", str), "--rate": ("rate", float),
+        "--burst-size": ("burst_size", int), "--interval": ("interval", float),
+        "--concurrency": ("concurrency", int), "--di-latency": ("di_latency", str),
+        "--openai-latency": ("openai_latency", str), "--openai-capacity": ("openai_capacity", int),
+        "--openai-429-rate": ("openai_429_rate", float), "--docs": ("docs", str),
+        "--host": ("host", str), "--timeout": ("timeout", float), "--report": ("report", str)
+    }
+    args = list(argv)
+    while args:
+        arg = args.pop(0)
+        if arg in ("--help", "-h"):
+            print(__doc__)
+            sys.exit(0)
+        elif arg == "--no-initial-delay":
+            options["no_initial_delay"] = True
+        elif arg == "--verbose":
+            options["verbose"] = True
+        elif arg in converters and args:
+            key, convert = converters[arg]
+            options[key] = convert(args.pop(0))
+        else:
+            print(f"❌ Unknown or incomplete option: {arg}")
+            print(__doc__)
+            sys.exit(2)
+    return options
+
+
+def main(argv=None):
+    options = parse_args(sys.argv[1:] if argv is None else argv)
+    result = run_against_host(options) if options["host"] else run_in_process(options)
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "files": options["files"],
+        "shape": options["shape"],
+        "options": options,
+        **result
+    }
+    with open(options["report"], "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print("")
+    print("📊 LOAD TEST SUMMARY")
+    print("=" * 60)
+    print(f"Files: {options['files']} ({options['shape']}), wall time {report['wall_seconds']:.1f}s, "
+          f"{report['throughput_files_per_minute']} files/min")
+    if report["mode"] == "in-process":
+        print(f"Statuses: {report['statuses']}")
+        print(f"Queueing delay: {report['queue_delay_seconds']}")
+        print(f"Handler latency: {report['latency_seconds']}")
+        print(f"OpenAI 429s: {report['openai_429s']} (retries {report['openai_retries']})")
+        print(f"Throttler wait per call: {report['throttler']['wait_per_call_seconds']}")
+        print(f"Throttler fairness (Jain): {report['throttler']['jain_fairness_index']}")
+        if report["throttler"]["adaptive"]:
+            adaptive = report["throttler"]["adaptive"]
+            print(f"Adaptive rate: {adaptive['initial_calls_per_minute']} -> {adaptive['calls_per_minute']} calls/min "
+                  f"({adaptive['increases']} increases, {adaptive['decreases_429']} 429 / {adaptive['decreases_latency']} latency decreases)")
+    else:
+        print(f"HTTP statuses: {report['http_statuses']}")
+        print(f"Completed: {report['completed']}, timed out: {report['timed_out']}")
+    print(f"📄 Report written to {options['report']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Tiered Model Router for Azure OpenAI Calls
+
+Chooses the deployment for each prompt task. Small lookup tasks (routing number,
+account number) go to a fast, low-cost deployment first and are escalated to the
+large deployment only when the answer fails validation (is_valid_account_number,
+is_valid_routing_number, BAI2 structure checks) or is a not-found answer - the
+small deployment giving up is the case the large one is there for. Everything
+else goes straight to the large deployment.
+
+Route choices, validation failures and escalations are counted per task and
+reported by the /metrics endpoint.
+
+Settings (environment):
+    AZURE_OPENAI_DEPLOYMENT          large deployment (default gpt-4.1)
+    AZURE_OPENAI_SMALL_DEPLOYMENT    small deployment; unset = no tiering
+    MODEL_ROUTER_SMALL_FIRST_TASKS   comma-separated tasks tried on the small
+                                     deployment first (default: routing_lookup,
+                                     account_extraction, account_extraction_rules)
+"""
+
+import os
+import threading
+
+DEFAULT_LARGE_DEPLOYMENT = "gpt-4.1"
+DEFAULT_SMALL_FIRST_TASKS = ("routing_lookup", "account_extraction", "account_extraction_rules")
+
+
+class ModelRouter:
+    """Per-task deployment selection with validation-driven escalation"""
+
+    def __init__(self, large_deployment, small_deployment=None, small_first_tasks=DEFAULT_SMALL_FIRST_TASKS):
+        self.large_deployment = large_deployment
+        self.small_deployment = small_deployment if small_deployment != large_deployment else None
+        self.small_first_tasks = set(small_first_tasks)
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    @classmethod
+    def from_environment(cls):
+        tasks = os.environ.get("MODEL_ROUTER_SMALL_FIRST_TASKS")
+        return cls(
+            large_deployment=os.environ.get("AZURE_OPENAI_DEPLOYMENT") or DEFAULT_LARGE_DEPLOYMENT,
+            small_deployment=os.environ.get("AZURE_OPENAI_SMALL_DEPLOYMENT") or None,
+            small_first_tasks=[t.strip() for t in tasks.split(",") if t.strip()] if tasks is not None else DEFAULT_SMALL_FIRST_TASKS
+        )
+
+    def deployments_for(self, task):
+        """Deployments to try for a task, cheapest first"""
+        if self.small_deployment and task in self.small_first_tasks:
+            return [self.small_deployment, self.large_deployment]
+        return [self.large_deployment]
+
+    def _record(self, task, counter, deployment=None):
+        with self._lock:
+            metrics = self._metrics.setdefault(task, {"requests": 0, "calls": {}, "validation_failures": 0,
+                                                      "escalations": 0, "unresolved": 0})
+            if counter == "calls":
+                metrics["calls"][deployment] = metrics["calls"].get(deployment, 0) + 1
+            else:
+                metrics[counter] += 1
+
+    def run(self, task, call, validate, final_only=None):
+        """
+        call(deployment) -> answer; validate(answer) -> bool; final_only(answer) -> True
+        for answers accepted only from the last tier (a not-found sentinel), which
+        escalate from an earlier one like a failed validation.
+        Returns (answer, deployment). The last tier's answer is returned even when it
+        fails validation, so callers keep their existing handling of bad answers.
+        """
+        self._record(task, "requests")
+        deployments = self.deployments_for(task)
+        answer = None
+        for tier, deployment in enumerate(deployments):
+            self._record(task, "calls", deployment)
+            answer = call(deployment)
+            last = tier + 1 == len(deployments)
+            if validate(answer) and (last or final_only is None or not final_only(answer)):
+                return answer, deployment
+            self._record(task, "validation_failures")
+            if tier + 1 < len(deployments):
+                self._record(task, "escalations")
+        self._record(task, "unresolved")
+        return answer, deployments[-1]
+
+    def get_metrics(self):
+        """Per-task route counts and escalation rate"""
+        with self._lock:
+            tasks = {}
+            for task, metrics in self._metrics.items():
+                tasks[task] = dict(metrics, calls=dict(metrics["calls"]))
+                tasks[task]["escalation_rate"] = round(metrics["escalations"] / metrics["requests"], 4) if metrics["requests"] else 0.0
+            return {
+                "large_deployment": self.large_deployment,
+                "small_deployment": self.small_deployment,
+                "small_first_tasks": sorted(self.small_first_tasks),
+                "tasks": tasks
+            }
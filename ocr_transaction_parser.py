@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+"""
+OCR Transaction Parser (no-LLM fast path)
+
+A line-streaming state machine that reads transactions straight from the
+Document Intelligence OCR text, generalizing the DEBITS/CREDITS parser ported
+from extract_transactions_841.py:
+
+- section headers switch the current kind: credits ("DEPOSITS AND ADDITIONS",
+  "CREDITS", ...), debits ("WITHDRAWALS", "CHECKS PAID", "ELECTRONIC DEBITS",
+  ...), fees ("SERVICE CHARGES", ...); balance tables ("DAILY BALANCES") end a
+  section. A line is only taken for a header when no transaction is open, so
+  one-word descriptions such as "Deposit" or "Checks" stay descriptions
+- a transaction starts at a line beginning with a date (MM-DD, MM/DD,
+  MM/DD/YY, MM/DD/YYYY) and ends at its amount - on the same line ("07/15
+  DEPOSIT 1,234.56", a trailing running balance is ignored) or on a later line
+  after description lines (the 841 layout)
+- amounts become integer cents; debit-section descriptions mentioning fees are
+  classified as fees (they stay withdrawals in the totals)
+- "Total deposits/additions/credits ..." and "Total withdrawals/subtractions/
+  debits ..." summary lines, count-prefixed ones ("19 Deposits/Credits") and
+  the beginning/ending balances are collected for validation; when the label
+  line has no amount (the 841 layout), the amount is read from the next line
+
+parse_statement returns the result in the consolidated extraction shape
+(consolidated_extraction.parse_consolidated_response), so a statement whose
+transactions reconcile with the printed totals can be written by
+build_bai2_from_consolidated without any OpenAI call.
+
+Extra headers for unusual layouts can be supplied as JSON ({"credit": [...],
+"debit": [...], "fee": [...], "end": [...]}, regular expressions matched
+against the whole upper-cased line). Lines that start with a digit, "$" or "("
+or are longer than MAX_HEADER_CHARS are never taken for headers, which keeps
+the header check off the date, amount and long description lines.
+
+Settings (environment):
+    OCR_TRANSACTION_FAST_PATH   true/false (default true)
+    OCR_PARSER_LAYOUT_PATH      JSON file of additional section headers
+"""
+
+import json
+import os
+import re
+from collections import namedtuple
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+import date_engine
+from transaction_store import TransactionStore
+
+MAX_DESCRIPTION_LINES = 6
+MAX_HEADER_CHARS = 60
+
+SECTION_HEADERS = {
+    "credit": [
+        r"CREDITS?", r"DEPOSITS?", r"ADDITIONS", r"OTHER CREDITS", r"ELECTRONIC CREDITS",
+        r"DEPOSITS (?:AND|&) (?:OTHER )?(?:CREDITS|ADDITIONS)", r"DEPOSITS/CREDITS"
+    ],
+    "debit": [
+        r"DEBITS?", r"WITHDRAWALS?", r"SUBTRACTIONS", r"OTHER DEBITS", r"ELECTRONIC DEBITS",
+        r"CHECKS(?: PAID)?", r"CHECKS (?:AND|&) (?:OTHER )?DEBITS", r"CARD PURCHASES",
+        r"WITHDRAWALS (?:AND|&) (?:OTHER )?(?:DEBITS|SUBTRACTIONS)", r"WITHDRAWALS/DEBITS",
+        r"ATM (?:AND|&) DEBIT CARD WITHDRAWALS"
+    ],
+    "fee": [r"FEES", r"SERVICE CHARGES?", r"SERVICE FEES", r"FEES (?:AND|&) SERVICE CHARGES"],
+    "end": [
+        r"DAILY (?:ENDING |LEDGER )?BALANCES?(?: SUMMARY)?", r"BALANCE SUMMARY",
+        r"OVERDRAFT/RETURN ITEM FEES", r"ACCOUNT SUMMARY", r"INTEREST SUMMARY"
+    ]
+}
+
+DATE_PREFIX = re.compile(r'^(\d{1,2}[-/]\d{1,2}(?:/\d{2}(?:\d{2})?)?)(?=\s|$)\s*(.*)$')
+AMOUNT = r'\(?-?\$?\s?\d{1,3}(?:,\d{3})*\.\d{2}\)?-?'
+AMOUNT_ONLY = re.compile(rf'^{AMOUNT}$')
+TRAILING_AMOUNTS = re.compile(rf'^(.*?)\s*((?:{AMOUNT}\s*)+)$')
+AMOUNT_TOKEN = re.compile(AMOUNT)
+TOTAL_WORD = r'(?:deposits?|credits?|additions|withdrawals?|debits?|subtractions|checks?|fees|service charges)'
+TOTAL_LINE = re.compile(rf'^total\s+(.*?)[\s:]*({AMOUNT})?$', re.IGNORECASE)
+COUNT_TOTAL_LINE = re.compile(rf'^\d+\s+({TOTAL_WORD}(?:\s*(?:/|&|and)\s*{TOTAL_WORD})*)[\s:]*({AMOUNT})?$', re.IGNORECASE)
+BALANCE_LINE = re.compile(rf'^(?:[\dX*-]+\s+)?(beginning|opening|previous|starting|ending|closing|new)\s+balance\b(?:.*?({AMOUNT})|.*)$', re.IGNORECASE)
+CONTINUED = re.compile(r'\s*[-(]?\s*CONTINUED\s*\)?$')
+
+CREDIT_TOTAL_WORDS = ("DEPOSIT", "CREDIT", "ADDITION")
+DEBIT_TOTAL_WORDS = ("WITHDRAWAL", "DEBIT", "SUBTRACTION", "CHECK", "FEE", "SERVICE CHARGE")
+FEE_WORDS = ("FEE", "LOSS/CHG", "SERVICE CHARGE")
+
+OcrTransaction = namedtuple("OcrTransaction", "date description amount_cents kind section line")
+
+
+def total_key(label):
+    """Summary key for a total's label (total_credits_cents / total_debits_cents), None for other totals"""
+    label = label.upper()
+    if any(word in label for word in CREDIT_TOTAL_WORDS):
+        return "total_credits_cents"
+    if any(word in label for word in DEBIT_TOTAL_WORDS):
+        return "total_debits_cents"
+    return None
+
+
+def balance_key(label):
+    """Summary key for a balance line's first word"""
+    if label.lower() in ("beginning", "opening", "previous", "starting"):
+        return "opening_balance_cents"
+    return "closing_balance_cents"
+
+
+def trailing_amounts(text):
+    """TRAILING_AMOUNTS.match(text), skipping the regex when text does not end like an amount (9.99, 9.99-, (9.99))"""
+    # The lazy description group makes the regex try the amounts at every position of the line
+    tail = text.rstrip()
+    if tail.endswith("-"):
+        tail = tail[:-1]
+    if tail.endswith(")"):
+        tail = tail[:-1]
+    if tail[-3:-2] != "." or not tail[-2:].isdigit() or not tail[-4:-3].isdigit():
+        return None
+    return TRAILING_AMOUNTS.match(text)
+
+
+def amount_cents(text):
+    """Integer cents for a printed amount ("$1,234.56", "(12.00)", "12.00-"), always positive"""
+    cleaned = re.sub(r'[^0-9.]', '', text or "")
+    try:
+        return int(Decimal(cleaned) * 100)
+    except InvalidOperation:
+        return None
+
+
+class OcrTransactionParser:
+    """Streaming section/transaction state machine over OCR lines"""
+
+    def __init__(self, headers=None, enabled=True):
+        self.enabled = enabled
+        merged = {kind: list(patterns) for kind, patterns in SECTION_HEADERS.items()}
+        for kind, patterns in (headers or {}).items():
+            merged.setdefault(kind, []).extend(patterns)
+        # One alternation with a group per kind: the first kind whose patterns match wins
+        self.headers = re.compile('|'.join(f'(?P<{kind}>{"|".join(patterns)})' for kind, patterns in merged.items()))
+
+    @classmethod
+    def from_environment(cls):
+        path = os.environ.get("OCR_PARSER_LAYOUT_PATH")
+        headers = None
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                headers = json.load(f)
+        enabled = os.environ.get("OCR_TRANSACTION_FAST_PATH", "true").strip().lower() in ("1", "true", "yes", "on")
+        return cls(headers=headers, enabled=enabled)
+
+    def section_of(self, line):
+        """credit/debit/fee/end for a section header line, else None"""
+        line = line.strip()
+        if not line or len(line) > MAX_HEADER_CHARS or line[0].isdigit() or line[0] in "$(":
+            return None
+        heading = ' '.join(line.upper().replace(':', ' ').split())
+        if "CONTINUED" in heading:
+            heading = CONTINUED.sub('', heading)
+        match = self.headers.fullmatch(heading)
+        return match.lastgroup if match else None
+
+    def iter_transactions(self, lines, summary=None):
+        """
+        Yield OcrTransaction for each dated, amounted line group inside a transaction
+        section. Totals and balances found along the way are added to summary (a dict).
+        """
+        summary = summary if summary is not None else {}
+        section = None
+        pending = None  # [date, description lines, line index]
+        label = None    # summary key (or None) of a total/balance label whose amount is on the next line
+        labelled = False
+
+        def finish(amount_text):
+            cents = amount_cents(amount_text)
+            date, description_lines, index = pending
+            description = ' | '.join(part for part in description_lines if part)
+            kind = section
+            if kind == "debit" and any(word in description.upper() for word in FEE_WORDS):
+                kind = "fee"
+            return OcrTransaction(date, description, cents, kind, section, index)
+
+        for index, raw_line in enumerate(lines):
+            line = raw_line.strip()
+            if not line:
+                continue
+
+            if labelled:
+                labelled = False
+                if AMOUNT_ONLY.match(line):
+                    if label:
+                        summary.setdefault(label, amount_cents(line))
+                    continue
+
+            # While a transaction is open, one-word descriptions ("Deposit", "Checks") are not headers
+            heading = self.section_of(line) if pending is None else None
+            if heading:
+                pending = None
+                section = None if heading == "end" else heading
+                continue
+
+            upper = line.upper()
+            if upper.startswith("TOTAL"):
+                total = TOTAL_LINE.match(line)
+            elif pending is None and line[0].isdigit():
+                total = COUNT_TOTAL_LINE.match(line)
+            else:
+                total = None
+            if total:
+                pending = None
+                key = total_key(total.group(1))
+                if total.group(2) is None:
+                    label, labelled = key, True
+                elif key:
+                    summary.setdefault(key, amount_cents(total.group(2)))
+                continue
+
+            balance = BALANCE_LINE.match(line) if not pending and "BALANCE" in upper else None
+            if balance:
+                key = balance_key(balance.group(1))
+                if balance.group(2) is None:
+                    label, labelled = key, True
+                else:
+                    summary.setdefault(key, amount_cents(balance.group(2)))
+                continue
+
+            if section is None:
+                continue
+
+            dated = DATE_PREFIX.match(line)
+            if dated:
+                pending = [dated.group(1), [], index]
+                rest = dated.group(2)
+                amounts = trailing_amounts(rest)
+                if amounts:
+                    # "DEPOSIT 1,234.56" or "CHECK 101 50.00 1,234.56" (amount, then running balance)
+                    pending[1].append(amounts.group(1))
+                    yield finish(AMOUNT_TOKEN.findall(amounts.group(2))[0])
+                    pending = None
+                else:
+                    pending[1].append(rest)
+                continue
+
+            if pending is None:
+                continue
+            if AMOUNT_ONLY.match(line):
+                yield finish(line)
+                pending = None
+                continue
+            amounts = trailing_amounts(line)
+            if amounts:
+                pending[1].append(amounts.group(1))
+                yield finish(AMOUNT_TOKEN.findall(amounts.group(2))[0])
+                pending = None
+                continue
+            pending[1].append(line)
+            if len(pending[1]) > MAX_DESCRIPTION_LINES:
+                pending = None
+
+    def parse_statement(self, lines, period=None):
+        """
+        Transactions and validation for a statement's OCR lines, in the consolidated
+        extraction shape (transactions as a TransactionStore) plus a "validation" summary.
+        """
+        summary = {}
+        found = [t for t in self.iter_transactions(lines, summary) if t.amount_cents]
+        value_dates = date_engine.bai2_transaction_dates([t.date for t in found], period)
+        transactions = TransactionStore()
+        for t, value_date in zip(found, value_dates):
+            posted = datetime.strptime(value_date, "%y%m%d").date() if value_date else None
+            transactions.append(t.amount_cents, t.kind, t.description, posted)
+
+        extraction = {
+            "account_number": None,
+            "bank_name": None,
+            "statement_start_date": period.start.isoformat() if period and period.start else None,
+            "statement_end_date": period.end.isoformat() if period and period.end else None,
+            "opening_balance_cents": summary.get("opening_balance_cents"),
+            "closing_balance_cents": summary.get("closing_balance_cents"),
+            "transactions": transactions
+        }
+        extraction["validation"] = validate_totals(extraction, summary)
+        return extraction
+
+
+def validate_totals(extraction, summary):
+    """
+    Compare parsed sums with the printed totals and balances. Reconciled only when every
+    printed check agrees and both balances were found: the BAI2 file needs the closing balance.
+    """
+    credits, debits = TransactionStore.of(extraction["transactions"]).totals()
+    printed_credits = summary.get("total_credits_cents")
+    printed_debits = summary.get("total_debits_cents")
+    opening = summary.get("opening_balance_cents")
+    closing = summary.get("closing_balance_cents")
+
+    def side_ok(parsed, printed):
+        return parsed == printed if printed is not None else parsed == 0
+
+    checks = {
+        "credits_match": None if printed_credits is None else credits == printed_credits,
+        "debits_match": None if printed_debits is None else debits == printed_debits,
+        "balance_match": None if opening is None or closing is None else opening + credits - debits == closing
+    }
+    reconciled = (
+        bool(extraction["transactions"])
+        and (printed_credits is not None or printed_debits is not None)
+        and side_ok(credits, printed_credits)
+        and side_ok(debits, printed_debits)
+        and checks["balance_match"] is True
+    )
+    return {
+        "transactions": len(extraction["transactions"]),
+        "total_credits_cents": credits,
+        "total_debits_cents": debits,
+        "printed_credits_cents": printed_credits,
+        "printed_debits_cents": printed_debits,
+        **checks,
+        "reconciled": reconciled
+    }
@@ -0,0 +1,425 @@
+# -*- coding: utf-8 -*-
+"""
+Offline Service Stand-ins for Local Replay
+
+Record/replay ("cassette") wrappers for the external services the pipeline
+talks to, plus an in-memory stand-in for Azure Blob Storage:
+
+- Document Intelligence: keyed by model id + SHA-256 of the PDF bytes
+- Azure OpenAI chat completions: keyed by a hash of the request payload
+- requests.post (raw REST OpenAI calls): keyed by URL path + JSON body
+
+In record mode the real services are called and every response is written to
+the cassette directory. In replay mode responses come only from the cassettes,
+so the full pipeline runs with no network access.
+
+Some prompts embed the current time (e.g. the BAI2 file creation time), so an
+exact request hash will not match on a later day. Replay therefore falls back
+to the response recorded for the same document, service and call order.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+from io import BytesIO
+from types import SimpleNamespace
+from urllib.parse import urlsplit
+
+import requests
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
+
+from processing_trace import get_current_trace
+from streaming_completions import completion_chunks
+
+RECORD = "record"
+REPLAY = "replay"
+
+
+class CassetteMissError(Exception):
+    """Raised in replay mode when no recorded response matches a request"""
+
+
+def request_key(*parts):
+    """Stable SHA-256 key for a request made of JSON-serializable parts"""
+    payload = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CassetteStore:
+    """Recorded service responses stored as one JSON file per request"""
+
+    def __init__(self, directory, mode=REPLAY):
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.directory = directory
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+        self.sequence_matches = 0
+        self._lock = threading.Lock()
+        self._call_counts = {}
+        self._index_path = os.path.join(directory, "index.json")
+        self._index = {}
+        if os.path.exists(self._index_path):
+            with open(self._index_path, "r", encoding="utf-8") as f:
+                self._index = json.load(f)
+
+    @property
+    def recording(self):
+        return self.mode == RECORD
+
+    def _path(self, service, key):
+        return os.path.join(self.directory, service, f"{key}.json")
+
+    def _sequence_id(self, service):
+        """'<service>/<document>/<n>' for the n-th call made while processing a document"""
+        document = get_current_trace().document_name or "_no_document"
+        with self._lock:
+            counter = (service, document)
+            self._call_counts[counter] = self._call_counts.get(counter, 0) + 1
+            return f"{service}/{document}/{self._call_counts[counter]}"
+
+    def reset_sequence(self, document):
+        """Restart call numbering for a document before it is processed again"""
+        with self._lock:
+            for counter in [c for c in self._call_counts if c[1] == document]:
+                del self._call_counts[counter]
+
+    def lookup(self, service, key):
+        """Return the recorded response for a request (replay mode)"""
+        sequence_id = self._sequence_id(service)
+        path = self._path(service, key)
+        if not os.path.exists(path):
+            fallback_key = self._index.get(sequence_id)
+            path = self._path(service, fallback_key) if fallback_key else None
+            if not path or not os.path.exists(path):
+                with self._lock:
+                    self.misses += 1
+                raise CassetteMissError(f"No recorded {service} response for {sequence_id} (key {key[:12]})")
+            with self._lock:
+                self.sequence_matches += 1
+        with open(path, "r", encoding="utf-8") as f:
+            cassette = json.load(f)
+        with self._lock:
+            self.hits += 1
+        return cassette["response"]
+
+    def save(self, service, key, response, request_summary=None):
+        """Write a recorded response (record mode)"""
+        sequence_id = self._sequence_id(service)
+        path = self._path(service, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({
+                "service": service,
+                "key": key,
+                "sequence_id": sequence_id,
+                "request": request_summary or {},
+                "response": response
+            }, f, indent=2, default=str)
+        with self._lock:
+            self._index[sequence_id] = key
+            self.recorded += 1
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self._index_path, "w", encoding="utf-8") as f:
+                json.dump(self._index, f, indent=2, sort_keys=True)
+
+    def stats(self):
+        return {
+            "mode": self.mode,
+            "hits": self.hits,
+            "sequence_matches": self.sequence_matches,
+            "misses": self.misses,
+            "recorded": self.recorded
+        }
+
+
+# === DOCUMENT INTELLIGENCE ===
+
+class CompletedPoller:
+    """Minimal LROPoller stand-in holding an already available result"""
+
+    def __init__(self, result):
+        self._result = result
+
+    def result(self, timeout=None):
+        return self._result
+
+    def done(self):
+        return True
+
+    def status(self):
+        return "succeeded"
+
+
+def make_document_intelligence_client(store):
+    """Build a DocumentIntelligenceClient replacement bound to a cassette store"""
+    from azure.ai.documentintelligence import DocumentIntelligenceClient
+    from azure.ai.documentintelligence.models import AnalyzeResult
+
+    class CassetteDocumentIntelligenceClient:
+        def __init__(self, endpoint=None, credential=None, **kwargs):
+            self._real = DocumentIntelligenceClient(endpoint=endpoint, credential=credential, **kwargs) if store.recording else None
+
+        def begin_analyze_document(self, model_id, body, **kwargs):
+            data = body.read() if hasattr(body, "read") else bytes(body)
+            key = request_key("document_intelligence", model_id, hashlib.sha256(data).hexdigest())
+            if not store.recording:
+                return CompletedPoller(AnalyzeResult(store.lookup("document_intelligence", key)))
+            result = self._real.begin_analyze_document(model_id, BytesIO(data), **kwargs).result()
+            store.save("document_intelligence", key, result.as_dict(),
+                       {"model_id": model_id, "document_bytes": len(data)})
+            return CompletedPoller(result)
+
+    return CassetteDocumentIntelligenceClient
+
+
+# === AZURE OPENAI ===
+
+def make_openai_client(store):
+    """Build an AzureOpenAI replacement bound to a cassette store"""
+    from openai import AzureOpenAI
+    from openai.types.chat import ChatCompletion
+
+    class _Completions:
+        def __init__(self, client_kwargs):
+            self._client_kwargs = client_kwargs
+
+        def create(self, **kwargs):
+            request = {k: v for k, v in kwargs.items() if k not in ("timeout", "extra_headers")}
+            key = request_key("openai", self._client_kwargs.get("api_version"), request)
+            if not store.recording:
+                recorded = ChatCompletion.model_validate(store.lookup("openai", key))
+                if kwargs.get("stream"):
+                    return completion_chunks(recorded.choices[0].message.content or "", recorded.model)
+                return recorded
+            if kwargs.get("stream"):
+                # Record the assembled completion; the caller still gets a stream
+                kwargs = dict(kwargs, stream=False)
+                response = AzureOpenAI(**self._client_kwargs).chat.completions.create(**kwargs)
+                store.save("openai", key, response.model_dump(mode="json"),
+                           {"model": kwargs.get("model"), "api_version": self._client_kwargs.get("api_version")})
+                return completion_chunks(response.choices[0].message.content or "", response.model)
+            response = AzureOpenAI(**self._client_kwargs).chat.completions.create(**kwargs)
+            store.save("openai", key, response.model_dump(mode="json"),
+                       {"model": kwargs.get("model"), "api_version": self._client_kwargs.get("api_version")})
+            return response
+
+    class CassetteAzureOpenAI:
+        def __init__(self, **kwargs):
+            self.chat = SimpleNamespace(completions=_Completions(kwargs))
+
+    return CassetteAzureOpenAI
+
+
+# === RAW REST CALLS (requests.post) ===
+
+class CassetteRequests:
+    """Drop-in for the requests module that records/replays post() calls"""
+
+    exceptions = requests.exceptions
+
+    def __init__(self, store):
+        self._store = store
+
+    def __getattr__(self, name):
+        return getattr(requests, name)
+
+    def post(self, url, data=None, json=None, **kwargs):
+        key = request_key("http", urlsplit(url).path, json if json is not None else data)
+        if not self._store.recording:
+            recorded = self._store.lookup("http", key)
+            response = requests.models.Response()
+            response.status_code = recorded["status_code"]
+            response._content = recorded["body"].encode("utf-8")
+            response._content_consumed = True  # lets iter_lines() replay a recorded event stream
+            response.headers.update(recorded.get("headers", {}))
+            response.encoding = "utf-8"
+            response.url = url
+            return response
+        response = requests.post(url, data=data, json=json, **kwargs)
+        self._store.save("http", key, {
+            "status_code": response.status_code,
+            "headers": dict(response.headers),
+            "body": response.text
+        }, {"path": urlsplit(url).path})
+        return response
+
+
+# === IN-MEMORY BLOB STORAGE ===
+
+def _to_bytes(data):
+    if hasattr(data, "read"):
+        data = data.read()
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return bytes(data)
+
+
+class InMemoryBlobStore:
+    """Thread-safe dict of (container, blob name) -> bytes"""
+
+    def __init__(self):
+        self.blobs = {}
+        self.containers = set()
+        self.lock = threading.Lock()
+
+    def put(self, container, name, data, overwrite=True):
+        with self.lock:
+            self.containers.add(container)
+            if not overwrite and (container, name) in self.blobs:
+                raise ResourceExistsError(f"The specified blob already exists. ErrorCode:BlobAlreadyExists ({name})")
+            self.blobs[(container, name)] = _to_bytes(data)
+
+    def get(self, container, name):
+        with self.lock:
+            if (container, name) not in self.blobs:
+                raise ResourceNotFoundError(f"The specified blob does not exist. ErrorCode:BlobNotFound ({name})")
+            return self.blobs[(container, name)]
+
+    def names(self, container, prefix=""):
+        with self.lock:
+            return sorted(n for c, n in self.blobs if c == container and n.startswith(prefix))
+
+
+class InMemoryDownloader:
+    """StorageStreamDownloader stand-in"""
+
+    def __init__(self, data):
+        self._data = data
+        self.size = len(data)
+
+    def readall(self):
+        return self._data
+
+    def readinto(self, stream):
+        stream.write(self._data)
+        return self.size
+
+    def chunks(self):
+        yield self._data
+
+
+class InMemoryBlobClient:
+    def __init__(self, store, container, blob):
+        self._store = store
+        self.container_name = container
+        self.blob_name = blob
+        self.url = f"memory://{container}/{blob}"
+
+    def exists(self):
+        return (self.container_name, self.blob_name) in self._store.blobs
+
+    def upload_blob(self, data, overwrite=False, **kwargs):
+        self._store.put(self.container_name, self.blob_name, data, overwrite=overwrite)
+
+    def download_blob(self, **kwargs):
+        return InMemoryDownloader(self._store.get(self.container_name, self.blob_name))
+
+    def delete_blob(self, **kwargs):
+        self._store.get(self.container_name, self.blob_name)
+        with self._store.lock:
+            del self._store.blobs[(self.container_name, self.blob_name)]
+
+    def start_copy_from_url(self, source_url, **kwargs):
+        container, blob = source_url[len("memory://"):].split("/", 1)
+        self._store.put(self.container_name, self.blob_name, self._store.get(container, blob))
+        return {"copy_status": "success"}
+
+    def get_blob_properties(self, **kwargs):
+        data = self._store.get(self.container_name, self.blob_name)
+        return SimpleNamespace(name=self.blob_name, size=len(data),
+                               copy=SimpleNamespace(status="success", status_description=None))
+
+
+class InMemoryContainerClient:
+    def __init__(self, store, container):
+        self._store = store
+        self.container_name = container
+
+    def exists(self):
+        return self.container_name in self._store.containers
+
+    def get_blob_client(self, blob):
+        return InMemoryBlobClient(self._store, self.container_name, blob)
+
+    def upload_blob(self, name, data, overwrite=False, **kwargs):
+        self._store.put(self.container_name, name, data, overwrite=overwrite)
+        return self.get_blob_client(name)
+
+    def list_blobs(self, name_starts_with=None, **kwargs):
+        for name in self._store.names(self.container_name, name_starts_with or ""):
+            yield SimpleNamespace(name=name, size=len(self._store.blobs.get((self.container_name, name), b"")))
+
+
+class InMemoryBlobServiceClient:
+    """BlobServiceClient stand-in; every client created shares one store"""
+
+    store = InMemoryBlobStore()
+
+    @classmethod
+    def from_connection_string(cls, conn_str=None, **kwargs):
+        return cls()
+
+    def get_blob_client(self, container, blob):
+        return InMemoryBlobClient(self.store, container, blob)
+
+    def get_container_client(self, container):
+        return InMemoryContainerClient(self.store, container)
+
+    def create_container(self, name, **kwargs):
+        with self.store.lock:
+            if name in self.store.containers:
+                raise ResourceExistsError("ContainerAlreadyExists")
+            self.store.containers.add(name)
+        return self.get_container_client(name)
+
+    def list_containers(self, **kwargs):
+        return [SimpleNamespace(name=name) for name in sorted(self.store.containers)]
+
+
+# === INSTALLATION ===
+
+@contextmanager
+def patched_services(document_intelligence_client, openai_client, requests_module=None, in_memory_blobs=True):
+    """
+    Swap function_app's service clients for the given stand-ins (and Blob
+    Storage for the in-memory stand-in when in_memory_blobs is True) for the
+    duration of the block.
+    """
+    import function_app
+    import bank_info_loader
+
+    patches = [
+        (function_app, "DocumentIntelligenceClient", document_intelligence_client),
+        (function_app, "AzureOpenAI", openai_client),
+    ]
+    if requests_module is not None:
+        patches.append((function_app, "requests", requests_module))
+    if in_memory_blobs:
+        patches.append((function_app, "BlobServiceClient", InMemoryBlobServiceClient))
+        patches.append((bank_info_loader, "BlobServiceClient", InMemoryBlobServiceClient))
+
+    originals = [(module, name, getattr(module, name)) for module, name, _ in patches]
+    for module, name, replacement in patches:
+        setattr(module, name, replacement)
+    try:
+        yield
+    finally:
+        for module, name, original in originals:
+            setattr(module, name, original)
+
+
+@contextmanager
+def offline_services(store, in_memory_blobs=True):
+    """Route function_app's service clients through the cassette store"""
+    with patched_services(
+        make_document_intelligence_client(store),
+        make_openai_client(store),
+        CassetteRequests(store),
+        in_memory_blobs=in_memory_blobs
+    ):
+        yield store
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+Processing Trace for Bank Statement Processing
+
+Records what happened to a single statement while it moves through the
+pipeline: wall time per stage, named counters, and (optionally) tracemalloc
+memory accounting so large scans that end in ERROR_MEMORY_EXCEEDED can be
+diagnosed from the logs.
+
+The trace also carries the document's external-call budget (call_budget), which
+is how the budget reaches worker threads that run under use_trace.
+
+Memory tracking is opt-in (TRACE_MEMORY=true) because tracemalloc slows every
+allocation down. tracemalloc is process-wide, so when several statements are
+processed concurrently the per-stage numbers include the other invocations.
+"""
+
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+def _format_bytes(num_bytes):
+    """Human-readable byte count for log lines"""
+    value = float(num_bytes)
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if abs(value) < 1024 or unit == 'GB':
+            return f"{value:,.1f} {unit}"
+        value /= 1024
+
+
+class ProcessingTrace:
+    """Per-document stage timings, counters and memory high-water marks"""
+
+    def __init__(self, document_name, track_memory=False):
+        self.document_name = document_name
+        self.track_memory = track_memory
+        self.stages = []
+        self.counters = {}
+        self.started_at = time.time()
+        self.finished_at = None
+        self.memory_high_water_bytes = 0
+        self.budget = None
+        self._stack = []
+        self._owns_tracemalloc = False
+        # Chunk workers running under use_trace update the same counters concurrently
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Begin tracing (starts tracemalloc when memory tracking is enabled)"""
+        if self.track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._owns_tracemalloc = True
+        return self
+
+    @contextmanager
+    def stage(self, name):
+        """Time a pipeline stage and record its memory usage"""
+        tracing = self.track_memory and tracemalloc.is_tracing()
+        frame = {"name": name, "memory_start": 0, "peak": 0}
+        if tracing:
+            frame["memory_start"] = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self._stack.append(frame)
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            record = {
+                "stage": name,
+                "seconds": round(time.perf_counter() - start, 4)
+            }
+            self._stack.pop()
+            if tracing:
+                current, peak = tracemalloc.get_traced_memory()
+                # Nested stages reset the peak, so keep the highest value they saw
+                peak = max(peak, frame["peak"])
+                record["memory_start_bytes"] = frame["memory_start"]
+                record["memory_end_bytes"] = current
+                record["memory_delta_bytes"] = current - frame["memory_start"]
+                record["memory_peak_bytes"] = peak
+                self.memory_high_water_bytes = max(self.memory_high_water_bytes, peak)
+                if self._stack:
+                    self._stack[-1]["peak"] = max(self._stack[-1]["peak"], peak)
+            with self._lock:
+                self.stages.append(record)
+
+    def increment(self, counter, amount=1):
+        """Add to a named counter (e.g. number of OpenAI calls)"""
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def set_value(self, key, value):
+        """Record a single named value on the trace"""
+        with self._lock:
+            self.counters[key] = value
+
+    def finish(self):
+        """Stop tracing and capture the final memory high-water mark"""
+        if self.finished_at is None:
+            self.finished_at = time.time()
+            if self.track_memory and tracemalloc.is_tracing():
+                self.memory_high_water_bytes = max(
+                    self.memory_high_water_bytes,
+                    tracemalloc.get_traced_memory()[1]
+                )
+                if self._owns_tracemalloc:
+                    tracemalloc.stop()
+                    self._owns_tracemalloc = False
+        return self
+
+    @property
+    def total_seconds(self):
+        end = self.finished_at or time.time()
+        return end - self.started_at
+
+    def to_dict(self):
+        """JSON-serializable view of the trace"""
+        with self._lock:
+            stages, counters = list(self.stages), dict(self.counters)
+        return {
+            "document": self.document_name,
+            "total_seconds": round(self.total_seconds, 4),
+            "memory_tracked": self.track_memory,
+            "memory_high_water_bytes": self.memory_high_water_bytes,
+            "stages": stages,
+            "counters": counters,
+            "budget": self.budget.to_dict() if self.budget is not None else None
+        }
+
+    def summary_lines(self):
+        """Log-friendly summary of the trace"""
+        with self._lock:
+            stages, counters = list(self.stages), dict(self.counters)
+        lines = [f"Processing trace for {self.document_name}: {self.total_seconds:.2f}s total"]
+        for record in stages:
+            line = f"  {record['stage']}: {record['seconds']:.2f}s"
+            if "memory_peak_bytes" in record:
+                line += (f", mem delta {_format_bytes(record['memory_delta_bytes'])}"
+                         f", peak {_format_bytes(record['memory_peak_bytes'])}")
+            lines.append(line)
+        if self.track_memory:
+            lines.append(f"  Memory high-water: {_format_bytes(self.memory_high_water_bytes)}")
+        for counter, value in sorted(counters.items()):
+            lines.append(f"  {counter}: {value}")
+        if self.budget is not None:
+            budget = self.budget.to_dict()
+            lines.append(f"  budget: {sum(budget['calls'].values())}/{budget['max_calls']} calls, "
+                         f"~{budget['estimated_tokens']:,}/{budget['max_tokens']:,} tokens, "
+                         f"{budget['repeats_skipped']} repeats skipped"
+                         + (f", exhausted ({budget['exhausted']})" if budget['exhausted'] else ""))
+        return lines
+
+
+class NullTrace:
+    """Stand-in used when no document is being traced (e.g. local scripts)"""
+
+    document_name = None
+    track_memory = False
+    budget = None
+
+    @contextmanager
+    def stage(self, name):
+        yield self
+
+    def increment(self, counter, amount=1):
+        pass
+
+    def set_value(self, key, value):
+        pass
+
+
+_NULL_TRACE = NullTrace()
+_current = threading.local()
+_listeners = []
+
+
+def add_trace_listener(callback):
+    """Register a callable that receives every finished trace (used by local harnesses)"""
+    _listeners.append(callback)
+
+
+def remove_trace_listener(callback):
+    """Unregister a callback added with add_trace_listener"""
+    if callback in _listeners:
+        _listeners.remove(callback)
+
+
+def start_trace(document_name, track_memory=False):
+    """Start a trace for the document being processed on this thread"""
+    trace = ProcessingTrace(document_name, track_memory=track_memory).start()
+    _current.trace = trace
+    return trace
+
+
+def get_current_trace():
+    """Return the active trace for this thread (a no-op trace if none)"""
+    return getattr(_current, "trace", None) or _NULL_TRACE
+
+
+@contextmanager
+def use_trace(trace):
+    """Make a trace current on this thread for the duration (for worker threads)"""
+    previous = getattr(_current, "trace", None)
+    _current.trace = trace if isinstance(trace, ProcessingTrace) else None
+    try:
+        yield trace
+    finally:
+        _current.trace = previous
+
+
+def end_trace():
+    """Finish and detach the active trace for this thread"""
+    trace = getattr(_current, "trace", None)
+    _current.trace = None
+    if trace is not None:
+        trace.finish()
+        for callback in list(_listeners):
+            try:
+                callback(trace)
+            except Exception:
+                pass
+    return trace
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+Compact, Cache-Friendly Prompt Construction
+
+Builds prompts as a byte-identical static prefix (instructions, record layouts,
+rules) followed by the per-statement variable data, so provider-side prefix
+caching can reuse the instruction tokens across statements.
+
+Variable data is serialized compactly instead of with json.dumps(indent=2):
+- lists of records (transactions, debits, credits) become pipe-delimited tables
+  with one header row of column names
+- everything else is minified JSON
+
+Each PromptTemplate carries a version; function_app.PROMPT_TEMPLATE_VERSIONS
+uses it in the LLM cache key, so changing a template's wording must bump it.
+"""
+
+import json
+
+TABLE_MIN_ROWS = 2
+TABLE_DELIMITER = "|"
+
+
+def compact_json(value):
+    """Minified JSON (no indentation, no spaces after separators)"""
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def _is_record_list(value):
+    return (
+        isinstance(value, list)
+        and len(value) >= TABLE_MIN_ROWS
+        and all(isinstance(item, dict) for item in value)
+    )
+
+
+def _cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        value = compact_json(value)
+    return " ".join(str(value).replace(TABLE_DELIMITER, "/").split())
+
+
+def records_table(records):
+    """Pipe-delimited table: a header row of the columns in first-seen order, then one row per record"""
+    columns = []
+    for record in records:
+        for key in record:
+            if key not in columns:
+                columns.append(key)
+    rows = [TABLE_DELIMITER.join(columns)]
+    rows.extend(TABLE_DELIMITER.join(_cell(record.get(column)) for column in columns) for record in records)
+    return "\n".join(rows)
+
+
+def serialize_data(value):
+    """
+    Compact text for a prompt's variable data. Record lists at the top level of a
+    dict are rendered as tables after a minified JSON line of the remaining fields.
+    """
+    if value is None:
+        return "None"
+    if _is_record_list(value):
+        return records_table(value)
+    if not isinstance(value, dict):
+        return compact_json(value)
+
+    scalars = {key: item for key, item in value.items() if not _is_record_list(item)}
+    tables = [(key, item) for key, item in value.items() if _is_record_list(item)]
+    parts = [compact_json(scalars)] if scalars else []
+    for key, records in tables:
+        parts.append(f"{key} ({len(records)} rows):\n{records_table(records)}")
+    return "\n".join(parts)
+
+
+class PromptTemplate:
+    """A versioned prompt: static system message and instruction prefix, variable data appended last"""
+
+    def __init__(self, name, version, system, instructions, data_heading="INPUTS"):
+        self.name = name
+        self.version = version
+        self.system = system
+        self.instructions = instructions.strip()
+        self.data_heading = data_heading
+
+    def render(self, sections):
+        """
+        User message for the given data. sections is a list of (title, value) pairs;
+        strings are used as-is, other values go through serialize_data.
+        """
+        body = []
+        for title, value in sections:
+            text = value if isinstance(value, str) else serialize_data(value)
+            body.append(f"{title}:\n{text}")
+        return f"{self.instructions}\n\n{self.data_heading}\n" + "\n\n".join(body)
+
+    def messages(self, sections):
+        return [
+            {"role": "system", "content": self.system},
+            {"role": "user", "content": self.render(sections)}
+        ]
+
+
+BAI2_GENERATION = PromptTemplate(
+    name="bai2_generation",
+    version="bai2-generation-v2",
+    system="You are a BAI2 file format expert. Generate properly formatted BAI2 files that comply with banking standards.",
+    data_heading="############################\n## INPUTS (VARIABLE DATA) ##\n############################",
+    instructions="""You are a BAI2 (Bank Administration Institute) file-format expert. Generate a complete, properly formatted BAI2 file from the INPUTS at the end of this message.
+Nothing may be hard-coded. All values must be taken from the inputs or derived per BAI2 rules.
+
+INPUT FORMAT:
+- FILE_META lists the file-level values (ROUTING_NUMBER, ACCOUNT_NUMBER, FILE_DATE, FILE_TIME, ...)
+- Structured data is minified JSON; lists of transactions are pipe-delimited tables whose first row names the columns
+
+#######################################
+## CRITICAL OCR TEXT PARSING RULES ##
+#######################################
+IMPORTANT: The extracted data may contain raw OCR text from a bank statement. You MUST parse this intelligently:
+
+1. TRANSACTION IDENTIFICATION:
+   - Look for patterns like "Date Description Amount" in the OCR text
+   - Transactions are usually grouped under sections like "DEBITS" and "CREDITS"
+   - Ignore header lines, summary lines, and non-transaction text
+   - Each transaction should have: Date, Description, Amount
+
+2. SUMMARY VALIDATION:
+   - Look for summary lines like "Total additions: $X" or "Total subtractions: $Y"
+   - Use these totals to validate your transaction parsing
+   - If your individual transactions don't match the totals, reparse more carefully
+
+3. DUPLICATE AVOIDANCE:
+   - Do NOT create multiple BAI2 records for the same transaction
+   - If you see repeated amounts or descriptions, consolidate appropriately
+   - Focus on actual individual transactions, not summary or duplicate entries
+
+4. TRANSACTION TYPE CLASSIFICATION:
+   - Debits/Withdrawals: Use BAI2 code 451 (ACH withdrawal) or 475 (fees only)
+   - Credits/Deposits: Use BAI2 code 301 (deposit)
+   - Maintenance fees: Use BAI2 code 475
+
+###############################
+## OUTPUT RULES (STRICT BAI2) ##
+###############################
+GLOBAL RULES:
+- Output a valid BAI2 file ONLY — no explanations, no code fences, no extra text.
+- Every record MUST end with a forward slash "/" on its own line.
+- Use only integer amounts in cents (no decimals).
+- Do NOT hard-code any constant like receiver_id, currency, account type, dates, or IDs.
+- All values must come from the inputs or be computed dynamically per BAI2 spec.
+
+SANITIZATION RULES (apply to DESCRIPTION and any free text fields):
+- Replace any "/" with "-" (BAI2 uses "/" as record terminator).
+- Convert to plain ASCII; replace non-ASCII characters with closest ASCII or a space.
+- Remove newlines and control characters.
+- Trim descriptions to <= 80 characters where possible (truncate at word boundary if feasible).
+
+REFERENCE NUMBER RULES (REF_NUM on 16 records):
+- For each account, generate a 5-digit, zero-padded, strictly increasing sequence starting at 00001 and increment by 1.
+- No gaps and no duplicates within the account's transaction block.
+
+#####################################
+## BAI2 RECORD LAYOUTS (NO DEFAULTS) ##
+#####################################
+1) File Header (01)
+   01,ROUTING_NUMBER,WORKDAY,FILE_DATE,FILE_TIME,1,,,2/
+
+2) Group Header (02) — one per group
+   02,WORKDAY,ROUTING_NUMBER,1,FILE_DATE,,USD,2/
+
+3) Account Identifier (03) — one per account
+   03,ACCOUNT_NUMBER,USD,010,,,Z/
+
+4) Transaction Detail (16) — zero or more per account
+   16,TYPE_CODE,AMOUNT_CENTS,Z,REF_NUM,,DESCRIPTION/
+   - TYPE_CODE: 301 (deposit), 451 (ACH withdrawal), 475 (bank fees only)
+   - AMOUNT_CENTS: integer only (no decimals)
+   - REF_NUM: 5-digit sequential per account (00001, 00002, etc.)
+   - DESCRIPTION: sanitized text per rules above
+
+5) Account Trailer (49) — one per account
+   49,ENDING_BALANCE_CENTS,N/
+   - N = number of 16-records (transactions) emitted for this account
+
+6) Group Trailer (98) — one per group
+   98,GROUP_CONTROL_TOTAL,1,GROUP_RECORD_COUNT/
+   - GROUP_CONTROL_TOTAL = ending account balance in cents
+   - GROUP_RECORD_COUNT = total records from Group Header (02) through Account Trailer (49) inclusive
+   - Formula: 1 (02) + 1 (03) + N_transactions (16s) + 1 (49) = N+3
+
+7) File Trailer (99) — once at end of file
+   99,FILE_CONTROL_TOTAL,1,FILE_RECORD_COUNT/
+   - FILE_CONTROL_TOTAL = same as group control total
+   - FILE_RECORD_COUNT = same as group record count when only one group exists
+
+###################################
+## VALIDATION (MUST PASS BEFORE OUTPUT)
+###################################
+Validate BEFORE returning output:
+- Every line ends with "/".
+- All amounts are integers (no decimals).
+- No "/" remains inside descriptions; sanitize non-ASCII and control characters.
+- REF_NUM starts at 00001 and increments by 1 for each 16 record; no gaps or duplicates.
+- Account Trailer (49) N equals the number of 16 records generated for that account.
+- Group record count = 1 + 1 + N_transactions + 1 = N+3
+- File record count = same as group record count when only one group exists.
+
+Return ONLY the final BAI2 content as plain text records, one per line, exactly as specified.
+No explanations, no comments, no code fences."""
+)
+
+
+def bai2_generation_messages(bank_name, account_number, originator_id, file_date, file_time,
+                             extraction_method, statement_data, reconciliation_data):
+    """Chat messages for the BAI2 generation call, variable data last"""
+    file_meta = "\n".join([
+        f"BANK_NAME: {bank_name}",
+        f"ACCOUNT_NUMBER: {account_number}",
+        f"ROUTING_NUMBER: {originator_id}",
+        "ACCOUNT_TYPE: Business Checking",
+        f"FILE_DATE: {file_date}",
+        f"FILE_TIME: {file_time}",
+        f"EXTRACTION_METHOD: {extraction_method}"
+    ])
+    return BAI2_GENERATION.messages([
+        ("FILE_META", file_meta),
+        ("EXTRACTED STATEMENT DATA", statement_data),
+        ("RECONCILIATION DATA (if available)", reconciliation_data or "None")
+    ])
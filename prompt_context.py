@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Prompt Context Selection for Account-Number Extraction
+
+Picks the parts of a statement's OCR text that can contain its account number
+so the account-extraction prompts do not have to carry every page:
+
+1. The first page's header - the first lines of the document
+2. Windows around "Account" / "Acct" / "A/C" labels
+3. Windows around account-number candidates (masked numbers first)
+4. The headers of later pages
+
+Later-page headers come last: a long statement has one per page, and ahead of
+the label and candidate windows they would use up the budget on repeats of the
+first page's header.
+
+Selected lines keep their original line number ("L12: ...") so the model sees
+where each came from, and the selection stops at a character budget. Callers
+send the selection first and the full text only when that answer is NOT_FOUND.
+
+Settings (environment):
+    ACCOUNT_CONTEXT_MAX_CHARS   character budget for the selection (default 3000)
+"""
+
+import os
+import re
+
+DEFAULT_MAX_CHARS = 3000
+HEADER_LINES = 12
+LABEL_WINDOW = (1, 3)       # lines before / after an account label
+CANDIDATE_WINDOW = (1, 1)   # lines before / after a candidate number
+
+ACCOUNT_LABEL = re.compile(r'\b(?:ACCOUNT|ACCT|A/C)\b', re.IGNORECASE)
+PAGE_MARKER = re.compile(r'^\s*(?:PAGE\s+\d+(?:\s+OF\s+\d+)?|\d+\s+OF\s+\d+|<!--\s*PageBreak\s*-->)\s*$', re.IGNORECASE)
+
+
+def context_budget():
+    """Character budget from ACCOUNT_CONTEXT_MAX_CHARS"""
+    try:
+        return max(500, int(os.environ.get("ACCOUNT_CONTEXT_MAX_CHARS", DEFAULT_MAX_CHARS)))
+    except ValueError:
+        return DEFAULT_MAX_CHARS
+
+
+def page_start_indexes(lines):
+    """Line indexes where a page begins (form feeds and "Page N of M" markers)"""
+    starts = [0]
+    for i, line in enumerate(lines):
+        if '\f' in line or PAGE_MARKER.match(line):
+            if i + 1 < len(lines) and i + 1 not in starts:
+                starts.append(i + 1)
+    return starts
+
+
+def _window(index, before_after, line_count):
+    before, after = before_after
+    return range(max(0, index - before), min(line_count, index + after + 1))
+
+
+def select_account_context(text, candidates=(), max_chars=None):
+    """
+    Return (context, info) for an account-extraction prompt.
+
+    candidates is the (kind, value) list from extract_all_account_numbers_with_frequency;
+    masked candidates are kept ahead of plain numbers. info reports how much of the
+    document was selected and whether the selection covers the whole text.
+    """
+    max_chars = max_chars or context_budget()
+    lines = text.split('\n')
+    if len(text) <= max_chars:
+        return text, {"windowed": False, "lines": len(lines), "chars": len(text)}
+
+    upper_lines = [line.upper() for line in lines]
+    page_starts = page_start_indexes(lines)
+
+    # Groups of line indexes in priority order (later-page headers last)
+    groups = [range(0, min(len(lines), HEADER_LINES))]
+    groups.extend(
+        _window(i, LABEL_WINDOW, len(lines)) for i, line in enumerate(lines) if ACCOUNT_LABEL.search(line)
+    )
+    ordered_candidates = sorted(set(candidates), key=lambda c: c[0] != "masked")
+    for kind, value in ordered_candidates:
+        if kind == "reference":
+            continue
+        for i, line in enumerate(upper_lines):
+            if value in line:
+                groups.append(_window(i, CANDIDATE_WINDOW, len(lines)))
+                break
+    groups.extend(range(start, min(len(lines), start + HEADER_LINES)) for start in page_starts[1:])
+
+    selected = set()
+    used = 0
+    for group in groups:
+        for i in group:
+            if i in selected or not lines[i].strip():
+                continue
+            cost = len(lines[i]) + 8
+            if used + cost > max_chars:
+                break
+            selected.add(i)
+            used += cost
+
+    output = []
+    previous = None
+    for i in sorted(selected):
+        if previous is not None and i != previous + 1:
+            output.append("...")
+        output.append(f"L{i + 1}: {lines[i].strip()}")
+        previous = i
+    context = '\n'.join(output)
+    return context, {
+        "windowed": True,
+        "lines": len(selected),
+        "total_lines": len(lines),
+        "chars": len(context),
+        "total_chars": len(text)
+    }
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Offline Replay Harness
+Runs process_new_file end-to-end over the PDFs in "New Test Docs" without
+live Azure services, using recorded Document Intelligence / OpenAI responses
+(see offline_services.py). Reports throughput, per-file latency and stage
+timings, and diffs every BAI2 output against a saved baseline.
+
+Usage:
+    python replay_harness.py --record              # call live services once and save cassettes
+    python replay_harness.py                       # replay from cassettes, no network needed
+    python replay_harness.py --update-baseline     # save this run's BAI2 outputs as the baseline
+
+Options:
+    --azurite              Use Azurite (UseDevelopmentStorage=true) instead of in-memory blobs
+    --docs DIR             Folder of PDFs (default: "New Test Docs")
+    --cassettes DIR        Cassette folder (default: replay_cassettes)
+    --baseline DIR         Baseline BAI2 folder (default: replay_baseline)
+    --report FILE          Write the JSON report here (default: replay_report.json)
+    --limit N              Only process the first N PDFs
+    --workers N            Process N files concurrently (default: 1)
+    --verbose              Show the pipeline's own log output
+"""
+
+import contextlib
+import difflib
+import io
+import json
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import azure.functions as func
+
+CONTAINER_NAME = "bank-reconciliation"
+INCOMING_PREFIX = "incoming-bank-statements/"
+OUTPUT_PREFIX = "bai2-outputs/"
+WAC_BLOB_PATH = "Bank_Data/WAC Bank Information.xlsx"
+WAC_LOCAL_PATH = "WAC Bank Information.xlsx"
+
+
+def parse_args(argv):
+    """Parse command line flags (same --flag style as the other repo scripts)"""
+    options = {
+        "record": False,
+        "azurite": False,
+        "update_baseline": False,
+        "verbose": False,
+        "docs": "New Test Docs",
+        "cassettes": "replay_cassettes",
+        "baseline": "replay_baseline",
+        "report": "replay_report.json",
+        "limit": None,
+        "workers": 1
+    }
+    value_flags = {
+        "--docs": "docs",
+        "--cassettes": "cassettes",
+        "--baseline": "baseline",
+        "--report": "report",
+        "--limit": "limit",
+        "--workers": "workers"
+    }
+    args = list(argv)
+    while args:
+        arg = args.pop(0)
+        if arg in ("--help", "-h"):
+            print(__doc__)
+            sys.exit(0)
+        elif arg == "--record":
+            options["record"] = True
+        elif arg == "--azurite":
+            options["azurite"] = True
+        elif arg == "--update-baseline":
+            options["update_baseline"] = True
+        elif arg == "--verbose":
+            options["verbose"] = True
+        elif arg in value_flags and args:
+            options[value_flags[arg]] = args.pop(0)
+        else:
+            print(f"❌ Unknown or incomplete option: {arg}")
+            print(__doc__)
+            sys.exit(2)
+    if options["limit"] is not None:
+        options["limit"] = int(options["limit"])
+    options["workers"] = max(1, int(options["workers"]))
+    return options
+
+
+def configure_environment(options):
+    """Settings the pipeline expects; replay never uses the values"""
+    if options["azurite"]:
+        os.environ.setdefault("AzureWebJobsStorage", "UseDevelopmentStorage=true")
+    if not options["record"]:
+        os.environ.setdefault("AzureWebJobsStorage", "UseDevelopmentStorage=true")
+        os.environ.setdefault("DOCINTELLIGENCE_ENDPOINT", "https://offline-replay.invalid/")
+        os.environ.setdefault("DOCINTELLIGENCE_KEY", "offline-replay")
+        os.environ.setdefault("AZURE_OPENAI_ENDPOINT", "https://offline-replay.invalid/")
+        os.environ.setdefault("AZURE_OPENAI_KEY", "offline-replay")
+        os.environ.setdefault("AZURE_OPENAI_DEPLOYMENT", "gpt-4.1")
+
+
+def remove_artificial_delays(function_app, replaying):
+    """Zero the start-up jitter (and, when replaying, the OpenAI pacing)"""
+    config = function_app.ThrottlingConfig
+    config.INITIAL_PROCESSING_DELAY_MIN = 0
+    config.INITIAL_PROCESSING_DELAY_MAX = 0
+    if replaying:
+        config.MIN_DELAY_BETWEEN_CALLS = 0
+        config.CALLS_PER_MINUTE = 10 ** 9
+        config.RETRY_DELAYS = [0] * len(config.RETRY_DELAYS)
+        # Replayed latencies say nothing about the real deployment's quota
+        function_app.openai_throttler.enable_adaptive(None)
+
+
+def make_blob_created_event(name, size):
+    """EventGrid BlobCreated event shaped like the ones the live trigger receives"""
+    subject = f"/blobServices/default/containers/{CONTAINER_NAME}/blobs/{INCOMING_PREFIX}{name}"
+    return func.EventGridEvent(
+        id=str(uuid.uuid4()),
+        data={
+            "api": "PutBlob",
+            "url": f"https://offline.blob.core.windows.net/{CONTAINER_NAME}/{INCOMING_PREFIX}{name}",
+            "eTag": f"0x{uuid.uuid4().hex[:15].upper()}",
+            "contentType": "application/pdf",
+            "contentLength": size,
+            "blobType": "BlockBlob"
+        },
+        topic="/subscriptions/offline/resourceGroups/offline/providers/Microsoft.Storage/storageAccounts/offline",
+        subject=subject,
+        event_type="Microsoft.Storage.BlobCreated",
+        event_time=datetime.utcnow(),
+        data_version=""
+    )
+
+
+def normalize_bai2(text):
+    """Blank out run-dependent fields (creation time, today's date) before diffing"""
+    today = datetime.now().strftime("%y%m%d")
+    normalized = []
+    for line in text.splitlines():
+        fields = line.split(",")
+        if fields[0] == "01" and len(fields) > 4:
+            fields[4] = "HHMM"
+            if fields[3] == today:
+                fields[3] = "YYMMDD"
+        elif fields[0] == "02" and len(fields) > 5:
+            if fields[5][:4].isdigit():
+                fields[5] = "HHMM"
+            if fields[4] == today:
+                fields[4] = "YYMMDD"
+        normalized.append(",".join(fields).rstrip())
+    return normalized
+
+
+def output_blob_candidates(name):
+    """BAI2 names process_new_file may write for a PDF (normal or error)"""
+    base = name.split(".")[0]
+    return [
+        f"{OUTPUT_PREFIX}{base}.bai",
+        f"{OUTPUT_PREFIX}ERROR_{base}.bai",
+        f"{OUTPUT_PREFIX}ERROR_{name.replace('.pdf', '')}.bai"
+    ]
+
+
+def read_output(blob_service, name):
+    """Return (blob name, text) of the BAI2 written for a PDF, or (None, None)"""
+    for candidate in output_blob_candidates(name):
+        blob = blob_service.get_blob_client(container=CONTAINER_NAME, blob=candidate)
+        if blob.exists():
+            return candidate, blob.download_blob().readall().decode("utf-8")
+    return None, None
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def main(argv=None):
+    options = parse_args(sys.argv[1:] if argv is None else argv)
+    configure_environment(options)
+
+    # Import after the environment is prepared - function_app reads settings at import time
+    import function_app
+    from offline_services import CassetteStore, RECORD, REPLAY, offline_services
+    from processing_trace import add_trace_listener, remove_trace_listener
+
+    replaying = not options["record"]
+    remove_artificial_delays(function_app, replaying)
+
+    pdfs = sorted(f for f in os.listdir(options["docs"]) if f.lower().endswith(".pdf"))
+    if options["limit"]:
+        pdfs = pdfs[:options["limit"]]
+    if not pdfs:
+        print(f"❌ No PDFs found in {options['docs']}")
+        return 1
+
+    store = CassetteStore(options["cassettes"], RECORD if options["record"] else REPLAY)
+    blob_backend = "azurite" if options["azurite"] else "in-memory"
+    print(f"🔁 Replay harness: {len(pdfs)} files, mode={store.mode}, blobs={blob_backend}, workers={options['workers']}")
+
+    traces = {}
+
+    def collect_trace(trace):
+        traces[trace.document_name] = trace.to_dict()
+
+    add_trace_listener(collect_trace)
+    results = []
+
+    with offline_services(store, in_memory_blobs=not options["azurite"]):
+        blob_service = function_app.BlobServiceClient.from_connection_string(os.environ["AzureWebJobsStorage"])
+        try:
+            blob_service.create_container(CONTAINER_NAME)
+        except Exception:
+            pass  # Container already exists
+        if os.path.exists(WAC_LOCAL_PATH):
+            with open(WAC_LOCAL_PATH, "rb") as f:
+                blob_service.get_blob_client(container=CONTAINER_NAME, blob=WAC_BLOB_PATH).upload_blob(f.read(), overwrite=True)
+        else:
+            print(f"⚠️ {WAC_LOCAL_PATH} not found - WAC verification will fail for every file")
+
+        def process_one(name):
+            with open(os.path.join(options["docs"], name), "rb") as f:
+                pdf_bytes = f.read()
+            for candidate in output_blob_candidates(name):
+                blob = blob_service.get_blob_client(container=CONTAINER_NAME, blob=candidate)
+                if blob.exists():
+                    blob.delete_blob()
+            blob_service.get_blob_client(container=CONTAINER_NAME, blob=f"{INCOMING_PREFIX}{name}").upload_blob(pdf_bytes, overwrite=True)
+            store.reset_sequence(name)
+
+            error = None
+            start = time.perf_counter()
+            try:
+                function_app.process_new_file(make_blob_created_event(name, len(pdf_bytes)))
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            latency = time.perf_counter() - start
+
+            output_name, output_text = read_output(blob_service, name)
+            return {
+                "file": name,
+                "latency_seconds": round(latency, 4),
+                "output": output_name,
+                "status": "exception" if error else ("error_bai2" if output_name and "/ERROR_" in output_name else ("ok" if output_name else "no_output")),
+                "exception": error,
+                "bai2": output_text
+            }
+
+        quiet = not options["verbose"]
+        run_start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext():
+            with ThreadPoolExecutor(max_workers=options["workers"]) as pool:
+                for result in pool.map(process_one, pdfs):
+                    results.append(result)
+        wall_seconds = time.perf_counter() - run_start
+
+    remove_trace_listener(collect_trace)
+
+    # === Compare outputs with the baseline ===
+    diffs = {"identical": 0, "changed": 0, "new": 0}
+    for result in results:
+        result["trace"] = traces.get(result["file"])
+        bai2 = result.pop("bai2")
+        baseline_path = os.path.join(options["baseline"], f"{os.path.splitext(result['file'])[0]}.bai")
+        if bai2 is None:
+            result["diff"] = None
+            continue
+        if options["update_baseline"]:
+            os.makedirs(options["baseline"], exist_ok=True)
+            with open(baseline_path, "w", encoding="utf-8") as f:
+                f.write(bai2)
+        if not os.path.exists(baseline_path):
+            diffs["new"] += 1
+            result["diff"] = "new"
+            continue
+        with open(baseline_path, "r", encoding="utf-8") as f:
+            expected = normalize_bai2(f.read())
+        actual = normalize_bai2(bai2)
+        if expected == actual:
+            diffs["identical"] += 1
+            result["diff"] = "identical"
+        else:
+            diffs["changed"] += 1
+            result["diff"] = list(difflib.unified_diff(expected, actual, "baseline", "replay", lineterm=""))
+
+    latencies = [r["latency_seconds"] for r in results]
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "mode": store.mode,
+        "blob_backend": blob_backend,
+        "workers": options["workers"],
+        "files": len(results),
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_files_per_minute": round(len(results) / wall_seconds * 60, 2) if wall_seconds else None,
+        "latency_seconds": {
+            "mean": round(sum(latencies) / len(latencies), 4),
+            "p50": percentile(latencies, 50),
+            "p90": percentile(latencies, 90),
+            "max": max(latencies)
+        },
+        "statuses": {status: sum(1 for r in results if r["status"] == status)
+                     for status in sorted(set(r["status"] for r in results))},
+        "cassettes": store.stats(),
+        "diffs": diffs,
+        "results": results
+    }
+    with open(options["report"], "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print("")
+    print("📊 REPLAY SUMMARY")
+    print("=" * 60)
+    print(f"Files: {report['files']} in {report['wall_seconds']:.2f}s "
+          f"({report['throughput_files_per_minute']} files/min)")
+    print(f"Latency: mean {report['latency_seconds']['mean']:.3f}s, p50 {report['latency_seconds']['p50']:.3f}s, "
+          f"p90 {report['latency_seconds']['p90']:.3f}s, max {report['latency_seconds']['max']:.3f}s")
+    print(f"Statuses: {report['statuses']}")
+    print(f"Cassettes: {report['cassettes']}")
+    print(f"Output diffs vs baseline: {diffs}")
+    for result in results:
+        if isinstance(result["diff"], list):
+            print(f"   ⚠️ {result['file']} differs from baseline ({len(result['diff'])} diff lines)")
+    print(f"📄 Report written to {options['report']}")
+    return 1 if diffs["changed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
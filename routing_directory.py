@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Local ABA Routing Directory
+
+In-memory index of routing numbers by normalized institution name, used by
+function_app.lookup_routing_number_by_bank_name instead of asking Azure OpenAI.
+
+Sources, loaded once on first lookup (later files override earlier ones):
+- Federal Reserve E-Payments Routing Directory ACH participant file
+  (FedACHdir.txt, fixed-width 155-character records)
+- CSV files with an institution-name column ("Bank Name", "Customer Name",
+  "Institution") and a routing column ("Routing Number", "ABA", ...), e.g.
+  US_Bank_List_Real.csv once it is enriched with routing numbers
+- routing_directory_overrides.csv - known routing numbers that must win over
+  the other sources (previously written into the lookup prompt)
+
+Every routing number is checksum-validated once at load with the validator the
+caller passes in (function_app.is_valid_routing_number); invalid rows are
+counted and dropped.
+
+Settings (environment):
+    ROUTING_DIRECTORY_PATH   comma-separated directory files (default: FedACHdir.txt,
+                             US_Bank_List_Real.csv and routing_directory_overrides.csv
+                             next to this module, where present)
+"""
+
+import csv
+import os
+import re
+import threading
+
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SOURCES = ("FedACHdir.txt", "US_Bank_List_Real.csv", "routing_directory_overrides.csv")
+
+NAME_COLUMNS = ("bank name", "customer name", "customername", "institution", "institution name", "name")
+ROUTING_COLUMNS = ("routing number", "routing_number", "routingnumber", "aba", "aba routing number", "rtn")
+
+# FedACH directory fixed-width layout (1-based columns in the Fed's file format)
+FEDACH_ROUTING = slice(0, 9)
+FEDACH_OFFICE_CODE = slice(9, 10)
+FEDACH_RECORD_TYPE = slice(19, 20)
+FEDACH_NEW_ROUTING = slice(26, 35)
+FEDACH_CUSTOMER_NAME = slice(35, 71)
+
+LEGAL_SUFFIXES = re.compile(r'\s+(?:N\s?A|NATIONAL ASSOCIATION|INC|CORP|CORPORATION|CO|COMPANY|FSB|SSB|LLC)$')
+GENERIC_WORDS = {"THE", "BANK", "OF", "AND", "TRUST", "BANKING", "NATIONAL", "STATE", "SAVINGS"}
+
+
+def normalize_institution_name(name):
+    """Upper-case name without punctuation, "&"/"AND" or legal suffixes (N.A., INC, ...)"""
+    normalized = str(name or "").upper()
+    normalized = re.sub(r'[.,\'"()]', '', normalized)
+    normalized = re.sub(r'\s*&\s*|\s+AND\s+', ' ', normalized)
+    normalized = re.sub(r'[^A-Z0-9 ]', ' ', normalized)
+    normalized = ' '.join(normalized.split())
+    previous = None
+    while previous != normalized:
+        previous = normalized
+        normalized = LEGAL_SUFFIXES.sub('', normalized)
+    if normalized.startswith("THE "):
+        normalized = normalized[4:]
+    return normalized
+
+
+def core_institution_name(name):
+    """Distinctive words only ("FIRST NATIONAL BANK OF OMAHA" -> "FIRST OMAHA"), the looser second key"""
+    words = [word for word in normalize_institution_name(name).split() if word not in GENERIC_WORDS]
+    return ' '.join(words)
+
+
+class RoutingDirectory:
+    """Routing numbers indexed by normalized institution name, with an unambiguous core-name fallback"""
+
+    def __init__(self, paths, validate):
+        self.paths = list(paths)
+        self.validate = validate
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._by_name = {}
+        self._core_names = {}
+        self.stats = {"sources": {}, "entries": 0, "invalid_routing_numbers": 0, "lookups": 0, "hits": 0}
+
+    @classmethod
+    def from_environment(cls, validate):
+        configured = os.environ.get("ROUTING_DIRECTORY_PATH")
+        if configured:
+            paths = [p.strip() for p in configured.split(",") if p.strip()]
+        else:
+            paths = [os.path.join(MODULE_DIR, name) for name in DEFAULT_SOURCES]
+        return cls(paths, validate)
+
+    def _add(self, name, routing_number, primary, source):
+        routing_number = (routing_number or "").strip()
+        if not name or not routing_number:
+            return False
+        if not self.validate(routing_number):
+            self.stats["invalid_routing_numbers"] += 1
+            return False
+        key = normalize_institution_name(name)
+        if not key:
+            return False
+        entries = self._by_name.setdefault(key, [])
+        if routing_number in entries:
+            entries.remove(routing_number)
+        # Primary routing numbers (main offices, overrides) go first; later sources override earlier ones
+        if primary:
+            entries.insert(0, routing_number)
+        else:
+            entries.append(routing_number)
+        core = core_institution_name(name)
+        if core:
+            self._core_names.setdefault(core, set()).add(key)
+        self.stats["sources"][source] = self.stats["sources"].get(source, 0) + 1
+        self.stats["entries"] += 1
+        return True
+
+    def _load_fedach(self, path, source):
+        with open(path, "r", encoding="latin-1") as f:
+            for line in f:
+                if len(line) < FEDACH_CUSTOMER_NAME.stop:
+                    continue
+                routing_number = line[FEDACH_ROUTING]
+                if line[FEDACH_RECORD_TYPE] == "2" and line[FEDACH_NEW_ROUTING].strip():
+                    # Items go to the institution's new routing number
+                    routing_number = line[FEDACH_NEW_ROUTING]
+                self._add(line[FEDACH_CUSTOMER_NAME].strip(), routing_number, line[FEDACH_OFFICE_CODE] == "O", source)
+
+    def _load_csv(self, path, source, primary):
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            reader = csv.DictReader(f)
+            columns = {column.strip().lower(): column for column in reader.fieldnames or []}
+            name_column = next((columns[c] for c in NAME_COLUMNS if c in columns), None)
+            routing_column = next((columns[c] for c in ROUTING_COLUMNS if c in columns), None)
+            if not name_column or not routing_column:
+                # A plain bank list without routing numbers adds nothing to the directory
+                self.stats["sources"].setdefault(source, 0)
+                return
+            for row in reader:
+                self._add(row.get(name_column), re.sub(r'\D', '', row.get(routing_column) or ""), primary, source)
+
+    def load(self):
+        """Read every configured source that exists (safe to call more than once)"""
+        with self._lock:
+            if self._loaded:
+                return self
+            for path in self.paths:
+                if not os.path.exists(path):
+                    continue
+                source = os.path.basename(path)
+                if path.lower().endswith(".csv"):
+                    self._load_csv(path, source, primary="override" in source.lower())
+                else:
+                    self._load_fedach(path, source)
+            self._loaded = True
+        return self
+
+    def lookup_all(self, bank_name):
+        """Every routing number known for the institution, primary first"""
+        self.load()
+        entries = self._by_name.get(normalize_institution_name(bank_name))
+        if not entries:
+            # The looser core-name key only answers when exactly one institution has it
+            names = self._core_names.get(core_institution_name(bank_name)) or ()
+            if len(names) == 1:
+                entries = self._by_name[next(iter(names))]
+        return list(entries or [])
+
+    def lookup(self, bank_name):
+        """The primary routing number for the institution, or None"""
+        entries = self.lookup_all(bank_name)
+        with self._lock:
+            self.stats["lookups"] += 1
+            if entries:
+                self.stats["hits"] += 1
+        return entries[0] if entries else None
+
+    def get_status(self):
+        """JSON-serializable load and hit statistics"""
+        with self._lock:
+            return {
+                "loaded": self._loaded,
+                "names": len(self._by_name),
+                **{key: (dict(value) if isinstance(value, dict) else value) for key, value in self.stats.items()}
+            }
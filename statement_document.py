@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+Statement Document with Cached Text Views
+
+StatementDocument is the parsed statement (the same dict the pipeline has
+always passed around) plus lazily computed, cached views of its OCR text, so
+the extractors stop re-joining ocr_text_lines and re-running the same scans:
+
+- full_text / upper_text / lower_text / lines / tokens
+- bank_name, account_candidates, statement_date, statement_period,
+  ocr_transactions, table_transactions, extraction_profile - computed
+  by the extractors function_app registers with register_extractors()
+
+account_extraction records which extractor produced the account number, and
+tables holds the Document Intelligence tables (tables_from_result) - both are
+attributes rather than keys so they stay out of the serialized statement data.
+
+It subclasses dict so existing data["..."] access, isinstance(data, dict)
+checks and JSON serialization keep working. Views are computed on first use
+and reset when ocr_text_lines is replaced.
+"""
+
+
+class _Unset:
+    """Marker for a view that has not been computed yet (survives copy/pickle)"""
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return "UNSET"
+
+    def __repr__(self):
+        return "UNSET"
+
+
+UNSET = _Unset()
+TEXT_KEYS = ("ocr_text_lines",)
+
+
+class StatementDocument(dict):
+    """Parsed statement data with cached text views and extractor results"""
+
+    VIEWS = ("_full_text", "_upper_text", "_lower_text", "_lines", "_tokens",
+             "_bank_name", "_account_candidates", "_statement_date", "_statement_period",
+             "_ocr_transactions", "_table_transactions", "_extraction_profile")
+    __slots__ = VIEWS + ("account_extraction", "tables")
+
+    # name -> callable, registered once by function_app
+    extractors = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.account_extraction = None
+        self.tables = []
+        self.reset_views()
+
+    @classmethod
+    def register_extractors(cls, **extractors):
+        """
+        bank_name(text), account_candidates(text), statement_date(document),
+        statement_period(document), ocr_transactions(document), table_transactions(document)
+        and extraction_profile(document) callables
+        """
+        cls.extractors.update(extractors)
+
+    @classmethod
+    def of(cls, data):
+        """data itself when it already is a StatementDocument, otherwise a wrapping copy"""
+        return data if isinstance(data, cls) else cls(data or {})
+
+    def reset_views(self):
+        for slot in self.VIEWS:
+            setattr(self, slot, UNSET)
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        if key in TEXT_KEYS:
+            self.reset_views()
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self.reset_views()
+
+    def __reduce__(self):
+        # Rebuild from the dict contents and tables; views are recomputed on demand
+        return (self.__class__, (dict(self),), (None, {"tables": self.tables}))
+
+    @property
+    def lines(self):
+        """OCR text as a list of lines"""
+        if self._lines is UNSET:
+            text_lines = self.get("ocr_text_lines") or []
+            self._lines = text_lines.split('\n') if isinstance(text_lines, str) else list(text_lines)
+        return self._lines
+
+    @property
+    def full_text(self):
+        """OCR lines joined with newlines ("" when there is no OCR text)"""
+        if self._full_text is UNSET:
+            text_lines = self.get("ocr_text_lines") or []
+            self._full_text = text_lines if isinstance(text_lines, str) else '\n'.join(text_lines)
+        return self._full_text
+
+    @property
+    def upper_text(self):
+        if self._upper_text is UNSET:
+            self._upper_text = self.full_text.upper()
+        return self._upper_text
+
+    @property
+    def lower_text(self):
+        if self._lower_text is UNSET:
+            self._lower_text = self.full_text.lower()
+        return self._lower_text
+
+    @property
+    def tokens(self):
+        """Whitespace-separated words of the full text"""
+        if self._tokens is UNSET:
+            self._tokens = self.full_text.split()
+        return self._tokens
+
+    @property
+    def bank_name(self):
+        """Bank name detected in the OCR text (None when not found)"""
+        if self._bank_name is UNSET:
+            self._bank_name = self.extractors["bank_name"](self.full_text) if self.full_text else None
+        return self._bank_name
+
+    @property
+    def account_candidates(self):
+        """(kind, value) account-number candidates found in the OCR text"""
+        if self._account_candidates is UNSET:
+            self._account_candidates = self.extractors["account_candidates"](self.full_text) if self.full_text else []
+        return self._account_candidates
+
+    @property
+    def statement_date(self):
+        """BAI2 statement date (YYMMDD)"""
+        if self._statement_date is UNSET:
+            self._statement_date = self.extractors["statement_date"](self)
+        return self._statement_date
+
+    @property
+    def statement_period(self):
+        """Statement period from the OCR text or the Document Intelligence dates (None when not found)"""
+        if self._statement_period is UNSET:
+            self._statement_period = self.extractors["statement_period"](self)
+        return self._statement_period
+
+    @property
+    def ocr_transactions(self):
+        """Transactions parsed from the OCR text, with their validation against the printed totals"""
+        if self._ocr_transactions is UNSET:
+            self._ocr_transactions = self.extractors["ocr_transactions"](self)
+        return self._ocr_transactions
+
+    @property
+    def table_transactions(self):
+        """Transactions read from the Document Intelligence tables, with their running-balance validation"""
+        if self._table_transactions is UNSET:
+            self._table_transactions = self.extractors["table_transactions"](self)
+        return self._table_transactions
+
+    @property
+    def extraction_profile(self):
+        """The learned extraction profile for this statement's bank (None when there is none)"""
+        if self._extraction_profile is UNSET:
+            self._extraction_profile = self.extractors["extraction_profile"](self)
+        return self._extraction_profile
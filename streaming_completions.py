@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""
+Streamed OpenAI Completions with Incremental Validation
+
+Reads chat completions as they are generated and checks their structure on the
+fly, so a response that is going wrong is abandoned after a few tokens instead
+of after the whole completion:
+
+- Bai2StreamValidator: every completed line must be the next legal BAI2 record
+  (01, 02, 03, 16/88, 49, 98, 99); the first characters must be "01,". Valid
+  records are handed to the record writer as they arrive.
+- JsonStreamValidator: the response must be a JSON object; each object in the
+  item array (e.g. "transactions") is parsed and checked as soon as it closes,
+  and items_complete reports whether the whole array arrived.
+
+A structural error raises StreamAborted and closes the HTTP stream. A response
+that ends early (finish_reason "length" or an unterminated structure) raises
+StreamAborted from finish() with the records / items received so far.
+
+read_sdk_stream handles openai SDK streams and read_sse_response handles raw
+REST responses read with requests; both also accept non-streamed responses, so
+the same validation runs when streaming is switched off.
+
+Settings (environment):
+    OPENAI_STREAMING   stream completions and validate them incrementally (default true)
+"""
+
+import json
+import re
+
+BAI2_NEXT_RECORDS = {
+    None: {"01"},
+    "01": {"02"},
+    "02": {"03", "98"},
+    "03": {"16", "49"},
+    "16": {"16", "49"},
+    "49": {"03", "98"},
+    "98": {"02", "99"},
+    "99": set(),
+}
+BAI2_RECORD = re.compile(r'^(\d{2}),')
+JSON_FENCES = ("```json", "```")
+
+
+class StreamAborted(Exception):
+    """A streamed completion was abandoned; partial holds the text received so far"""
+
+    def __init__(self, reason, partial="", items=None):
+        super().__init__(f"Stream aborted: {reason}")
+        self.reason = reason
+        self.partial = partial
+        self.items = items or []
+
+
+class Bai2StreamValidator:
+    """Line-by-line BAI2 record checker; on_record(record) receives each valid record"""
+
+    def __init__(self, on_record=None):
+        self.records = []
+        self.on_record = on_record or self.records.append
+        self._buffer = ""
+        self._last = None
+        self._received = []
+
+    def _abort(self, reason):
+        raise StreamAborted(reason, "".join(self._received))
+
+    def feed(self, text):
+        self._received.append(text)
+        self._buffer += text
+        if self._last is None:
+            lead = self._buffer.lstrip()
+            if lead and not (lead.startswith("01,") or "01,".startswith(lead)):
+                self._abort(f"output does not start with a 01 record: {lead[:30]!r}")
+        while "\n" in self._buffer:
+            line, self._buffer = self._buffer.split("\n", 1)
+            self._process_line(line.strip())
+
+    def _process_line(self, line):
+        if not line:
+            return
+        match = BAI2_RECORD.match(line)
+        if not match:
+            self._abort(f"not a BAI2 record: {line[:40]!r}")
+        code = match.group(1)
+        if code == "88":
+            if self._last in (None, "99"):
+                self._abort("88 continuation record outside the file")
+        elif code not in BAI2_NEXT_RECORDS.get(self._last, ()):
+            self._abort(f"record {code} cannot follow {self._last or 'the start of the file'}")
+        else:
+            self._last = code
+        self.on_record(line)
+
+    def finish(self, finish_reason=None):
+        """Return the file text; raises StreamAborted when the 99 trailer never arrived"""
+        if self._buffer.strip():
+            self._process_line(self._buffer.strip())
+            self._buffer = ""
+        if self._last != "99":
+            reason = "completion hit max_tokens" if finish_reason == "length" else "output ended"
+            self._abort(f"{reason} before the 99 file trailer")
+        return "\n".join(self.records)
+
+
+class JsonStreamValidator:
+    """
+    Incremental JSON object checker. Objects inside the array named item_key are
+    parsed when they close, checked with check_item(item) -> error message or None,
+    and passed to on_item(item).
+    """
+
+    def __init__(self, item_key="transactions", check_item=None, on_item=None):
+        self.item_key = item_key
+        self.check_item = check_item
+        self.items = []
+        self.on_item = on_item or self.items.append
+        self.items_complete = False
+        self._chars = []
+        self._lead = ""
+        self._started = False
+        self._done = False
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+
+    def _abort(self, reason):
+        raise StreamAborted(reason, self._lead + "".join(self._chars), self.items)
+
+    def feed(self, text):
+        if not self._started:
+            self._lead += text
+            brace = self._lead.find("{")
+            before = (self._lead if brace < 0 else self._lead[:brace]).strip()
+            if before and not any(fence.startswith(before) or before == fence for fence in JSON_FENCES):
+                self._abort(f"response is not a JSON object: {before[:30]!r}")
+            if brace < 0:
+                return
+            self._started = True
+            text = self._lead[brace:]
+            self._lead = self._lead[:brace]
+        for char in text:
+            self._scan(char)
+
+    def _scan(self, char):
+        if self._done:
+            self._chars.append(char)
+            if not char.isspace() and char != "`":
+                self._abort("text after the JSON object")
+            return
+        position = len(self._chars)
+        self._chars.append(char)
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif char == "\\":
+                self._escape = True
+            elif char == '"':
+                self._in_string = False
+            return
+        if char == '"':
+            self._in_string = True
+        elif char in "{[":
+            key = None
+            if char == "[":
+                match = re.search(r'"([^"\\]+)"\s*:\s*$', "".join(self._chars[max(0, position - 64):position]))
+                key = match.group(1) if match else None
+            self._stack.append((char, position, key))
+        elif char in "}]":
+            if not self._stack or self._stack[-1][0] != ("{" if char == "}" else "["):
+                self._abort(f"unbalanced '{char}'")
+            opener, start, key = self._stack.pop()
+            if char == "]" and key == self.item_key:
+                self.items_complete = True
+            if not self._stack:
+                self._done = True
+            elif char == "}" and self._stack[-1][0] == "[" and self._stack[-1][2] == self.item_key:
+                self._item_closed("".join(self._chars[start:position + 1]))
+
+    def _item_closed(self, text):
+        try:
+            item = json.loads(text)
+        except json.JSONDecodeError as e:
+            self._abort(f"malformed {self.item_key} entry {len(self.items) + 1}: {e}")
+        error = self.check_item(item) if self.check_item else None
+        if error:
+            self._abort(f"invalid {self.item_key} entry {len(self.items) + 1}: {error}")
+        self.on_item(item)
+
+    def finish(self, finish_reason=None):
+        """Return the JSON text (fences removed); raises StreamAborted when it is incomplete"""
+        if not self._started:
+            self._abort("no JSON object in the response")
+        if not self._done or finish_reason == "length":
+            reason = "completion hit max_tokens" if finish_reason == "length" else "JSON ended early"
+            self._abort(f"{reason} after {len(self.items)} complete {self.item_key} entries")
+        return "".join(self._chars).strip().rstrip("`").strip()
+
+
+def read_sdk_stream(response, validator):
+    """Feed an openai SDK stream (or a non-streamed ChatCompletion) through a validator"""
+    finish_reason = None
+    try:
+        if hasattr(response, "choices"):
+            choice = response.choices[0]
+            validator.feed(choice.message.content or "")
+            finish_reason = choice.finish_reason
+        else:
+            for chunk in response:
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                if choice.delta is not None and choice.delta.content:
+                    validator.feed(choice.delta.content)
+                finish_reason = choice.finish_reason or finish_reason
+    except StreamAborted:
+        if hasattr(response, "close"):
+            response.close()
+        raise
+    return validator.finish(finish_reason)
+
+
+def read_sse_response(response, validator):
+    """Feed a requests response (server-sent events, or a plain JSON completion) through a validator"""
+    finish_reason = None
+    try:
+        if not response.headers.get("Content-Type", "").startswith("text/event-stream"):
+            choice = response.json()["choices"][0]
+            validator.feed(choice["message"]["content"] or "")
+            finish_reason = choice.get("finish_reason")
+        else:
+            for line in response.iter_lines():
+                if isinstance(line, bytes):
+                    line = line.decode("utf-8")
+                if not line or not line.startswith("data:"):
+                    continue
+                payload = line[5:].strip()
+                if payload == "[DONE]":
+                    break
+                chunk = json.loads(payload)
+                if not chunk.get("choices"):
+                    continue
+                choice = chunk["choices"][0]
+                content = (choice.get("delta") or {}).get("content")
+                if content:
+                    validator.feed(content)
+                finish_reason = choice.get("finish_reason") or finish_reason
+    except StreamAborted:
+        response.close()
+        raise
+    return validator.finish(finish_reason)
+
+
+def completion_chunks(content, model="stub", pieces=8):
+    """A finished completion re-cut into ChatCompletionChunk objects, for stubs and replays"""
+    from openai.types.chat import ChatCompletionChunk
+
+    size = max(1, -(-len(content) // pieces))
+    parts = [content[i:i + size] for i in range(0, len(content), size)] or [""]
+    for index, part in enumerate(parts):
+        yield ChatCompletionChunk.model_validate({
+            "id": "stream", "object": "chat.completion.chunk", "created": 0, "model": model,
+            "choices": [{"index": 0, "delta": {"content": part},
+                         "finish_reason": "stop" if index == len(parts) - 1 else None}]
+        })
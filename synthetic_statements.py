@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Synthetic Bank Statement Generator
+Builds statement OCR text, Document Intelligence-shaped results, parsed data
+and matching BAI2 files at sizes our real test PDFs never reach (1k-50k
+transactions), for scale tests of transaction parsing, reconciliation, the
+BAI2 writer/fixer and memory usage.
+
+The OCR text follows the layout parse_transactions_from_ocr expects: DEBITS
+and CREDITS sections with a date line (MM-DD), description line(s) and an
+amount line per transaction, repeated section headers on every page, and a
+DAILY BALANCES section. Amounts are generated in integer cents so every
+expected total is exact.
+
+Usage:
+    python synthetic_statements.py --stress                    # 1k, 5k, 10k, 50k transactions
+    python synthetic_statements.py --stress --sizes 1000,20000
+    python synthetic_statements.py --transactions 5000 --write out/
+"""
+
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+DEFAULT_STRESS_SIZES = [1000, 5000, 10000, 50000]
+TRANSACTIONS_PER_PAGE = 45
+
+# How the account number appears in the statement header
+ACCOUNT_FORMATS = {
+    "full": lambda account: account,
+    "masked_x": lambda account: "X" * (len(account) - 4) + account[-4:],
+    "masked_star": lambda account: "****" + account[-4:],
+    "short_star": lambda account: "*" + account[-4:],
+    "dashed": lambda account: f"xxx-xxx-{account[-4:]}",
+    "ending_in": lambda account: f"ending in {account[-4:]}",
+}
+
+DEBIT_DESCRIPTIONS = [
+    ("Preauthorized Wd WORLD ACCEPTANCE CONC DEBIT {ref}", "0841 SPARTA, TN"),
+    ("ACH Debit VENDOR PAYMENT {ref}", "CCD ID 1234567890"),
+    ("Check {check}", None),
+    ("Online Transfer To CHK {ref}", None),
+    ("Wire Transfer Out {ref}", "BNF WORLD FINANCE CORP"),
+    ("Debit", None),
+]
+FEE_DESCRIPTIONS = [
+    ("Maintenance Fee ANALYSIS LOSS/CHG FOR {period}", None),
+    ("Service Fee RETURN ITEM {ref}", None),
+    ("Fees", None),
+]
+CREDIT_DESCRIPTIONS = [
+    ("Deposit BRANCH {ref}", None),
+    ("ACH Credit CUSTOMER PAYMENT {ref}", "PPD ID 9876543210"),
+    ("Online Transfer From SAV {ref}", None),
+    ("Remote Deposit Capture {ref}", None),
+    ("Deposit", None),
+]
+
+BAI2_DEBIT_CODE = "451"
+BAI2_FEE_CODE = "475"
+BAI2_CREDIT_CODE = "301"
+
+
+def format_cents(cents):
+    """1234567 -> '12,345.67'"""
+    return f"{cents // 100:,}.{cents % 100:02d}"
+
+
+def _description(rng, templates, txn_date, sequence):
+    first, second = rng.choice(templates)
+    values = {
+        "ref": f"{txn_date.strftime('%y%m%d')}{sequence:06d}",
+        "check": 1000 + sequence,
+        "period": (txn_date.replace(day=1) - timedelta(days=1)).strftime("%m/%d/%y"),
+    }
+    lines = [first.format(**values)]
+    if second:
+        lines.append(second.format(**values))
+    return lines
+
+
+def generate_statement(transaction_count, seed=0, account_format="masked_x",
+                       bank_name="FIRST NATIONAL BANK OF TENNESSEE", account_number="0005183942",
+                       start_date=date(2025, 6, 1), days=30, credit_ratio=0.35, fee_ratio=0.02):
+    """
+    Generate one synthetic statement.
+
+    Returns a dict with:
+        ocr_text               statement text as Document Intelligence would return it
+        analyze_result         AnalyzeResult-shaped dict (content + bankStatement fields)
+        parsed_data            pipeline parsed_data (ocr_text_lines, balances, signed transactions)
+        enhanced_transactions  debits/credits/totals in the shape convert_to_bai2 checks
+        bai2                   matching BAI2 file text
+        expected               exact counts and cent totals for validation
+    """
+    rng = random.Random(seed)
+    end_date = start_date + timedelta(days=days - 1)
+
+    # Transactions sorted by date; amounts in integer cents
+    transactions = []
+    for sequence in range(1, transaction_count + 1):
+        txn_date = start_date + timedelta(days=rng.randrange(days))
+        roll = rng.random()
+        if roll < credit_ratio:
+            kind, templates, cents = "credit", CREDIT_DESCRIPTIONS, rng.randint(100, 25_000_00)
+        elif roll < credit_ratio + fee_ratio:
+            kind, templates, cents = "fee", FEE_DESCRIPTIONS, rng.randint(500, 150_00)
+        else:
+            kind, templates, cents = "debit", DEBIT_DESCRIPTIONS, rng.randint(100, 20_000_00)
+        transactions.append({
+            "date": txn_date,
+            "kind": kind,
+            "cents": cents,
+            "description_lines": _description(rng, templates, txn_date, sequence),
+        })
+    transactions.sort(key=lambda t: t["date"])
+
+    debits = [t for t in transactions if t["kind"] in ("debit", "fee")]
+    credits = [t for t in transactions if t["kind"] == "credit"]
+    total_debit_cents = sum(t["cents"] for t in debits)
+    total_credit_cents = sum(t["cents"] for t in credits)
+    # Operating accounts are funded to cover the month's net outflow
+    opening_cents = rng.randint(10_000_00, 500_000_00) + max(0, total_debit_cents - total_credit_cents)
+    closing_cents = opening_cents + total_credit_cents - total_debit_cents
+
+    # Daily closing balances
+    daily_balances = []
+    balance = opening_cents
+    by_day = {}
+    for t in transactions:
+        by_day.setdefault(t["date"], []).append(t)
+    for offset in range(days):
+        day = start_date + timedelta(days=offset)
+        for t in by_day.get(day, []):
+            balance += t["cents"] if t["kind"] == "credit" else -t["cents"]
+        if day in by_day:
+            daily_balances.append((day, balance))
+
+    masked_account = ACCOUNT_FORMATS[account_format](account_number)
+    section_pages = [
+        ("DEBITS", "Subtractions", debits),
+        ("CREDITS", "Additions", credits),
+    ]
+    total_pages = 1 + sum(max(1, -(-len(items) // TRANSACTIONS_PER_PAGE)) for _, _, items in section_pages) + 1
+
+    lines = [
+        bank_name,
+        "P.O. Box 379 Livingston, TN 38570",
+        "RETURN SERVICE REQUESTED",
+        "WORLD FINANCE CORP OF TENNESSEE PO BOX 6429 GREENVILLE SC 29606-6429",
+        f"Last statement: {(start_date - timedelta(days=1)).strftime('%B %d, %Y')} "
+        f"This statement: {end_date.strftime('%B %d, %Y')} Total days in statement period: {days}",
+        f"Page 1 of {total_pages}",
+        f"Business Checking Account Number: {masked_account}",
+        "Beginning balance",
+        f"${format_cents(opening_cents)}",
+        f"{len(credits)} Deposits/Credits",
+        format_cents(total_credit_cents),
+        f"{len(debits)} Checks/Debits",
+        format_cents(total_debit_cents),
+        "Ending balance",
+        f"${format_cents(closing_cents)}",
+    ]
+    page = 1
+    for section, column, items in section_pages:
+        for start in range(0, max(len(items), 1), TRANSACTIONS_PER_PAGE):
+            page += 1
+            lines.extend([
+                "Thank you for banking with us",
+                f"WORLD FINANCE CORP OF TENNESSEE {end_date.strftime('%B %d, %Y')}",
+                f"Page {page} of {total_pages}",
+                section, "Date", "Description", column,
+            ])
+            for t in items[start:start + TRANSACTIONS_PER_PAGE]:
+                lines.append(t["date"].strftime("%m-%d"))
+                lines.extend(t["description_lines"])
+                lines.append(format_cents(t["cents"]))
+    page += 1
+    lines.extend([f"Page {page} of {total_pages}", "DAILY BALANCES", "Date Amount"])
+    lines.extend(f"{day.strftime('%m-%d')} {format_cents(value)}" for day, value in daily_balances)
+    ocr_text = "\n".join(lines)
+
+    def as_float(cents):
+        return cents / 100.0
+
+    parsed_transactions = [{
+        "date": t["date"].isoformat(),
+        "description": " ".join(t["description_lines"]),
+        "amount": as_float(t["cents"]) if t["kind"] == "credit" else -as_float(t["cents"]),
+    } for t in transactions]
+
+    def enhanced(items):
+        return [{
+            "date": t["date"].strftime("%m-%d"),
+            "type": t["kind"],
+            "amount": format_cents(t["cents"]),
+            "amount_decimal": as_float(t["cents"]),
+            "description": " | ".join(t["description_lines"]),
+        } for t in items]
+
+    analyze_result = {
+        "apiVersion": "2024-11-30",
+        "modelId": "prebuilt-bankStatement.us",
+        "content": ocr_text,
+        "pages": [{"pageNumber": n, "lines": []} for n in range(1, total_pages + 1)],
+        "documents": [{
+            "docType": "bankStatement.us",
+            "fields": {
+                "BankName": {"type": "string", "content": bank_name, "confidence": 0.95},
+                "AccountNumber": {"type": "string", "content": masked_account, "confidence": 0.9},
+                "StatementStartDate": {"type": "date", "content": start_date.strftime("%B %d, %Y"), "confidence": 0.93},
+                "StatementEndDate": {"type": "date", "content": end_date.strftime("%B %d, %Y"), "confidence": 0.93},
+            },
+        }],
+    }
+
+    return {
+        "ocr_text": ocr_text,
+        "analyze_result": analyze_result,
+        "parsed_data": {
+            "source": f"synthetic_{transaction_count}.pdf",
+            "extraction_method": "bankStatement.us_model",
+            "account_number": masked_account,
+            "bank_name": bank_name,
+            "ocr_text_lines": lines,
+            "opening_balance": {"amount": as_float(opening_cents)},
+            "closing_balance": {"amount": as_float(closing_cents)},
+            "transactions": parsed_transactions,
+        },
+        "enhanced_transactions": {
+            "debits": enhanced(debits),
+            "credits": enhanced(credits),
+            "total_debits": as_float(total_debit_cents),
+            "total_credits": as_float(total_credit_cents),
+            "count_debits": len(debits),
+            "count_credits": len(credits),
+        },
+        "bai2": build_bai2(transactions, account_number, closing_cents, end_date),
+        "expected": {
+            "transaction_count": transaction_count,
+            "count_debits": len(debits),
+            "count_credits": len(credits),
+            "total_debit_cents": total_debit_cents,
+            "total_credit_cents": total_credit_cents,
+            "opening_cents": opening_cents,
+            "closing_cents": closing_cents,
+            "pages": total_pages,
+            "daily_balances": len(daily_balances),
+        },
+    }
+
+
+def build_bai2(transactions, account_number, closing_cents, as_of_date,
+               routing_number="064203254"):
+    """BAI2 file with record counts laid out the way bai2_fixer.rebuild_bai2 writes them"""
+    file_date = as_of_date.strftime("%y%m%d")
+    records = [
+        f"01,WORKDAY,WORKDAY,{file_date},1200,1,,,2/",
+        f"02,WORKDAY,{routing_number},1,{file_date},,USD,2/",
+        f"03,{account_number},USD,010,,,Z/",
+    ]
+    for sequence, t in enumerate(transactions, start=1):
+        code = {"credit": BAI2_CREDIT_CODE, "fee": BAI2_FEE_CODE}.get(t["kind"], BAI2_DEBIT_CODE)
+        # Commas delimit BAI2 fields and "/" ends the record, so neither may appear in text
+        description = " ".join(" ".join(t["description_lines"]).replace(",", " ").replace("/", "-").split())
+        records.append(f"16,{code},{t['cents']},Z,{sequence:05d},,{description}/")
+    records.append(f"49,{closing_cents},{len(transactions) + 2}/")
+    records.append(f"98,{closing_cents},1,{len(transactions) + 4}/")
+    records.append(f"99,{closing_cents},1,{len(records) + 1}/")
+    return "\n".join(records) + "\n"
+
+
+def _measure(func, *args):
+    """(result, seconds, peak traced bytes) for one call with pipeline logging silenced"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = func(*args)
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def stress(sizes):
+    """Run parsing, reconciliation and BAI2 fix/rebuild over each synthetic size"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        import function_app
+        import bai2_fixer
+
+    def bai2_round_trip(raw):
+        file01, groups, audit = bai2_fixer.parse_bai2(raw)
+        return bai2_fixer.rebuild_bai2(file01, groups)
+
+    results = []
+    for size in sizes:
+        statement = generate_statement(size, seed=size)
+        expected = statement["expected"]
+        row = {"transactions": size, "ocr_bytes": len(statement["ocr_text"].encode("utf-8"))}
+
+        parsed, row["parse_seconds"], row["parse_peak_bytes"] = _measure(
+            function_app.parse_transactions_from_ocr, statement["ocr_text"])
+        row["parse_matches"] = (
+            len(parsed["debits"]) == expected["count_debits"]
+            and len(parsed["credits"]) == expected["count_credits"]
+        )
+
+        reconciliation, row["reconcile_seconds"], row["reconcile_peak_bytes"] = _measure(
+            function_app.reconcile_transactions, statement["parsed_data"])
+        row["reconciled"] = bool(reconciliation.get("balanced"))
+
+        rebuilt, row["bai2_fix_seconds"], row["bai2_fix_peak_bytes"] = _measure(
+            bai2_round_trip, statement["bai2"])
+        row["bai2_records"] = len(rebuilt)
+        row["bai2_stable"] = rebuilt == statement["bai2"].splitlines()
+        results.append(row)
+
+        print(f"{size:>7,} txns | OCR {row['ocr_bytes'] / 1024:>8,.0f} KB | "
+              f"parse {row['parse_seconds']:6.2f}s {row['parse_peak_bytes'] / 1048576:6.1f} MB "
+              f"{'✅' if row['parse_matches'] else '❌'} | "
+              f"reconcile {row['reconcile_seconds']:6.2f}s {'✅' if row['reconciled'] else '❌'} | "
+              f"BAI2 fix {row['bai2_fix_seconds']:6.2f}s {row['bai2_fix_peak_bytes'] / 1048576:6.1f} MB "
+              f"{'✅' if row['bai2_stable'] else '❌'}")
+    return results
+
+
+def write_statement(statement, directory, name):
+    """Write OCR text, DI result, parsed data and BAI2 for one statement"""
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, f"{name}.txt"), "w", encoding="utf-8") as f:
+        f.write(statement["ocr_text"])
+    with open(os.path.join(directory, f"{name}.bai"), "w", encoding="utf-8") as f:
+        f.write(statement["bai2"])
+    for key in ("analyze_result", "parsed_data", "enhanced_transactions", "expected"):
+        with open(os.path.join(directory, f"{name}_{key}.json"), "w", encoding="utf-8") as f:
+            json.dump(statement[key], f, indent=2)
+
+
+def main(argv=None):
+    args = list(sys.argv[1:] if argv is None else argv)
+    if not args or "--help" in args or "-h" in args:
+        print(__doc__)
+        return 0
+
+    def option(flag, default=None):
+        if flag in args:
+            index = args.index(flag)
+            if index + 1 < len(args):
+                return args[index + 1]
+        return default
+
+    if "--stress" in args:
+        sizes = [int(s) for s in option("--sizes", ",".join(map(str, DEFAULT_STRESS_SIZES))).split(",")]
+        results = stress(sizes)
+        report = option("--report")
+        if report:
+            with open(report, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+        return 0 if all(r["parse_matches"] and r["reconciled"] and r["bai2_stable"] for r in results) else 1
+
+    count = int(option("--transactions", "1000"))
+    statement = generate_statement(
+        count,
+        seed=int(option("--seed", "0")),
+        account_format=option("--account-format", "masked_x")
+    )
+    directory = option("--write", ".")
+    write_statement(statement, directory, f"synthetic_{count}")
+    print(f"✅ Wrote synthetic statement with {count:,} transactions to {directory}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+Table-Structure Transaction Extraction
+
+Reads transactions from the tables Document Intelligence returns with every
+analysis (result.tables), which keep each value in its column where the OCR
+text interleaves them:
+
+- tables_from_result flattens the SDK tables into plain dicts: cells with
+  content, row/column index, kind ("columnHeader" marks header cells) and
+  page number
+- the column roles (date, description, debit, credit, signed amount, balance)
+  come from the header cells. A table without a recognizable header that
+  continues the previous transaction table (same column count, next page) reuses
+  its columns, so a statement table split across pages reads as one
+- rows are assembled in one pass over the cell grid. A row with a description
+  but no date or amount continues the previous transaction's description; a row
+  with amounts but no date takes the previous date
+- every printed running balance is checked against the opening balance plus
+  the credits and minus the debits parsed so far
+
+The result uses the consolidated extraction shape (like ocr_transaction_parser),
+so a table whose running balances all check out is written to BAI2 by
+build_bai2_from_consolidated with no OpenAI call.
+
+Settings (environment):
+    TABLE_TRANSACTION_FAST_PATH   true/false (default true)
+"""
+
+import os
+import re
+from datetime import datetime
+
+import date_engine
+from ocr_transaction_parser import FEE_WORDS, amount_cents
+from transaction_store import TransactionStore
+
+COLUMN_ROLES = [
+    ("balance", re.compile(r'\bBALANCE\b')),
+    ("date", re.compile(r'\bDATE\b|^POSTED$|^POST(?:ING)?$|^EFF(?:ECTIVE)?$')),
+    ("debit", re.compile(r'\bDEBITS?\b|\bWITHDRAWALS?\b|\bSUBTRACTIONS?\b|\bCHARGES\b|\bPAYMENTS?\b|\bCHECKS?\b|AMOUNT SUBTRACTED')),
+    ("credit", re.compile(r'\bCREDITS?\b|\bDEPOSITS?\b|\bADDITIONS?\b|AMOUNT ADDED')),
+    ("amount", re.compile(r'^AMOUNT$|^TRANSACTION AMOUNT$')),
+    ("description", re.compile(r'DESCRIPTION|\bDETAILS?\b|\bMEMO\b|\bPAYEE\b|^TRANSACTIONS?$|\bACTIVITY\b'))
+]
+OPENING_ROW = re.compile(r'\b(?:BEGINNING|OPENING|PREVIOUS|STARTING)\s+BALANCE\b|\bBALANCE\s+(?:FORWARD|BROUGHT FORWARD|LAST STATEMENT)\b', re.IGNORECASE)
+CLOSING_ROW = re.compile(r'\b(?:ENDING|CLOSING|NEW)\s+BALANCE\b|^TOTALS?\b', re.IGNORECASE)
+NEGATIVE = re.compile(r'^\s*(?:\(|-)|-\s*$')
+
+
+def tables_from_result(result):
+    """Document Intelligence tables as plain dicts (cells with content, indexes, kind and page)"""
+    tables = []
+    for table in getattr(result, "tables", None) or []:
+        regions = getattr(table, "bounding_regions", None) or []
+        table_data = {
+            "row_count": table.row_count,
+            "column_count": table.column_count,
+            "page_number": regions[0].page_number if regions else None,
+            "cells": []
+        }
+        for cell in table.cells:
+            cell_regions = getattr(cell, "bounding_regions", None) or []
+            table_data["cells"].append({
+                "content": cell.content,
+                "row_index": cell.row_index,
+                "column_index": cell.column_index,
+                "kind": getattr(cell, "kind", None) or "content",
+                "page_number": cell_regions[0].page_number if cell_regions else table_data["page_number"]
+            })
+        tables.append(table_data)
+    return tables
+
+
+def column_roles(header_cells):
+    """{column index: role} for the header cells that name a transaction column"""
+    roles = {}
+    for column, text in header_cells.items():
+        heading = " ".join(re.sub(r'[^A-Z ]', ' ', (text or "").upper()).split())
+        for role, pattern in COLUMN_ROLES:
+            if pattern.search(heading) and role not in roles.values():
+                roles[column] = role
+                break
+    return roles
+
+
+def _is_transaction_table(roles):
+    found = set(roles.values())
+    # A lone unsigned amount column (check lists, deposit tickets) has no direction without a balance
+    return "date" in found and ("debit" in found or "credit" in found or {"amount", "balance"} <= found)
+
+
+class TableTransactionInterpreter:
+    """Transaction rows from Document Intelligence tables, validated by the running balance"""
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+
+    @classmethod
+    def from_environment(cls):
+        enabled = os.environ.get("TABLE_TRANSACTION_FAST_PATH", "true").strip().lower() in ("1", "true", "yes", "on")
+        return cls(enabled=enabled)
+
+    def iter_rows(self, tables):
+        """Yield (page, {role: text}) for each body row of the transaction tables, in document order"""
+        previous = None  # (column count, roles, last page) of the last transaction table
+        for table in tables:
+            grid = {}
+            header_rows = set()
+            for cell in table["cells"]:
+                grid.setdefault(cell["row_index"], {})[cell["column_index"]] = cell["content"]
+                if cell.get("kind") == "columnHeader":
+                    header_rows.add(cell["row_index"])
+            if not grid:
+                continue
+            if not header_rows:
+                # No marked header: the first row is the header if it names the columns
+                header_rows = {min(grid)} if _is_transaction_table(column_roles(grid[min(grid)])) else set()
+
+            headers = {}
+            for row_index in sorted(header_rows):
+                for column, text in grid[row_index].items():
+                    headers[column] = f"{headers.get(column, '')} {text}".strip()
+            roles = column_roles(headers)
+            page = table.get("page_number")
+            if not _is_transaction_table(roles):
+                # A headerless continuation of the previous table on a later page
+                if previous and not header_rows and table["column_count"] == previous[0] \
+                        and (page is None or previous[2] is None or page > previous[2]):
+                    roles = previous[1]
+                else:
+                    continue
+            previous = (table["column_count"], roles, page)
+
+            for row_index in sorted(grid):
+                if row_index in header_rows:
+                    continue
+                row = {role: (grid[row_index].get(column) or "").strip() for column, role in roles.items()}
+                yield page, row
+
+    def parse_tables(self, tables, period=None, opening_balance_cents=None):
+        """
+        Transactions from the tables in the consolidated extraction shape (transactions
+        as a TransactionStore), plus a running-balance "validation" summary.
+        opening_balance_cents (e.g. the statement summary's beginning balance) is
+        used when the table has no opening-balance row.
+        """
+        transactions = []
+        opening = opening_balance_cents
+        balance = opening_balance_cents  # running balance from the parsed rows
+        last_date = None
+        checks = mismatches = 0
+        last_checked = -1
+        opening_known = opening is not None
+        has_balance_column = False
+
+        for page, row in self.iter_rows(tables):
+            description = row.get("description", "")
+            printed_balance = amount_cents(row["balance"]) if row.get("balance") else None
+            if printed_balance is not None and NEGATIVE.search(row["balance"]):
+                printed_balance = -printed_balance
+            has_balance_column = has_balance_column or "balance" in row
+
+            if OPENING_ROW.search(description):
+                if printed_balance is not None and not transactions:
+                    opening = balance = printed_balance
+                    opening_known = True
+                continue
+            if CLOSING_ROW.search(description):
+                continue
+
+            credit = amount_cents(row["credit"]) if row.get("credit") else None
+            debit = amount_cents(row["debit"]) if row.get("debit") else None
+            if row.get("amount"):
+                signed = amount_cents(row["amount"])
+                if signed is not None and NEGATIVE.search(row["amount"]):
+                    debit = signed
+                else:
+                    credit = signed
+
+            if not credit and not debit:
+                if description and transactions and not row.get("date") and printed_balance is None:
+                    transactions[-1]["description"] = f"{transactions[-1]['description']} | {description}"
+                continue
+
+            date = row.get("date") or last_date
+            last_date = date
+            for cents, kind in ((credit, "credit"), (debit, "debit")):
+                if not cents:
+                    continue
+                if kind == "debit" and any(word in description.upper() for word in FEE_WORDS):
+                    kind = "fee"
+                transactions.append({"date_text": date, "description": description, "amount_cents": cents, "kind": kind})
+                if balance is not None:
+                    balance += cents if kind == "credit" else -cents
+
+            if printed_balance is not None:
+                if balance is None:
+                    # No opening balance: derive it from the first row, which then proves nothing
+                    net = sum(t["amount_cents"] if t["kind"] == "credit" else -t["amount_cents"] for t in transactions)
+                    opening = printed_balance - net
+                else:
+                    checks += 1
+                    if balance != printed_balance:
+                        mismatches += 1
+                balance = printed_balance
+                last_checked = len(transactions) - 1
+
+        value_dates = date_engine.bai2_transaction_dates([t["date_text"] for t in transactions], period)
+        rows = transactions
+        transactions = TransactionStore()
+        for t, value_date in zip(rows, value_dates):
+            posted = datetime.strptime(value_date, "%y%m%d").date() if value_date else None
+            transactions.append(t["amount_cents"], t["kind"], t["description"], posted)
+        credits, debits = transactions.totals()
+
+        extraction = {
+            "account_number": None,
+            "bank_name": None,
+            "statement_start_date": period.start.isoformat() if period and period.start else None,
+            "statement_end_date": period.end.isoformat() if period and period.end else None,
+            "opening_balance_cents": opening,
+            "closing_balance_cents": balance,
+            "transactions": transactions
+        }
+        extraction["validation"] = {
+            "transactions": len(transactions),
+            "total_credits_cents": credits,
+            "total_debits_cents": debits,
+            "balance_checks": checks,
+            "balance_mismatches": mismatches,
+            # Every row must sit between verified balances, and every printed balance must agree
+            "reconciled": bool(transactions) and has_balance_column and opening_known and checks > 0
+                          and mismatches == 0 and last_checked == len(transactions) - 1
+        }
+        return extraction
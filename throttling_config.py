@@ -28,6 +28,15 @@ class ThrottlingConfig:
     RETRY_DELAYS = [2, 5, 10, 20]  # Exponential backoff delays in seconds
     MAX_RETRIES = len(RETRY_DELAYS)
     
+    # Adaptive (AIMD) tuning of CALLS_PER_MINUTE - see adaptive_throttle.py
+    ADAPTIVE_THROTTLING = True          # OPENAI_ADAPTIVE_THROTTLING=false turns it off
+    ADAPTIVE_MIN_CALLS_PER_MINUTE = 10  # Lower bound (OPENAI_MIN_CALLS_PER_MINUTE)
+    ADAPTIVE_MAX_CALLS_PER_MINUTE = 300 # Upper bound (OPENAI_MAX_CALLS_PER_MINUTE)
+    ADAPTIVE_INCREASE_STEP = 2          # calls/minute added after each window of successes
+    ADAPTIVE_SUCCESS_WINDOW = 10        # successful calls per increase
+    ADAPTIVE_DECREASE_FACTOR = 0.5      # rate multiplier on a 429 or latency spike
+    ADAPTIVE_LATENCY_SPIKE_FACTOR = 3.0 # a call this many times slower than average counts as a spike
+    
     # Processing queue settings
     INITIAL_PROCESSING_DELAY_MIN = 1   # Minimum random delay before processing (seconds)
     INITIAL_PROCESSING_DELAY_MAX = 5   # Maximum random delay before processing (seconds)
@@ -37,7 +46,10 @@ class ThrottlingConfig:
     FUNCTION_TIMEOUT_MINUTES = 10        # Total function timeout (set in host.json)
     
     # Error handling
-    RETRYABLE_ERROR_KEYWORDS = [
+    RETRYABLE_STATUS_CODES = [408, 409, 429, 500, 502, 503, 504]  # Retried when the error carries a status code
+    MAX_RETRY_AFTER_SECONDS = 60    # Cap on server-provided Retry-After / x-ratelimit-reset hints
+    RETRY_JITTER_FRACTION = 0.25    # Random extra wait (fraction of the delay) so retries don't line up
+    RETRYABLE_ERROR_KEYWORDS = [    # Fallback for exceptions without a type or status to classify on
         'rate limit', 'quota', 'too many requests', '429',  # Rate limiting
         'timeout', 'connection', 'network', 'socket'        # Network issues
     ]
@@ -50,6 +62,7 @@ Throttling Configuration Summary:
 - OpenAI Rate Limit: {cls.CALLS_PER_MINUTE} calls/minute
 - Min Delay Between Calls: {cls.MIN_DELAY_BETWEEN_CALLS}s
 - Max Retries: {cls.MAX_RETRIES} attempts with backoff: {cls.RETRY_DELAYS}
+- Server Retry-After honored up to {cls.MAX_RETRY_AFTER_SECONDS}s (+{cls.RETRY_JITTER_FRACTION:.0%} jitter)
 - Processing Delay: {cls.INITIAL_PROCESSING_DELAY_MIN}-{cls.INITIAL_PROCESSING_DELAY_MAX}s random
 - Doc Intelligence Timeout: {cls.DOCUMENT_INTELLIGENCE_TIMEOUT}s
 - Function Timeout: {cls.FUNCTION_TIMEOUT_MINUTES} minutes
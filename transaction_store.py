@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Integer-Cent Transaction Store
+
+A compact, column-oriented container for a statement's transactions, used in
+place of lists of dicts with float amounts:
+
+- cents:        array('q') amounts in integer cents (always positive)
+- ordinals:     array('q') posting-date ordinals (date.toordinal(), 0 = unknown)
+- kinds:        array('b') type codes (0 credit, 1 debit, 2 fee)
+- descriptions: array('l') indexes into an interned description table, so the
+                repeated "ACH DEBIT ..." / "SERVICE FEE" texts are stored once
+
+Sums, counts and per-day aggregates run over the columns as a whole - with
+numpy views of the arrays (no copy) when numpy is installed (it comes with
+pandas), and plain Python over the arrays otherwise. Integer cents make the
+reconciliation exact: no float drift against the one-cent tolerance.
+
+Iterating the store yields the consolidated extraction transaction dicts
+(date, value_date, description, amount_cents, kind), so code written for the
+list form keeps working; build_bai2_from_consolidated and the reconciliation
+checks read the columns directly.
+"""
+
+from array import array
+from datetime import date
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from functools import lru_cache
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+KINDS = ("credit", "debit", "fee")
+KIND_CODES = {kind: code for code, kind in enumerate(KINDS)}
+CREDIT = KIND_CODES["credit"]
+
+
+@lru_cache(maxsize=4096)
+def _iso_ordinal(value):
+    try:
+        return date.fromisoformat(value.strip()[:10]).toordinal()
+    except ValueError:
+        return 0
+
+
+def _ordinal(value):
+    """date.toordinal() for a date or YYYY-MM-DD string, 0 when unknown"""
+    if isinstance(value, date):
+        return value.toordinal()
+    return _iso_ordinal(value) if isinstance(value, str) and value else 0
+
+
+def dollars_to_cents(value):
+    """Signed integer cents for a dollar amount (number or "$1,234.56" text), None when unreadable"""
+    try:
+        amount = Decimal(str(value).replace(",", "").replace("$", "").strip())
+    except (InvalidOperation, ValueError):
+        return None
+    return int((amount * 100).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+
+
+class TransactionStore:
+    """Parallel integer columns plus an interned description table"""
+
+    __slots__ = ("cents", "ordinals", "kinds", "description_ids", "descriptions", "_description_index")
+
+    def __init__(self):
+        self.cents = array("q")
+        self.ordinals = array("q")
+        self.kinds = array("b")
+        self.description_ids = array("l")
+        self.descriptions = []
+        self._description_index = {}
+
+    @classmethod
+    def of(cls, transactions):
+        """The store itself, or a store built from consolidated-shape transaction dicts"""
+        if isinstance(transactions, cls):
+            return transactions
+        store = cls()
+        for t in transactions or []:
+            store.append(t["amount_cents"], t["kind"], t.get("description", ""), t.get("date"))
+        return store
+
+    @classmethod
+    def from_signed_amounts(cls, transactions):
+        """
+        A store from transactions with signed dollar "amount" values (the OpenAI parsing
+        shape): positive amounts are credits, negative ones debits. Unreadable rows are skipped.
+        """
+        store = cls()
+        for t in transactions or []:
+            if not isinstance(t, dict):
+                continue
+            cents = dollars_to_cents(t.get("amount", 0))
+            if cents is None:
+                continue
+            store.append(abs(cents), "credit" if cents > 0 else "debit", t.get("description", ""), t.get("date"))
+        return store
+
+    def append(self, amount_cents, kind, description="", posted=None):
+        text = str(description or "")
+        index = self._description_index.get(text)
+        if index is None:
+            index = self._description_index[text] = len(self.descriptions)
+            self.descriptions.append(text)
+        self.cents.append(abs(int(amount_cents)))
+        self.ordinals.append(_ordinal(posted))
+        self.kinds.append(KIND_CODES[kind])
+        self.description_ids.append(index)
+
+    def __len__(self):
+        return len(self.cents)
+
+    def rows(self):
+        """(amount_cents, kind, description, posting date or None) per transaction, in order"""
+        descriptions = self.descriptions
+        for cents, ordinal, code, index in zip(self.cents, self.ordinals, self.kinds, self.description_ids):
+            yield cents, KINDS[code], descriptions[index], date.fromordinal(ordinal) if ordinal else None
+
+    def __iter__(self):
+        for cents, kind, description, posted in self.rows():
+            yield {
+                "date": posted.isoformat() if posted else None,
+                "value_date": posted.strftime("%y%m%d") if posted else None,
+                "description": description,
+                "amount_cents": cents,
+                "kind": kind
+            }
+
+    def to_list(self):
+        """The transactions as consolidated-shape dicts (for JSON)"""
+        return list(self)
+
+    # === AGGREGATES ===
+
+    def _columns(self):
+        return (numpy.frombuffer(self.cents, dtype=numpy.int64),
+                numpy.frombuffer(self.kinds, dtype=numpy.int8),
+                numpy.frombuffer(self.ordinals, dtype=numpy.int64))
+
+    def totals(self):
+        """(credit cents, debit + fee cents)"""
+        if not self.cents:
+            return 0, 0
+        if numpy is not None:
+            cents, kinds, _ = self._columns()
+            credits = int(cents[kinds == CREDIT].sum())
+            return credits, int(cents.sum()) - credits
+        credits = sum(cents for cents, code in zip(self.cents, self.kinds) if code == CREDIT)
+        return credits, sum(self.cents) - credits
+
+    def total(self, kind):
+        """Cents for one kind"""
+        code = KIND_CODES[kind]
+        if numpy is not None and self.cents:
+            cents, kinds, _ = self._columns()
+            return int(cents[kinds == code].sum())
+        return sum(cents for cents, k in zip(self.cents, self.kinds) if k == code)
+
+    def count(self, kind=None):
+        """Number of transactions, or of one kind"""
+        if kind is None:
+            return len(self.cents)
+        return self.kinds.tobytes().count(bytes([KIND_CODES[kind]]))
+
+    def daily_totals(self):
+        """[(posting date, credit cents, debit + fee cents)] per dated day, in date order"""
+        if not self.cents:
+            return []
+        if numpy is not None:
+            cents, kinds, ordinals = self._columns()
+            dated = ordinals > 0
+            days, day_index = numpy.unique(ordinals[dated], return_inverse=True)
+            signed = numpy.where(kinds[dated] == CREDIT, cents[dated], 0)
+            credits = numpy.bincount(day_index, weights=signed, minlength=len(days))
+            totals = numpy.bincount(day_index, weights=cents[dated], minlength=len(days))
+            return [(date.fromordinal(int(day)), int(credit), int(total - credit))
+                    for day, credit, total in zip(days, credits, totals)]
+        days = {}
+        for cents, ordinal, code in zip(self.cents, self.ordinals, self.kinds):
+            if ordinal:
+                credit, debit = days.get(ordinal, (0, 0))
+                days[ordinal] = (credit + cents, debit) if code == CREDIT else (credit, debit + cents)
+        return [(date.fromordinal(day), credit, debit) for day, (credit, debit) in sorted(days.items())]